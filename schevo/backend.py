@@ -6,26 +6,130 @@
 import sys
 from schevo.lib import optimize
 
-backends = {}
-
-try:
-    import pkg_resources
-except IOError, e:
-    # If a custom distutils is included in a py2exe-generated library,
-    # an IOError will occur when we try to find backends.  Silently
-    # pass on this IOError.  py2exe main scripts should manually import
-    # the plugin class and register it, like so::
-    #
-    #     from schevodurus.backend import DurusBackend
-    #     from schevo.backend import backends
-    #     backends['durus'] = DurusBackend
-    pass
-else:
-    backends = dict(
-        # backend-name=backend-class,
-        (p.name, p.load())
-        for p in pkg_resources.iter_entry_points('schevo.backend')
-        )
+
+# Backends that come with Schevo, as name:'module:class' pairs.  These
+# are found without scanning installed packages.
+BUILTIN_BACKENDS = {
+    'schevostore': 'schevo.store.backend:SchevoStoreBackend',
+    }
+
+
+class BackendRegistry(object):
+    """Mapping of backend names to backend classes.
+
+    Backend classes are loaded when first looked up by name.  Built-in
+    backends are loaded without scanning installed packages; other
+    backends are found through their `schevo.backend` entry points.
+    Iterating over the registry loads all installed backends.
+
+    Backends may also be registered directly, for example by py2exe
+    main scripts where entry points are not available::
+
+        from schevodurus.backend import DurusBackend
+        from schevo.backend import backends
+        backends['durus'] = DurusBackend
+    """
+
+    def __init__(self, builtins):
+        self._builtins = builtins
+        self._classes = {}
+        # Entry points of installed backends, as name:entry_point
+        # pairs, once installed packages have been scanned.
+        self._entry_points = None
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __getitem__(self, name):
+        backend_class = self.get(name)
+        if backend_class is None:
+            raise KeyError(name)
+        return backend_class
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __setitem__(self, name, backend_class):
+        self._classes[name] = backend_class
+
+    def get(self, name, default=None):
+        """Return the backend class named `name`, loading it if
+        necessary, or `default` if there is no such backend."""
+        classes = self._classes
+        backend_class = classes.get(name)
+        if backend_class is None:
+            location = self._builtins.get(name)
+            if location is not None:
+                backend_class = classes[name] = _load(location)
+            else:
+                entry_point = self._scan().get(name)
+                if entry_point is not None:
+                    backend_class = classes[name] = entry_point.load()
+        if backend_class is None:
+            return default
+        return backend_class
+
+    def items(self):
+        return list(self.iteritems())
+
+    def iteritems(self):
+        """Iterate over (name, class) pairs, loading backends as they
+        are reached.  Built-in and directly registered backends come
+        first, so installed packages are only scanned if iteration
+        continues past them."""
+        classes = self._classes
+        seen = set()
+        for name in self._builtins.keys() + classes.keys():
+            if name not in seen:
+                seen.add(name)
+                yield name, self[name]
+        for name, entry_point in self._scan().items():
+            if name not in classes:
+                classes[name] = entry_point.load()
+        for name, backend_class in classes.items():
+            if name not in seen:
+                seen.add(name)
+                yield name, backend_class
+
+    def keys(self):
+        """Return the names of all installed backends, loading them."""
+        return [name for name, backend_class in self.iteritems()]
+
+    def _scan(self):
+        """Return a dictionary of the entry points of installed
+        backends, scanning installed packages only the first time."""
+        entry_points = self._entry_points
+        if entry_points is None:
+            entry_points = {}
+            for entry_point in _entry_points():
+                entry_points.setdefault(entry_point.name, entry_point)
+            self._entry_points = entry_points
+        return entry_points
+
+
+def _entry_points():
+    """Return an iterator of `schevo.backend` entry points."""
+    try:
+        import pkg_resources
+    except (ImportError, IOError):
+        # If a custom distutils is included in a py2exe-generated
+        # library, an IOError will occur when we try to find
+        # backends.  Only backends registered directly are available.
+        return iter([])
+    return pkg_resources.iter_entry_points('schevo.backend')
+
+
+def _load(location):
+    """Return the object at `location`, given as 'module:name'."""
+    module_name, name = location.split(':')
+    __import__(module_name)
+    return getattr(sys.modules[module_name], name)
+
+
+backends = BackendRegistry(BUILTIN_BACKENDS)
 
 
 def test_backends_dict():
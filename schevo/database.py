@@ -15,8 +15,6 @@ from schevo.error import (
 from schevo.field import not_fget
 from schevo import icon
 from schevo.label import relabel
-from schevo.store.connection import Connection
-from schevo.store.file_storage import FileStorage
 from schevo.trace import log
 from schevo.url import make_url
 
@@ -36,13 +34,20 @@ format_converter = {
     }
 
 
-def convert_format(url, backend_args={}, format=None):
+format_repacker = {
+    2: database2.repack_btrees,
+    }
+
+
+def convert_format(url, backend_args={}, format=None, repack=False):
     """Convert database to a new internal structure format.
 
     - `url`: URL of the database to convert.
     - `backend_args`: (optional) Additional arguments to pass to the backend.
     - `format`: (optional) Format to convert internal structure to.
       If not given, the most recent format available will be used.
+    - `repack`: (optional) If `True`, also rewrite internal BTrees to use
+      the node degrees given in `backend_args`, then pack the database.
     """
     backend = new_backend(url, backend_args)
     # Check the format of the database.
@@ -59,11 +64,16 @@ def convert_format(url, backend_args={}, format=None):
         for new_format in xrange(original_format + 1, format + 1):
             converter = format_converter[new_format]
             converter(backend)
+        if repack:
+            repacker = format_repacker[max(format, original_format)]
+            repacker(backend)
     except:
         backend.rollback()
         raise
     else:
         backend.commit()
+        if repack:
+            backend.pack()
     backend.close()
 
 
@@ -6,9 +6,13 @@
 import sys
 from schevo.lib import optimize
 
+from itertools import izip
+from math import log as _log
 import operator
 import os
 import random
+from time import time
+from weakref import WeakKeyDictionary
 
 try:
     import louie
@@ -21,23 +25,26 @@ except ImportError:
 
 
 from schevo import base
-from schevo import change
 from schevo.change import CREATE, UPDATE, DELETE
-from schevo.constant import UNASSIGNED
+from schevo.constant import ANY, UNASSIGNED
 from schevo.counter import schema_counter
 from schevo import error
 from schevo.entity import Entity
 from schevo.expression import Expression
 from schevo.extent import Extent
 from schevo.field import Entity as EntityField
-from schevo.field import not_fget
+from schevo.field import Field
+from schevo.inversion import InversionLog, Inversions, MEMORY_LIMIT
 from schevo.lib import module
 from schevo.mt.dummy import dummy_lock
 from schevo.namespace import NamespaceExtension
 from schevo.placeholder import Placeholder
+from schevo.query import ResultsIterator
 import schevo.schema
 from schevo.signal import TransactionExecuted
-from schevo.trace import log
+from schevo.stats import DUMP_INTERVAL, Stats
+from schevo.text import parse_query, term_counts, trigrams
+from schevo.trace import enabled, log
 from schevo.transaction import (
     CallableWrapper, Combination, Initialize, Populate, Transaction)
 
@@ -53,10 +60,22 @@ class Database(base.Database):
     # TransactionExecuted signals.
     dispatch = False
 
+    # Number of bytes of inversion records kept in memory by a
+    # transaction before they are spilled to a temporary file.
+    inversion_memory_limit = MEMORY_LIMIT
+
     # See dummy_lock documentation.
     read_lock = dummy_lock
     write_lock = dummy_lock
 
+    # Assign a `schevo.querycache.QueryCache` instance to cache the
+    # results of queries.
+    query_cache = None
+
+    # Maximum number of entity labels to cache before clearing the
+    # cache, or 0 to not cache them.
+    label_cache_size = 10000
+
     def __init__(self, backend):
         """Create a database.
 
@@ -66,6 +85,12 @@ class Database(base.Database):
         self.backend = backend
         # Aliases to classes in the backend.
         self._BTree = backend.BTree
+        # BTree constructors for each structure role.  Backends that
+        # allow tuning of BTree node degrees provide `btree_for`.
+        self._EntitiesBTree = _btree_for(backend, 'entities')
+        self._IndexBTree = _btree_for(backend, 'index_branches')
+        self._IndexLeafBTree = _btree_for(backend, 'index_leaves')
+        self._LinksBTree = _btree_for(backend, 'links')
         self._PDict = backend.PDict
         self._PList = backend.PList
         self._conflict_exceptions = getattr(backend, 'conflict_exceptions', ())
@@ -82,6 +107,21 @@ class Database(base.Database):
         self._extents = {}
         # Index to entity classes assigned by _sync.
         self._entity_classes = {}
+        # Plans for finding entities by field values, by extent name and
+        # field names.  Cleared by _sync.
+        self._equality_plans = {}
+        # Number of changes made to each extent by this instance, by
+        # extent name, used to invalidate cached query results.
+        self._extent_change_counts = {}
+        # Labels of entities by (extent_id, oid, rev), as (label, chain)
+        # tuples where chain is the set of (extent_name, oid) of the
+        # entities the label depends on.
+        self._label_cache = {}
+        # Keys of cached labels by the (extent_name, oid) of each entity
+        # they depend on.
+        self._label_dependents = {}
+        # Sets of the entities the labels being built depend on.
+        self._label_chains = []
         # Vars used in transaction processing.
         self._bulk_mode = False
         self._executing = []
@@ -92,6 +132,9 @@ class Database(base.Database):
         self._update_extent_maps_by_name()
         # Plugin support.
         self._plugins = []
+        # Statistics of operations, or None if not collected.  See
+        # enable_stats.
+        self._stats = None
 
     def __repr__(self):
         return '<Database %r :: V %r>' % (self.label, self.version)
@@ -109,10 +152,38 @@ class Database(base.Database):
             p.pop().close()
         assert log(1, 'Closing storage.')
         self.backend.close()
+        stats = self._stats
+        if stats is not None and stats.dump_filename is not None:
+            try:
+                stats.dump()
+            except (IOError, OSError):
+                # Statistics are a diagnostic aid only.
+                assert log(1, 'Could not dump statistics.')
         remembered = self._remembered
         while remembered:
             module.forget(remembered.pop())
 
+    def disable_stats(self):
+        """Stop collecting statistics of operations."""
+        self._stats = None
+        set_stats = getattr(self.backend, 'set_stats', None)
+        if set_stats is not None:
+            set_stats(None)
+
+    def enable_stats(self, dump_filename=None, dump_interval=DUMP_INTERVAL):
+        """Start collecting statistics of operations, returned by
+        `stats`.
+
+        - `dump_filename`: (optional) Name of a file to append the
+          statistics to, as a line of JSON, after transactions at most
+          every `dump_interval` seconds, and when the database is
+          closed.
+        """
+        stats = self._stats = Stats(dump_filename, dump_interval)
+        set_stats = getattr(self.backend, 'set_stats', None)
+        if set_stats is not None:
+            set_stats(stats)
+
     def execute(self, *transactions, **kw):
         """Execute transaction(s)."""
         if self._executing:
@@ -156,11 +227,21 @@ class Database(base.Database):
             strict = True
         # Bulk mode minimizes transaction metadata.
         bulk_mode = self._bulk_mode
+        if not bulk_mode:
+            # Inner transactions share the inversion log of the
+            # outermost transaction.
+            outer_inversions = executing and executing[-1]._inversions
+            if isinstance(outer_inversions, Inversions):
+                inversion_log = outer_inversions.log
+            else:
+                inversion_log = InversionLog(
+                    self, self.inversion_memory_limit)
+            tx._inversions = inversion_log.view()
         executing.append(tx)
         assert log(1, 'Begin executing [%i]' % len(executing), tx)
         try:
             retval = tx._execute(self)
-            assert log(2, 'Result was', repr(retval))
+            assert not enabled(2) or log(2, 'Result was', repr(retval))
             # Enforce any indices relaxed by the transaction.
             for extent_name, index_spec in frozenset(tx._relaxed):
                 assert log(2, 'Enforcing index', extent_name, index_spec)
@@ -180,10 +261,11 @@ class Database(base.Database):
             elif len(executing) == 1:
                 assert log(2, 'Outer transaction; storage rollback.')
                 self._rollback()
+                tx._inversions.log.close()
             else:
                 assert log(2, 'Inner transaction; inverting.')
                 inversions = tx._inversions
-                while len(inversions):
+                while inversions:
                     method, args, kw = inversions.pop()
                     # Make sure the inverse operation doesn't append
                     # an inversion itself.
@@ -214,11 +296,11 @@ class Database(base.Database):
             self._commit()
         elif len(executing) > 1:
             assert log(2, 'Inner transaction; record inversions and changes.')
-            # Append the inversions from this transaction to the next
-            # outer transaction.
+            # The inversions from this transaction are already in the
+            # log shared with the next outer transaction.
             e2 = executing[-2]
             e1 = executing[-1]
-            e2._inversions.extend(e1._inversions)
+            e1._inversions.freeze()
             # Also append the changes made from this transaction.
             e2._changes_requiring_notification.extend(
                 e1._changes_requiring_notification)
@@ -230,11 +312,22 @@ class Database(base.Database):
             # Done executing the outermost transaction.  Use
             # Durus-based commit.
             self._commit()
+            # Inversions kept in memory allow the transaction and
+            # those executed within it to be undone later, but do not
+            # hold on to a temporary file.
+            if tx._inversions.log.spilled:
+                tx._inversions.log.close()
             # Send a signal if told to do so.
             if self.dispatch:
                 assert log(2, 'Dispatching TransactionExecuted signal.')
                 louie.send(TransactionExecuted, sender=self, transaction=tx)
         executing.pop()
+        if not executing and self._stats is not None:
+            try:
+                self._stats.tick()
+            except (IOError, OSError):
+                # The transaction is already committed.
+                assert log(1, 'Could not dump statistics.')
         return retval
 
     def extent(self, extent_name):
@@ -250,6 +343,36 @@ class Database(base.Database):
         extent = self.extent
         return [extent(name) for name in self.extent_names()]
 
+    def join(self, start, *fields):
+        """Return an iterator of tuples of the entities joined by
+        `join_oids`, creating the entities of each tuple as it is
+        reached."""
+        extent_names, rows = self._join(start, fields)
+        entity_classes = self._entity_classes
+        classes = [entity_classes[name] for name in extent_names]
+        def generator():
+            for row in rows:
+                yield tuple(EntityClass(oid)
+                            for EntityClass, oid in izip(classes, row))
+        return ResultsIterator(generator())
+
+    def join_oids(self, start, *fields):
+        """Return a list of tuples of the OIDs of entities joined by
+        following the entity `fields` in turn from `start`.
+
+        `start` is an extent, an entity, or a criterion such as
+        ``db.Customer.f.region == region``.  Each of `fields` is an
+        entity field class.  A field of the extent reached so far is
+        followed to the entities it refers to; a field of another
+        extent is followed back from the entities reached so far to the
+        entities of that extent referring to them.
+
+        Each tuple has the OID of a starting entity, followed by the
+        OID of the entity reached by each field.
+        """
+        extent_names, rows = self._join(start, fields)
+        return list(rows)
+
     def pack(self):
         """Pack the database."""
         if os.environ.get('SCHEVO_NOPACK', '').strip() != '1':
@@ -260,6 +383,40 @@ class Database(base.Database):
         tx = Populate(sample_name)
         self.execute(tx)
 
+    def reindex(self, extent_name=None):
+        """Rebuild the text and full-text indices and materialized
+        aggregates of the named extent, or of all extents, from the
+        stored field values of entities."""
+        if self._executing:
+            raise error.DatabaseExecutingTransaction(
+                'Cannot reindex while executing a transaction.')
+        if extent_name is None:
+            extent_names = self.extent_names()
+        else:
+            extent_names = [extent_name]
+        for extent_name in extent_names:
+            extent_map = self._extent_map(extent_name)
+            text_indices = extent_map.get('text_indices')
+            if text_indices:
+                for field_id in list(text_indices.keys()):
+                    text_indices[field_id] = self._build_text_index(
+                        extent_map, field_id)
+            if extent_map.get('fulltext_index') is not None:
+                self._rebuild_fulltext_index(extent_map)
+            aggregates = extent_map.get('aggregates')
+            if aggregates:
+                for aggregate in aggregates.itervalues():
+                    self._rebuild_aggregate(extent_map, aggregate)
+        self._commit()
+
+    def stats(self):
+        """Return a dictionary of the statistics collected since
+        `enable_stats` was called, as described in `schevo.stats`, or
+        None if statistics are not being collected."""
+        if self._stats is None:
+            return None
+        return self._stats.as_dict()
+
     @property
     def format(self):
         return self._root['SCHEVO']['format']
@@ -290,12 +447,60 @@ class Database(base.Database):
     label = property(_get_label, _set_label)
     _label = property(_get_label, _set_label)
 
-    def _append_change(self, typ, extent_name, oid):
+    def _aggregate_value(self, extent_name, aggregate_name, *group):
+        """Return the value of the named materialized aggregate of the
+        named extent.
+
+        If the aggregate is grouped and a `group` value is given, return
+        the aggregate of the entities whose grouped field has that
+        value.  If no value is given, return a dictionary of the
+        aggregate of each group that has any entities.
+        """
+        extent_map = self._extent_map(extent_name)
+        aggregates = extent_map.get('aggregates') or {}
+        aggregate = aggregates.get(aggregate_name)
+        if aggregate is None:
+            raise error.AggregateDoesNotExist(extent_name, aggregate_name)
+        kind, field_id, group_field_id = aggregate['spec']
+        groups = aggregate['groups']
+        if group_field_id is None:
+            if group:
+                raise TypeError(
+                    'Aggregate %r is not grouped.' % aggregate_name)
+            return _aggregate_result(kind, groups.get(None))
+        field_name = extent_map['field_id_name'][group_field_id]
+        FieldClass = self._entity_classes[extent_name]._field_spec[field_name]
+        if group:
+            [value] = group
+            field = _writable_field_class(FieldClass)(None)
+            field.set(value)
+            return _aggregate_result(kind, groups.get(field._dump()))
+        values = {}
+        for key, state in groups.iteritems():
+            field = FieldClass(None)
+            field._value = key
+            field._restore(self)
+            values[field.get_immutable()] = _aggregate_result(kind, state)
+        return values
+
+    def _append_change(self, typ, extent_name, oid, field_names=None):
+        """Keep track of a change made by the executing transaction.
+
+        `field_names` is the collection of names of fields changed by
+        an update, or None if all fields should be considered changed.
+        """
+        counts = self._extent_change_counts
+        counts[extent_name] = counts.get(extent_name, 0) + 1
+        label_keys = self._label_dependents.pop((extent_name, oid), None)
+        if label_keys:
+            label_cache = self._label_cache
+            for label_key in label_keys:
+                label_cache.pop(label_key, None)
         executing = self._executing
         if executing:
             info = (typ, extent_name, oid)
             tx = executing[-1]
-            tx._changes_requiring_validation.append(info)
+            tx._changes_requiring_validation.append(info + (field_names, ))
             if not self._bulk_mode:
                 tx._changes_requiring_notification.append(info)
 
@@ -341,6 +546,101 @@ class Database(base.Database):
         _walk_index(branch, ascending, oids)
         return oids
 
+    def _sorted_entity_oids(self, extent_name, field_names=None,
+                            _ranks=None):
+        """Return a list of OIDs of the entities in the named extent,
+        sorted by the fields named in `field_names`, or by the default
+        key if not given, or by OID if there is no default key.
+
+        As with `_by_entity_oids`, a field name may be prefixed with
+        '-' to sort in descending order.  Entity field values are
+        sorted by the default order of the entities they refer to.
+        """
+        extent_map = self._extent_map(extent_name)
+        EntityClass = self._entity_classes[extent_name]
+        if field_names is None:
+            field_names = EntityClass._default_key
+            if field_names is None:
+                return list(extent_map['entities'].keys())
+        names = []
+        ascending = []
+        for field_name in field_names:
+            if field_name.startswith('-'):
+                names.append(field_name[1:])
+                ascending.append(False)
+            else:
+                names.append(field_name)
+                ascending.append(True)
+        field_spec = EntityClass._field_spec
+        field_name_id = extent_map['field_name_id']
+        field_ids = []
+        for name in names:
+            FieldClass = field_spec.get(name)
+            if FieldClass is None:
+                raise error.FieldDoesNotExist(extent_name, name)
+            if FieldClass.fget is not None:
+                # Calculated fields have no stored values.
+                field_ids.append(None)
+            else:
+                field_ids.append(field_name_id[name])
+        entity_field_ids = extent_map['entity_field_ids']
+        if None not in field_ids and not [
+            field_id for field_id in field_ids
+            if field_id in entity_field_ids]:
+            # Stored values sort the same way as field values, so walk
+            # an index if there is one.
+            try:
+                return self._by_entity_oids(extent_name, *field_names)
+            except error.IndexDoesNotExist:
+                pass
+        # Otherwise get the sort key of each entity once.
+        if _ranks is None:
+            _ranks = {}
+        rows = []
+        for oid, entity_map in extent_map['entities'].iteritems():
+            fields_by_id = entity_map['fields']
+            key = []
+            for name, field_id in izip(names, field_ids):
+                if field_id is None:
+                    value = getattr(EntityClass(oid), name)
+                else:
+                    value = fields_by_id.get(field_id, UNASSIGNED)
+                key.append(self._sort_value(value, _ranks))
+            rows.append((key, oid))
+        # Sorts are stable, so sort by the last field first.
+        for i in reversed(xrange(len(names))):
+            rows.sort(key=lambda row: row[0][i], reverse=not ascending[i])
+        return [oid for key, oid in rows]
+
+    def _sort_value(self, value, ranks):
+        """Return `value` with the entities and placeholders in it
+        replaced by their positions in the default order of their
+        extents, kept in `ranks` by extent name."""
+        if isinstance(value, Placeholder):
+            extent_name = self._extent_maps_by_id[value.extent_id]['name']
+            oid = value.oid
+        elif isinstance(value, Entity):
+            extent_name = value._extent.name
+            oid = value._oid
+        elif isinstance(value, tuple):
+            return tuple(self._sort_value(item, ranks) for item in value)
+        else:
+            return value
+        rank_by_oid = ranks.get(extent_name)
+        if rank_by_oid is None:
+            # While the extent is being sorted, entities referring to
+            # others in it sort by OID.
+            ranks[extent_name] = {}
+            oids = self._sorted_entity_oids(extent_name, None, ranks)
+            rank_by_oid = ranks[extent_name] = dict(
+                (oid, rank) for rank, oid in enumerate(oids))
+        return rank_by_oid.get(oid, oid)
+
+    def _clear_label_cache(self):
+        """Remove all cached entity labels."""
+        self._label_cache.clear()
+        self._label_dependents.clear()
+
     def _create_entity(self, extent_name, fields, related_entities,
                        oid=None, rev=None):
         """Create a new entity in an extent; return the oid.
@@ -362,6 +662,9 @@ class Database(base.Database):
         - `rev`: (optional) Specific revision to create the entity as; see
           `oid`.
         """
+        stats = self._stats
+        if stats is not None:
+            start = time()
         extent_map = self._extent_map(extent_name)
         entities = extent_map['entities']
         old_next_oid = extent_map['next_oid']
@@ -372,7 +675,9 @@ class Database(base.Database):
         ia_append = indices_added.append
         links_created = []
         lc_append = links_created.append
-        BTree = self._BTree
+        IndexBTree = self._IndexBTree
+        IndexLeafBTree = self._IndexLeafBTree
+        LinksBTree = self._LinksBTree
         PDict = self._PDict
         try:
             if oid is None:
@@ -416,7 +721,7 @@ class Database(base.Database):
                 else:
                     relaxed = None
                 _index_add(extent_map, index_spec, relaxed, oid, field_values,
-                           BTree)
+                           IndexBTree, IndexLeafBTree)
                 ia_append((extent_map, index_spec, oid, field_values))
             # Update links from this entity to another entity.
             referrer_extent_id = extent_name_id[extent_name]
@@ -435,7 +740,7 @@ class Database(base.Database):
                 links = other_entity_map['links']
                 link_key = (referrer_extent_id, referrer_field_id)
                 if link_key not in links:  # XXX Should already be there.
-                    links[link_key] = BTree()
+                    links[link_key] = LinksBTree()
                 links[link_key][oid] = None
                 other_entity_map['link_count'] += 1
                 lc_append((other_entity_map, links, link_key, oid))
@@ -448,6 +753,24 @@ class Database(base.Database):
             entity_map['links'] = PDict()
             entity_map['related_entities'] = related_entities_by_id
             entity_map['rev'] = rev
+            # Update text indices.
+            text_indices = extent_map.get('text_indices')
+            if text_indices:
+                for field_id, text_index in text_indices.iteritems():
+                    _text_index_add(text_index, oid, fields_by_id[field_id],
+                                    IndexLeafBTree)
+            # Update full-text index.
+            fulltext_index = extent_map.get('fulltext_index')
+            if fulltext_index is not None:
+                _fulltext_index_add(
+                    fulltext_index, oid,
+                    _fulltext_counts(fulltext_index, fields_by_id),
+                    IndexLeafBTree)
+            # Update materialized aggregates.
+            aggregates = extent_map.get('aggregates')
+            if aggregates:
+                for aggregate in aggregates.itervalues():
+                    _aggregate_apply(aggregate, fields_by_id, 1)
             # Update the extent.
             extent_map['len'] += 1
             # Allow inversion of this operation.
@@ -455,6 +778,10 @@ class Database(base.Database):
             # Keep track of changes.
             append_change = self._append_change
             append_change(CREATE, extent_name, oid)
+            if stats is not None:
+                stats.count(extent_name, 'index_add', len(indices_added))
+                stats.count(extent_name, 'link_add', len(links_created))
+                stats.add(extent_name, 'create', time() - start)
             return oid
         except:
             # Revert changes made during create attempt.
@@ -466,19 +793,163 @@ class Database(base.Database):
             extent_map['next_oid'] = old_next_oid
             raise
 
+    def _create_entities(self, extent_name, rows):
+        """Create new entities in an extent in one batch; return a list
+        of their OIDs.
+
+        - `extent_name`: Name of the extent to create new entities in.
+
+        - `rows`: Sequence of ``(fields, related_entities)`` pairs, one
+          for each entity, as given to `_create_entity`.
+
+        The entities are checked and stored first.  Index entries are
+        then added one index at a time, and links are added once for
+        each entity referred to.  A single inversion deletes all of the
+        entities.
+        """
+        stats = self._stats
+        if stats is not None:
+            start = time()
+        extent_map = self._extent_map(extent_name)
+        entities = extent_map['entities']
+        field_name_id = extent_map['field_name_id']
+        field_id_name = extent_map['field_id_name']
+        all_field_ids = field_name_id.values()
+        extent_maps_by_id = self._extent_maps_by_id
+        referrer_extent_id = self._extent_name_id[extent_name]
+        IndexBTree = self._IndexBTree
+        IndexLeafBTree = self._IndexLeafBTree
+        LinksBTree = self._LinksBTree
+        PDict = self._PDict
+        # Prepare the entities, grouping their links by the entity
+        # they refer to.
+        oid = extent_map['next_oid']
+        created = []
+        new_links = {}
+        for fields, related_entities in rows:
+            fields_by_id = PDict()
+            for name, value in fields.iteritems():
+                fields_by_id[field_name_id[name]] = value
+            setdefault = fields_by_id.setdefault
+            for field_id in all_field_ids:
+                setdefault(field_id, UNASSIGNED)
+            related_entities_by_id = PDict()
+            for name, related_entity_set in related_entities.iteritems():
+                field_id = field_name_id[name]
+                related_entities_by_id[field_id] = related_entity_set
+                link_key = (referrer_extent_id, field_id)
+                for placeholder in related_entity_set:
+                    other = (placeholder.extent_id, placeholder.oid)
+                    new_links.setdefault(other, []).append((link_key, oid))
+            created.append((oid, fields_by_id, related_entities_by_id))
+            oid += 1
+        # Make sure the entities referred to exist.
+        other_entity_maps = {}
+        for other_extent_id, other_oid in new_links:
+            other_extent_map = extent_maps_by_id[other_extent_id]
+            try:
+                other_entity_maps[(other_extent_id, other_oid)] = (
+                    other_extent_map['entities'][other_oid])
+            except KeyError:
+                link_key, oid = new_links[(other_extent_id, other_oid)][0]
+                raise error.EntityDoesNotExist(
+                    other_extent_map['name'],
+                    field_name=field_id_name[link_key[1]])
+        # Update index mappings, one index at a time.
+        indices_added = []
+        ia_append = indices_added.append
+        relaxed_specs = self._relaxed[extent_name]
+        try:
+            for index_spec in extent_map['indices'].iterkeys():
+                if index_spec in relaxed_specs:
+                    txns, relaxed = relaxed_specs[index_spec]
+                else:
+                    relaxed = None
+                for oid, fields_by_id, related_entities_by_id in created:
+                    field_values = tuple(fields_by_id[field_id]
+                                         for field_id in index_spec)
+                    _index_add(extent_map, index_spec, relaxed, oid,
+                               field_values, IndexBTree, IndexLeafBTree)
+                    ia_append((extent_map, index_spec, oid, field_values))
+        except:
+            # Revert changes made during create attempt.
+            for _e, _i, _o, _f in indices_added:
+                _index_remove(_e, _i, _o, _f)
+            raise
+        # Create the actual entities.
+        text_indices = extent_map.get('text_indices')
+        fulltext_index = extent_map.get('fulltext_index')
+        aggregates = extent_map.get('aggregates')
+        append_change = self._append_change
+        oids = []
+        for oid, fields_by_id, related_entities_by_id in created:
+            entity_map = entities[oid] = PDict()
+            entity_map['fields'] = fields_by_id
+            entity_map['link_count'] = 0
+            entity_map['links'] = PDict()
+            entity_map['related_entities'] = related_entities_by_id
+            entity_map['rev'] = 0
+            if text_indices:
+                for field_id, text_index in text_indices.iteritems():
+                    _text_index_add(text_index, oid, fields_by_id[field_id],
+                                    IndexLeafBTree)
+            if fulltext_index is not None:
+                _fulltext_index_add(
+                    fulltext_index, oid,
+                    _fulltext_counts(fulltext_index, fields_by_id),
+                    IndexLeafBTree)
+            if aggregates:
+                for aggregate in aggregates.itervalues():
+                    _aggregate_apply(aggregate, fields_by_id, 1)
+            oids.append(oid)
+        extent_map['next_oid'] += len(oids)
+        extent_map['len'] += len(oids)
+        # Update links from these entities to other entities, once for
+        # each entity referred to.
+        links_created = 0
+        for other, referrers in new_links.iteritems():
+            other_entity_map = other_entity_maps[other]
+            links = other_entity_map['links']
+            for link_key, oid in referrers:
+                if link_key not in links:
+                    links[link_key] = LinksBTree()
+                links[link_key][oid] = None
+            other_entity_map['link_count'] += len(referrers)
+            links_created += len(referrers)
+        # Allow inversion of this operation.
+        self._append_inversion(
+            self._delete_entities, [(extent_name, oid) for oid in oids])
+        # Keep track of changes.
+        for oid in oids:
+            append_change(CREATE, extent_name, oid)
+        if stats is not None:
+            stats.count(extent_name, 'index_add', len(indices_added))
+            stats.count(extent_name, 'link_add', links_created)
+            stats.add(extent_name, 'create_batch', time() - start)
+        return oids
+
     def _delete_entity(self, extent_name, oid):
-        entity_map, extent_map = self._entity_extent_map(extent_name, oid)
-        all_field_ids = set(extent_map['field_id_name'].iterkeys())
-        extent_id = extent_map['id']
+        """Delete an entity in an extent having the given OID."""
+        self._delete_entities([(extent_name, oid)])
+
+    def _delete_entities(self, entities):
+        """Delete entities given as a sequence of (extent_name, oid)
+        pairs, in order, and return a dictionary of extent_name:count
+        items.
+
+        The entities may refer to each other; any other reference to
+        one of them raises `DeleteRestricted` unless the referring
+        entity is also being deleted by the executing transaction.
+        Extent-level structures are looked up once per extent, and a
+        single inversion restores all of the entities.
+        """
         extent_name_id = self._extent_name_id
         extent_maps_by_id = self._extent_maps_by_id
-        field_name_id = extent_map['field_name_id']
-        link_count = entity_map['link_count']
-        links = entity_map['links']
-        # Disallow deletion if other entities refer to this one,
-        # unless all references are merely from ourself or an entity
-        # that will be deleted.
-        deletes = set()
+        # Disallow deletion if other entities refer to one being
+        # deleted, unless all references are merely from the entities
+        # being deleted or an entity that will be deleted.
+        deletes = set((extent_name_id[extent_name], oid)
+                      for extent_name, oid in entities)
         executing = self._executing
         if executing:
             tx = executing[-1]
@@ -486,69 +957,130 @@ class Database(base.Database):
                             for del_entity_cls, del_oid in tx._deletes])
             deletes.update([(extent_name_id[del_entity_cls.__name__], del_oid)
                             for del_entity_cls, del_oid in tx._known_deletes])
-        for (other_extent_id, other_field_id), others in links.iteritems():
-            for other_oid in others:
-                if (other_extent_id, other_oid) in deletes:
-                    continue
-                # Give up as soon as we find one outside reference.
-                if (other_extent_id, other_oid) != (extent_id, oid):
-                    entity = self._entity(extent_name, oid)
-                    referring_entity = self._entity(other_extent_id, other_oid)
-                    other_field_name = extent_maps_by_id[other_extent_id][
-                        'field_id_name'][other_field_id]
-                    raise error.DeleteRestricted(
-                        entity=entity,
-                        referring_entity=referring_entity,
-                        referring_field_name=other_field_name
+        counts = {}
+        extent_info = {}
+        records = []
+        stats = self._stats
+        try:
+            for extent_name, oid in entities:
+                if stats is not None:
+                    start = time()
+                    links_removed = 0
+                if extent_name not in extent_info:
+                    extent_map = self._extent_map(extent_name)
+                    extent_info[extent_name] = (
+                        extent_map,
+                        set(extent_map['field_id_name'].iterkeys()),
+                        list(extent_map['indices'].iterkeys()),
                         )
-        # Get old values for use in a potential inversion.
-        old_fields = self._entity_fields(extent_name, oid)
-        old_related_entities = self._entity_related_entities(extent_name, oid)
-        old_rev = entity_map['rev']
-        # Remove index mappings.
-        indices = extent_map['indices']
-        fields_by_id = entity_map['fields']
-        for index_spec in indices.iterkeys():
-            field_values = tuple(fields_by_id.get(f_id, UNASSIGNED)
-                                 for f_id in index_spec)
-            _index_remove(extent_map, index_spec, oid, field_values)
-        # Delete links from this entity to other entities.
-        related_entities = entity_map['related_entities']
-        referrer_extent_id = extent_name_id[extent_name]
-        for referrer_field_id, related_set in related_entities.iteritems():
-            # If a field once existed, but no longer does, there will
-            # still be a related entity set for it in related_entities.
-            # Only process the fields that still exist.
-            if referrer_field_id in all_field_ids:
-                for other_value in related_set:
-                    # Remove the link to the other entity.
-                    other_extent_id = other_value.extent_id
-                    other_oid = other_value.oid
-                    link_key = (referrer_extent_id, referrer_field_id)
-                    other_extent_map = extent_maps_by_id[other_extent_id]
-                    if other_oid in other_extent_map['entities']:
-                        other_entity_map = other_extent_map[
-                            'entities'][other_oid]
-                        links = other_entity_map['links']
-                        other_links = links[link_key]
-                        # The following check is due to scenarios like this:
-                        # Entity A and entity B are both being deleted in a
-                        # cascade delete scenario.  Entity B refers to entity A.
-                        # Entity A has already been deleted.  Entity B is now
-                        # being deleted. We must now ignore any information
-                        # about entity A that is attached to entity B.
-                        if oid in other_links:
-                            del other_links[oid]
-                        other_entity_map['link_count'] -= 1
-        del extent_map['entities'][oid]
-        extent_map['len'] -= 1
-        # Allow inversion of this operation.
-        self._append_inversion(
-            self._create_entity, extent_name, old_fields,
-            old_related_entities, oid, old_rev)
-        # Keep track of changes.
-        append_change = self._append_change
-        append_change(DELETE, extent_name, oid)
+                extent_map, all_field_ids, index_specs = extent_info[
+                    extent_name]
+                extent_id = extent_map['id']
+                entities_map = extent_map['entities']
+                try:
+                    entity_map = entities_map[oid]
+                except KeyError:
+                    raise error.EntityDoesNotExist(extent_name, oid=oid)
+                links = entity_map['links']
+                for (other_extent_id, other_field_id), others in (
+                    links.iteritems()):
+                    for other_oid in others:
+                        if (other_extent_id, other_oid) in deletes:
+                            continue
+                        # Give up as soon as we find one outside reference.
+                        entity = self._entity(extent_name, oid)
+                        other_extent_map = extent_maps_by_id[other_extent_id]
+                        referring_entity = self._entity(
+                            other_extent_map['name'], other_oid)
+                        other_field_name = other_extent_map['field_id_name'][
+                            other_field_id]
+                        raise error.DeleteRestricted(
+                            entity=entity,
+                            referring_entity=referring_entity,
+                            referring_field_name=other_field_name
+                            )
+                # Get old values for use in a potential inversion.
+                records.append((
+                    extent_name,
+                    oid,
+                    self._entity_fields(extent_name, oid),
+                    self._entity_related_entities(extent_name, oid),
+                    entity_map['rev'],
+                    ))
+                # Remove index mappings.
+                fields_by_id = entity_map['fields']
+                for index_spec in index_specs:
+                    field_values = tuple(fields_by_id.get(f_id, UNASSIGNED)
+                                         for f_id in index_spec)
+                    _index_remove(extent_map, index_spec, oid, field_values)
+                # Remove text index mappings.
+                text_indices = extent_map.get('text_indices')
+                if text_indices:
+                    for field_id, text_index in text_indices.iteritems():
+                        _text_index_remove(
+                            text_index, oid,
+                            fields_by_id.get(field_id, UNASSIGNED))
+                # Remove full-text index mappings.
+                fulltext_index = extent_map.get('fulltext_index')
+                if fulltext_index is not None:
+                    _fulltext_index_remove(
+                        fulltext_index, oid,
+                        _fulltext_counts(fulltext_index, fields_by_id))
+                # Update materialized aggregates.
+                aggregates = extent_map.get('aggregates')
+                if aggregates:
+                    for aggregate in aggregates.itervalues():
+                        _aggregate_apply(aggregate, fields_by_id, -1)
+                # Delete links from this entity to other entities.
+                related_entities = entity_map['related_entities']
+                referrer_extent_id = extent_id
+                for referrer_field_id, related_set in (
+                    related_entities.iteritems()):
+                    # If a field once existed, but no longer does, there
+                    # will still be a related entity set for it in
+                    # related_entities.  Only process the fields that
+                    # still exist.
+                    if referrer_field_id in all_field_ids:
+                        for other_value in related_set:
+                            # Remove the link to the other entity.
+                            other_extent_id = other_value.extent_id
+                            other_oid = other_value.oid
+                            link_key = (referrer_extent_id, referrer_field_id)
+                            other_extent_map = extent_maps_by_id[
+                                other_extent_id]
+                            if other_oid in other_extent_map['entities']:
+                                other_entity_map = other_extent_map[
+                                    'entities'][other_oid]
+                                links = other_entity_map['links']
+                                other_links = links[link_key]
+                                # The following check is due to scenarios
+                                # like this: Entity A and entity B are both
+                                # being deleted in a cascade delete
+                                # scenario.  Entity B refers to entity A.
+                                # Entity A has already been deleted.  Entity
+                                # B is now being deleted. We must now ignore
+                                # any information about entity A that is
+                                # attached to entity B.
+                                if oid in other_links:
+                                    del other_links[oid]
+                                other_entity_map['link_count'] -= 1
+                                if stats is not None:
+                                    links_removed += 1
+                del entities_map[oid]
+                extent_map['len'] -= 1
+                counts[extent_name] = counts.get(extent_name, 0) + 1
+                # Keep track of changes.
+                append_change = self._append_change
+                append_change(DELETE, extent_name, oid)
+                if stats is not None:
+                    stats.count(extent_name, 'index_remove', len(index_specs))
+                    stats.count(extent_name, 'link_remove', links_removed)
+                    stats.add(extent_name, 'delete', time() - start)
+        finally:
+            # Allow inversion of the deletions performed.
+            if records:
+                self._append_inversion(self._undelete_entities, records)
+        return counts
 
     def _enforce_index(self, extent_name, *index_spec):
         """Call _enforce_index after converting index_spec from field
@@ -585,10 +1117,11 @@ class Database(base.Database):
             txns.remove(current_txn)
         # If no more transactions have relaxed this index, enforce it.
         if not txns:
-            BTree = self._BTree
+            IndexBTree = self._IndexBTree
+            IndexLeafBTree = self._IndexLeafBTree
             for _extent_map, _index_spec, _oid, _field_values in added:
                 _index_validate(_extent_map, _index_spec, _oid, _field_values,
-                                BTree)
+                                IndexBTree, IndexLeafBTree)
 
     def _entity(self, extent_name, oid):
         """Return the entity instance."""
@@ -611,6 +1144,16 @@ class Database(base.Database):
         rev = self._entity_rev(extent_name, oid)
         return value, rev
 
+    def _entity_field_values(self, extent_name, field_name, oids):
+        """Return a list of the stored values of the named field, or
+        UNASSIGNED if not stored, for entities in named extent with
+        each of the given OIDs."""
+        extent_map = self._extent_map(extent_name)
+        field_id = extent_map['field_name_id'][field_name]
+        entities = extent_map['entities']
+        return [entities[oid]['fields'].get(field_id, UNASSIGNED)
+                for oid in oids]
+
     def _entity_fields(self, extent_name, oid):
         """Return a dictionary of field values for an entity in
         `extent` with given OID."""
@@ -630,6 +1173,64 @@ class Database(base.Database):
                 fields[field_name] = value
         return fields
 
+    def _entity_label(self, entity):
+        """Return the label of `entity` built from its default key.
+
+        Labels are cached until the entity, or an entity whose label
+        is part of it, is changed through this database.  Labels are
+        not cached while executing a transaction, nor if they depend on
+        calculated fields, value transforms, or entities that label
+        themselves differently.
+        """
+        extent = entity._extent
+        extent_name = extent.name
+        oid = entity._oid
+        label_cache = self._label_cache
+        cache_key = None
+        entry = None
+        if (self.label_cache_size and not self._executing
+            and entity._value_transforms is None):
+            try:
+                rev = self._entity_rev(extent_name, oid)
+            except error.EntityDoesNotExist:
+                pass
+            else:
+                cache_key = (extent.id, oid, rev)
+                entry = label_cache.get(cache_key)
+        if entry is not None:
+            label, chain = entry
+        else:
+            chain = set([(extent_name, oid)])
+            if cache_key is None:
+                # None in a chain prevents caching the label.
+                chain.add(None)
+            chains = self._label_chains
+            chains.append(chain)
+            try:
+                field_spec = entity._field_spec
+                labels = []
+                for name in entity._default_key:
+                    FieldClass = field_spec[name]
+                    field = FieldClass(entity, getattr(entity, name))
+                    if (FieldClass.fget is not None
+                        or not _label_is_tracked(field.get())):
+                        chain.add(None)
+                    labels.append(unicode(field))
+            finally:
+                chains.pop()
+            label = u' :: '.join(labels)
+            if None not in chain:
+                if len(label_cache) >= self.label_cache_size:
+                    self._clear_label_cache()
+                label_cache[cache_key] = (label, chain)
+                dependents = self._label_dependents
+                for member in chain:
+                    dependents.setdefault(member, set()).add(cache_key)
+        chains = self._label_chains
+        if chains:
+            chains[-1].update(chain)
+        return label
+
     def _entity_links(self, extent_name, oid, other_extent_name=None,
                      other_field_name=None, return_count=False):
         """Return dictionary of (extent_name, field_name): entity_list
@@ -705,6 +1306,25 @@ class Database(base.Database):
             assert log(2, 'returning links', links)
         return links
 
+    def _entity_link_oids(self, extent_name, oid):
+        """Return dictionary of (extent_name, field_name): oid_list pairs
+        for entities linking to an entity in `extent` with given OID,
+        without instantiating the linking entities."""
+        entity_map = self._entity_map(extent_name, oid)
+        links = {}
+        if entity_map['link_count'] == 0:
+            return links
+        extent_maps_by_id = self._extent_maps_by_id
+        for (other_extent_id, other_field_id), btree in (
+            entity_map['links'].iteritems()):
+            if len(btree):
+                other_extent_map = extent_maps_by_id[other_extent_id]
+                other_extent_name = other_extent_map['name']
+                other_field_name = other_extent_map['field_id_name'][
+                    other_field_id]
+                links[(other_extent_name, other_field_name)] = list(btree)
+        return links
+
     def _entity_related_entities(self, extent_name, oid):
         """Return a dictionary of related entity sets for an entity in
         `extent` with given OID."""
@@ -739,6 +1359,12 @@ class Database(base.Database):
         extent_map = self._extent_map(extent_name)
         return extent_map['len']
 
+    def _extent_stamp(self, extents):
+        """Return a tuple of the number of changes made to each of
+        `extents`, in order by name."""
+        counts = self._extent_change_counts
+        return tuple(counts.get(extent.name, 0) for extent in sorted(extents))
+
     def _extent_next_oid(self, extent_name):
         """Return the next OID to be assigned in the named extent."""
         extent_map = self._extent_map(extent_name)
@@ -801,84 +1427,123 @@ class Database(base.Database):
             matching = self._find_entity_oids_field_equality(
                 extent_name, {FieldClass: value})
             return set(all) - set(matching)
-        # Create a writable field to convert the value and get its
+        # Use a writable field to convert the value and get its
         # _dump'd representation.
         field_id = extent_map['field_name_id'][FieldClass.name]
         EntityClass = self._entity_classes[extent_name]
         FieldClass = EntityClass._field_spec[FieldClass.name]
-        class TemporaryField(FieldClass):
-            readonly = False
-        field = TemporaryField(None)
+        field = _writable_field_class(FieldClass)(None)
         field.set(value)
         value = field._dump()
         # Additional operators.
         # XXX: Brute force for now.
         if op in (operator.lt, operator.le, operator.gt, operator.ge):
+            stats = self._stats
+            if stats is not None:
+                start = time()
             results = []
             append = results.append
             for oid, entity_map in entity_maps.iteritems():
                 if op(entity_map['fields'].get(field_id, UNASSIGNED), value):
                     append(oid)
+            if stats is not None:
+                stats.add(extent_name, 'find_scan', time() - start)
             return set(results)
 
     def _find_entity_oids_field_equality(self, extent_name, criteria):
+        field_name_value = dict(
+            (field_class.name, value)
+            for field_class, value in criteria.iteritems()
+            )
+        field_names = tuple(sorted(field_name_value))
+        plan = self._equality_plan(extent_name, field_names)
+        values = [field_name_value[name] for name in field_names]
+        return self._find_entity_oids_planned(extent_name, plan, values)
+
+    def _equality_plan(self, extent_name, field_names):
+        """Return a plan for finding entities in the named extent whose
+        fields named in `field_names`, a sorted tuple, equal given
+        values.
+
+        The plan is a (field_ids, index_spec, field_classes) tuple,
+        where `field_ids` and `field_classes` correspond to
+        `field_names`, and `index_spec` is the index to use, or None if
+        no index covers the fields.  Plans are kept until the database
+        is synchronized with a schema.
+        """
+        key = (extent_name, field_names)
+        plan = self._equality_plans.get(key)
+        if plan is not None:
+            return plan
         extent_map = self._extent_map(extent_name)
-        entity_maps = extent_map['entities']
-        EntityClass = self._entity_classes[extent_name]
-        extent_name_id = self._extent_name_id
-        indices = extent_map['indices']
-        normalized_index_map = extent_map['normalized_index_map']
-        field_id_name = extent_map['field_id_name']
         field_name_id = extent_map['field_name_id']
-        # Convert from field_name:value to field_id:value.
-        field_id_value = {}
-        field_name_value = {}
-        for field_class, value in criteria.iteritems():
-            field_name = field_class.name
+        normalized_index_map = extent_map['normalized_index_map']
+        field_spec = self._entity_classes[extent_name]._field_spec
+        field_ids = []
+        field_classes = []
+        for field_name in field_names:
             try:
-                field_id = field_name_id[field_name]
+                field_ids.append(field_name_id[field_name])
             except KeyError:
                 raise error.FieldDoesNotExist(extent_name, field_name)
-            # Create a writable field to convert the value and get its
-            # _dump'd representation.
-            class TemporaryField(field_class):
-                readonly = False
-            field = TemporaryField(None)
+            field_classes.append(_writable_field_class(field_spec[field_name]))
+        # See if the fields given can be found in an index.
+        sorted_field_ids = tuple(sorted(field_ids))
+        index_spec = None
+        if sorted_field_ids in normalized_index_map:
+            for spec in normalized_index_map[sorted_field_ids]:
+                if len(spec) == len(field_ids):
+                    index_spec = spec
+                    break
+        plan = self._equality_plans[key] = (
+            tuple(field_ids), index_spec, tuple(field_classes))
+        return plan
+
+    def _find_entity_oids_planned(self, extent_name, plan, values):
+        """Return a list of OIDs of entities in the named extent whose
+        fields equal `values`, using a plan returned by
+        `_equality_plan`."""
+        stats = self._stats
+        if stats is not None:
+            start = time()
+        field_ids, index_spec, field_classes = plan
+        extent_map = self._extent_map(extent_name)
+        # Convert each value to its _dump'd representation.
+        field_id_value = {}
+        for field_id, FieldClass, value in zip(
+            field_ids, field_classes, values):
+            field = FieldClass(None)
             field.set(value)
-            value = field._dump()
-            field_id_value[field_id] = value
-            field_name_value[field_name] = value
+            field_id_value[field_id] = field._dump()
         # Get results, using indexes and shortcuts where possible.
         results = []
-        field_ids = tuple(sorted(field_id_value))
         assert log(3, 'field_ids', field_ids)
-        len_field_ids = len(field_ids)
         # First, see if we can take advantage of entity links.
-        if len_field_ids == 1:
+        if len(field_ids) == 1:
             field_id = field_ids[0]
-            field_name = field_id_name[field_id]
-            value = field_name_value[field_name]
-            if isinstance(value, Entity):
+            value = field_id_value[field_id]
+            # Entity field values are dumped as placeholders.
+            if isinstance(value, Placeholder):
+                other_extent_map = self._extent_maps_by_id[value.extent_id]
+                entity_map = other_extent_map['entities'].get(value.oid)
+            else:
+                entity_map = None
+            if entity_map is not None:
                 # We can take advantage of entity links.
-                entity_map = self._entity_map(value._extent.name, value._oid)
                 entity_links = entity_map['links']
                 extent_id = extent_map['id']
                 key = (extent_id, field_id)
                 linkmap = entity_links.get(key, {})
                 results = linkmap.keys()
+                if stats is not None:
+                    stats.add(extent_name, 'find_link', time() - start)
                 return results
-        # Next, see if the fields given can be found in an index. If
-        # so, use the index to return matches.
-        index_spec = None
-        if field_ids in normalized_index_map:
-            for spec in normalized_index_map[field_ids]:
-                if len(spec) == len_field_ids:
-                    index_spec = spec
-                    break
+        # Next, if the fields given can be found in an index, use the
+        # index to return matches.
         if index_spec is not None:
             # We found an index to use.
             assert log(2, 'Use index spec:', index_spec)
-            unique, branch = indices[index_spec]
+            unique, branch = extent_map['indices'][index_spec]
             match = True
             for field_id in index_spec:
                 field_value = field_id_value[field_id]
@@ -891,11 +1556,12 @@ class Database(base.Database):
                 # Now we're at a leaf that matches all of the
                 # criteria, so return the OIDs in that leaf.
                 results = list(branch.keys())
+            path = 'find_index'
         else:
             # Fields aren't indexed, so use brute force.
             assert log(2, 'Use brute force.')
             append = results.append
-            for oid, entity_map in entity_maps.iteritems():
+            for oid, entity_map in extent_map['entities'].iteritems():
                 fields = entity_map['fields']
                 match = True
                 for field_id, value in field_id_value.iteritems():
@@ -904,9 +1570,288 @@ class Database(base.Database):
                         break
                 if match:
                     append(oid)
+            path = 'find_scan'
         assert log(2, 'Result count', len(results))
+        if stats is not None:
+            stats.add(extent_name, path, time() - start)
         return results
 
+    def _find_extreme_oids(self, extent_name, group_field_name, field_name,
+                           maximum=False, oids=None):
+        """Return a list of OIDs of entities in the named extent, one
+        for each value of the group field, that have the minimum value
+        of the named field among entities with that group value, or the
+        maximum value if `maximum` is True.  Among entities with equal
+        values, the one with the lowest OID is chosen.
+
+        If `oids` is given, only consider entities with those OIDs.
+
+        Return None if there is no index on the group field followed by
+        the named field to find them with.
+        """
+        extent_map = self._extent_map(extent_name)
+        field_name_id = extent_map['field_name_id']
+        partial_spec = (field_name_id[group_field_name],
+                        field_name_id[field_name])
+        index_specs = extent_map['index_map'].get(partial_spec)
+        if not index_specs:
+            return None
+        index_spec = index_specs[0]
+        unique, branch = extent_map['indices'][index_spec]
+        assert log(2, 'Use index', index_spec)
+        ascending_seq = (True, ) * (len(index_spec) - 2)
+        results = []
+        for group_value, group_branch in branch.iteritems():
+            if oids is None:
+                # The first value in order belongs to some entity.
+                value, inner_branch = _extreme_item(group_branch, maximum)
+                found = []
+                _walk_index(inner_branch, ascending_seq, found)
+                results.append(min(found))
+                continue
+            for value, inner_branch in _ordered_items(group_branch, maximum):
+                found = []
+                _walk_index(inner_branch, ascending_seq, found)
+                found = [oid for oid in found if oid in oids]
+                if found:
+                    results.append(min(found))
+                    break
+        return results
+
+    def _find_entity_oids_prefix(self, extent_name, field_name, prefix):
+        """Return a list of OIDs of entities in the named extent whose
+        stored value of the named field is a string starting with
+        `prefix`.
+
+        Uses an index that leads with the field if there is one.
+        """
+        extent_map = self._extent_map(extent_name)
+        field_id = extent_map['field_name_id'][field_name]
+        index_specs = extent_map['index_map'].get((field_id, ))
+        results = []
+        if index_specs:
+            # Walk the range of the index that starts with prefix.
+            index_spec = index_specs[0]
+            assert log(2, 'Use index spec:', index_spec)
+            unique, branch = extent_map['indices'][index_spec]
+            ascending_seq = (True, ) * (len(index_spec) - 1)
+            for value, inner_branch in _items_from(branch, prefix):
+                if (not isinstance(value, basestring)
+                    or not value.startswith(prefix)
+                    ):
+                    break
+                _walk_index(inner_branch, ascending_seq, results)
+        else:
+            assert log(2, 'Use brute force.')
+            append = results.append
+            for oid, entity_map in extent_map['entities'].iteritems():
+                value = entity_map['fields'].get(field_id, UNASSIGNED)
+                if isinstance(value, basestring) and value.startswith(prefix):
+                    append(oid)
+        return results
+
+    def _find_entity_oids_contains(self, extent_name, field_name, substring,
+                                   ignore_case=False):
+        """Return a list of OIDs of entities in the named extent whose
+        stored value of the named field is a string containing
+        `substring`, optionally ignoring case.
+
+        Uses the text index of the field, if there is one, to find
+        candidates when `substring` is at least three characters long.
+        """
+        extent_map = self._extent_map(extent_name)
+        field_id = extent_map['field_name_id'][field_name]
+        entities = extent_map['entities']
+        text_indices = extent_map.get('text_indices')
+        text_index = text_indices and text_indices.get(field_id)
+        terms = trigrams(substring)
+        if text_index is not None and terms:
+            assert log(2, 'Use text index.')
+            candidates = None
+            for term in terms:
+                oids = text_index.get(term)
+                if oids is None:
+                    return []
+                if candidates is None:
+                    candidates = set(oids.iterkeys())
+                else:
+                    candidates.intersection_update(oids.iterkeys())
+                if not candidates:
+                    return []
+            candidates = sorted(candidates)
+        else:
+            assert log(2, 'Use brute force.')
+            candidates = entities.iterkeys()
+        if ignore_case:
+            substring = substring.lower()
+        results = []
+        append = results.append
+        for oid in candidates:
+            value = entities[oid]['fields'].get(field_id, UNASSIGNED)
+            if isinstance(value, basestring):
+                if ignore_case:
+                    value = value.lower()
+                if substring in value:
+                    append(oid)
+        return results
+
+    def _search_entity_oids(self, extent_name, query, limit=None):
+        """Return a list of OIDs of entities in the named extent whose
+        full-text indexed fields match `query`, best matches first.
+
+        Each matching word of an entity scores the number of times it
+        occurs in the entity, weighted by how rare it is in the extent.
+        If `limit` is given, return at most that many OIDs.
+        """
+        extent_map = self._extent_map(extent_name)
+        fulltext_index = extent_map.get('fulltext_index')
+        if fulltext_index is None:
+            raise error.IndexDoesNotExist(extent_name, ())
+        terms = fulltext_index['terms']
+        total = extent_map['len']
+        scores = {}
+        for words in parse_query(query):
+            matches = None
+            for term, is_prefix in words:
+                word_scores = {}
+                if is_prefix:
+                    for key, postings in _items_from(terms, term):
+                        if not key.startswith(term):
+                            break
+                        _add_term_scores(word_scores, postings, total)
+                else:
+                    postings = terms.get(term)
+                    if postings is not None:
+                        _add_term_scores(word_scores, postings, total)
+                if matches is None:
+                    matches = word_scores
+                else:
+                    matches = dict((oid, score + matches[oid])
+                                   for oid, score in word_scores.iteritems()
+                                   if oid in matches)
+                if not matches:
+                    break
+            for oid, score in matches.iteritems():
+                scores[oid] = scores.get(oid, 0.0) + score
+        ranked = sorted(scores.iteritems(), key=_rank)
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [oid for oid, score in ranked]
+
+    def _join(self, start, fields):
+        """Return a tuple of the names of the extents of the OIDs in the
+        rows joined by `join_oids`, and an iterator of the rows."""
+        if isinstance(start, Expression):
+            extent_name = _criterion_extent(start).name
+            start_oids = self._find_entity_oids(extent_name, start)
+        elif isinstance(start, Entity):
+            extent_name = start._extent.name
+            start_oids = [start._oid]
+        else:
+            extent_name = start.name
+            start_oids = self._find_entity_oids(extent_name, None)
+        extent_names = [extent_name]
+        steps = []
+        for FieldClass in fields:
+            current_name = extent_names[-1]
+            current_map = self._extent_map(current_name)
+            field_extent_name = FieldClass._extent.name
+            field_name = FieldClass.name
+            field_extent_map = self._extent_map(field_extent_name)
+            field_id = field_extent_map['field_name_id'][field_name]
+            if field_id not in field_extent_map['entity_field_ids']:
+                raise ValueError(
+                    'Field %r of %s does not refer to entities.'
+                    % (field_name, field_extent_name))
+            if field_extent_name == current_name:
+                # Follow the field to the entities it refers to.
+                allow = FieldClass.allow
+                if len(allow) != 1 or ANY in allow:
+                    raise ValueError(
+                        'Field %r of %s must refer to one extent to be '
+                        'followed.' % (field_name, field_extent_name))
+                [next_name] = allow
+                next_id = self._extent_map(next_name)['id']
+                steps.append(_join_forward(
+                    current_map['entities'], field_id, next_id))
+            else:
+                # Follow the links of the entities referring to it.
+                allow = FieldClass.allow
+                if current_name not in allow and ANY not in allow:
+                    raise ValueError(
+                        'Field %r of %s does not refer to %s.'
+                        % (field_name, field_extent_name, current_name))
+                next_name = field_extent_name
+                steps.append(_join_back(
+                    current_map['entities'],
+                    (field_extent_map['id'], field_id)))
+            extent_names.append(next_name)
+        rows = _join_rows([(oid, ) for oid in sorted(start_oids)], steps)
+        return tuple(extent_names), rows
+
+    def _prefetch_entities(self, entities, path):
+        """Restore the entities referred to by the entity field named
+        by the dotted `path` of each of `entities`, and return them.
+
+        Referring and referred-to entities are read in order by extent
+        and OID, and each restored entity is attached to the
+        placeholders referring to it, so that getting those fields
+        later does not read the database again.
+        """
+        field_name, _, rest = path.partition('.')
+        entity_classes = self._entity_classes
+        extent_maps_by_id = self._extent_maps_by_id
+        # Collect the placeholders in the field of each entity.
+        field_ids = {}
+        by_extent_id = {}
+        keys = set((entity._extent.name, entity._oid)
+                   for entity in entities if entity is not UNASSIGNED)
+        for extent_name, oid in sorted(keys):
+            extent_map = self._extent_map(extent_name)
+            field_id = field_ids.get(extent_name)
+            if field_id is None:
+                field_id = extent_map['field_name_id'].get(field_name)
+                if field_id is None:
+                    raise error.FieldDoesNotExist(extent_name, field_name)
+                if field_id not in extent_map['entity_field_ids']:
+                    raise ValueError(
+                        'Field %r of %s does not refer to entities.'
+                        % (field_name, extent_name))
+                field_ids[extent_name] = field_id
+            entity_map = extent_map['entities'].get(oid)
+            if entity_map is None:
+                continue
+            value = entity_map['fields'].get(field_id, UNASSIGNED)
+            for placeholder in _placeholders(value):
+                by_oid = by_extent_id.setdefault(placeholder.extent_id, {})
+                by_oid.setdefault(placeholder.oid, []).append(placeholder)
+        # Restore the entities they refer to.
+        sync_count = self._sync_count
+        restored = []
+        for extent_id in sorted(by_extent_id):
+            extent_map = extent_maps_by_id.get(extent_id)
+            if extent_map is None:
+                continue
+            EntityClass = entity_classes[extent_map['name']]
+            entities_by_oid = extent_map['entities']
+            by_oid = by_extent_id[extent_id]
+            for oid in sorted(by_oid):
+                entity_map = entities_by_oid.get(oid)
+                if entity_map is None:
+                    # Placeholders of deleted entities restore to
+                    # UNASSIGNED as usual.
+                    continue
+                # Read the fields now rather than when first getting one.
+                len(entity_map['fields'])
+                entity = EntityClass(oid)
+                for placeholder in by_oid[oid]:
+                    placeholder.entity = entity
+                    placeholder.db_sync_count = sync_count
+                restored.append(entity)
+        if rest:
+            self._prefetch_entities(restored, rest)
+        return restored
+
     def _relax_index(self, extent_name, *index_spec):
         """Relax constraints on the specified index until a matching
         enforce_index is called, or the currently-executing
@@ -936,6 +1881,22 @@ class Database(base.Database):
         extent_map = self._extent_map(extent_name)
         extent_map['next_oid'] = next_oid
 
+    def _undelete_entities(self, records):
+        """Restore entities deleted by `_delete_entities`.
+
+        - `records`: List of (extent_name, oid, fields, related_entities,
+          rev) tuples, in the order the entities were deleted.
+
+        All entities are created before their related entities are
+        restored, so that the entities may refer to each other.
+        """
+        for extent_name, oid, fields, related_entities, rev in records:
+            self._create_entity(extent_name, fields, {}, oid, rev)
+        for extent_name, oid, fields, related_entities, rev in records:
+            if related_entities:
+                self._update_entity(
+                    extent_name, oid, {}, related_entities, rev)
+
     def _update_entity(self, extent_name, oid, fields, related_entities,
                        rev=None):
         """Update an existing entity in an extent.
@@ -951,15 +1912,49 @@ class Database(base.Database):
         - `related_entities`: Dictionary of field_name:related_entity_set
           mappings, where each related_entity_set is the set of entities
           stored in the field's structure, as returned by a field instance's
-          `_entities_in_value` method.
+          `_entities_in_value` method.  Related entity sets of fields not
+          given are left unchanged.
 
         - `rev`: (optional) Specific revision to update the entity to.
+
+        Only the indices, links, and stored values affected by fields
+        whose values actually changed are touched, and the inversion
+        records only the old values of those fields.
         """
-        # XXX: Could be optimized to update mappings only when
-        # necessary.
+        old = self._update_entity_maps(
+            extent_name, oid, fields, related_entities, rev)
+        # Allow inversion of this operation.
+        self._append_inversion(self._update_entity, extent_name, oid, *old)
+
+    def _update_entities(self, updates):
+        """Update existing entities given as a sequence of
+        ``(extent_name, oid, fields, related_entities, rev)`` tuples, in
+        order, as with `_update_entity`.  A single inversion restores
+        all of the entities."""
+        records = []
+        try:
+            for extent_name, oid, fields, related_entities, rev in updates:
+                old = self._update_entity_maps(
+                    extent_name, oid, fields, related_entities, rev)
+                records.append((extent_name, oid) + old)
+        finally:
+            # Allow inversion of the updates performed.
+            if records:
+                records.reverse()
+                self._append_inversion(self._update_entities, records)
+
+    def _update_entity_maps(self, extent_name, oid, fields, related_entities,
+                            rev=None):
+        """Update an existing entity as described by `_update_entity`,
+        without allowing inversion; return a tuple of ``(old_fields,
+        old_related_entities, old_rev)`` that restores it."""
+        stats = self._stats
+        if stats is not None:
+            start = time()
         entity_classes = self._entity_classes
         entity_map, extent_map = self._entity_extent_map(extent_name, oid)
         field_name_id = extent_map['field_name_id']
+        field_id_name = extent_map['field_id_name']
         extent_name_id = self._extent_name_id
         extent_maps_by_id = self._extent_maps_by_id
         indices_added = []
@@ -972,96 +1967,114 @@ class Database(base.Database):
         nl_append = new_links.append
         lc_append = links_created.append
         ld_append = links_deleted.append
-        BTree = self._BTree
+        IndexBTree = self._IndexBTree
+        IndexLeafBTree = self._IndexLeafBTree
+        LinksBTree = self._LinksBTree
         try:
-            # Get old values for use in a potential inversion.
-            old_fields = self._entity_fields(extent_name, oid)
-            updating_related = len(related_entities) > 0
-            if updating_related:
-                old_related_entities = self._entity_related_entities(
-                    extent_name, oid)
-            else:
-                old_related_entities = {}
-            old_rev = entity_map['rev']
-            # Manage entity references.
-            if updating_related:
-                for name, related_entity_set in related_entities.iteritems():
-                    field_id = field_name_id[name]
-                    for placeholder in related_entity_set:
-                        other_extent_id = placeholder.extent_id
-                        other_oid = placeholder.oid
-                        nl_append((field_id, other_extent_id, other_oid))
             # Get fields, and set UNASSIGNED for any fields that are
             # new since the last time the entity was stored.
             fields_by_id = entity_map['fields']
-            all_field_ids = set(extent_map['field_id_name'])
+            all_field_ids = set(field_id_name)
             new_field_ids = all_field_ids - set(fields_by_id)
-            fields_by_id.update(dict(
-                (field_id, UNASSIGNED) for field_id in new_field_ids))
-            # Create ephemeral fields for creating new mappings.
-            new_fields_by_id = dict(fields_by_id)
+            if new_field_ids:
+                fields_by_id.update(dict(
+                    (field_id, UNASSIGNED) for field_id in new_field_ids))
+            # Determine which fields actually change.  A value of a
+            # different type is a change even if it compares equal.
+            changed_fields_by_id = {}
             for name, value in fields.iteritems():
-                new_fields_by_id[field_name_id[name]] = value
-            if updating_related:
-                new_related_entities_by_id = dict(
-                    (field_name_id[name], related_entities[name])
-                    for name in related_entities
-                    )
-            # Remove existing index mappings.
+                field_id = field_name_id[name]
+                old_value = fields_by_id[field_id]
+                if (old_value != value
+                    or old_value.__class__ is not value.__class__
+                    ):
+                    changed_fields_by_id[field_id] = value
+            # Determine which related entity sets actually change.
+            changed_related_by_id = {}
+            if len(related_entities) > 0:
+                related_entities_by_id = entity_map['related_entities']
+                for name, new_related in related_entities.iteritems():
+                    field_id = field_name_id[name]
+                    old_related = related_entities_by_id.get(
+                        field_id, frozenset())
+                    if old_related != new_related:
+                        changed_related_by_id[field_id] = new_related
+            # Get old values of changed fields for use in a potential
+            # inversion.
+            old_fields = dict(
+                (field_id_name[field_id], fields_by_id[field_id])
+                for field_id in changed_fields_by_id
+                )
+            old_related_entities = dict(
+                (field_id_name[field_id],
+                 related_entities_by_id.get(field_id, frozenset()))
+                for field_id in changed_related_by_id
+                )
+            old_rev = entity_map['rev']
+            # Manage entity references.
+            for field_id, related_entity_set in (
+                changed_related_by_id.iteritems()):
+                for placeholder in related_entity_set:
+                    other_extent_id = placeholder.extent_id
+                    other_oid = placeholder.oid
+                    nl_append((field_id, other_extent_id, other_oid))
+            # Only indices that include a changed field need updating.
             indices = extent_map['indices']
-            for index_spec in indices.iterkeys():
+            changed_field_ids = frozenset(changed_fields_by_id)
+            changed_index_specs = [
+                index_spec for index_spec in indices.iterkeys()
+                if changed_field_ids.intersection(index_spec)
+                ]
+            # Create ephemeral fields for creating new mappings.
+            if changed_index_specs:
+                new_fields_by_id = dict(fields_by_id)
+                new_fields_by_id.update(changed_fields_by_id)
+                relaxed_specs = self._relaxed[extent_name]
+            # Remove existing index mappings.
+            for index_spec in changed_index_specs:
                 field_values = tuple(fields_by_id[field_id]
                                      for field_id in index_spec)
                 # Find out if the index has been relaxed.
-                relaxed_specs = self._relaxed[extent_name]
                 if index_spec in relaxed_specs:
                     txns, relaxed = relaxed_specs[index_spec]
                 else:
                     relaxed = None
                 _index_remove(extent_map, index_spec, oid, field_values)
                 ir_append((extent_map, index_spec, relaxed, oid, field_values))
-            if updating_related:
+            if changed_related_by_id:
                 # Delete links from this entity to other entities.
-                related_entities_by_id = entity_map['related_entities']
                 referrer_extent_id = extent_name_id[extent_name]
-                new_field_ids = frozenset(new_fields_by_id)
-                for (referrer_field_id,
-                     related_set) in related_entities_by_id.iteritems():
-                    # If a field once existed, but no longer does, there will
-                    # still be a related entity set for it in related_entities.
-                    # Only process the fields that still exist.
-                    if referrer_field_id in all_field_ids:
-                        # Remove only the links that no longer exist.
-                        new_related_entities = new_related_entities_by_id.get(
-                            referrer_field_id, set())
-                        for other_value in related_set - new_related_entities:
-                            # Remove the link to the other entity.
-                            other_extent_id = other_value.extent_id
-                            other_oid = other_value.oid
-                            link_key = (referrer_extent_id, referrer_field_id)
-                            other_extent_map = extent_maps_by_id[
-                                other_extent_id]
-                            other_entity_map = other_extent_map['entities'][
-                                other_oid]
-                            links = other_entity_map['links']
-                            other_links = links[link_key]
-                            del other_links[oid]
-                            other_entity_map['link_count'] -= 1
-                            ld_append((other_entity_map, links, link_key, oid))
+                for referrer_field_id, new_related_entities in (
+                    changed_related_by_id.iteritems()):
+                    related_set = related_entities_by_id.get(
+                        referrer_field_id, frozenset())
+                    # Remove only the links that no longer exist.
+                    for other_value in related_set - new_related_entities:
+                        # Remove the link to the other entity.
+                        other_extent_id = other_value.extent_id
+                        other_oid = other_value.oid
+                        link_key = (referrer_extent_id, referrer_field_id)
+                        other_extent_map = extent_maps_by_id[other_extent_id]
+                        other_entity_map = other_extent_map['entities'][
+                            other_oid]
+                        links = other_entity_map['links']
+                        other_links = links[link_key]
+                        del other_links[oid]
+                        other_entity_map['link_count'] -= 1
+                        ld_append((other_entity_map, links, link_key, oid))
             # Create new index mappings.
-            for index_spec in indices.iterkeys():
+            for index_spec in changed_index_specs:
                 field_values = tuple(new_fields_by_id[field_id]
                                      for field_id in index_spec)
                 # Find out if the index has been relaxed.
-                relaxed_specs = self._relaxed[extent_name]
                 if index_spec in relaxed_specs:
                     txns, relaxed = relaxed_specs[index_spec]
                 else:
                     relaxed = None
                 _index_add(extent_map, index_spec, relaxed, oid, field_values,
-                           BTree)
+                           IndexBTree, IndexLeafBTree)
                 ia_append((extent_map, index_spec, oid, field_values))
-            if updating_related:
+            if new_links:
                 # Update links from this entity to another entity.
                 referrer_extent_id = extent_name_id[extent_name]
                 for referrer_field_id, other_extent_id, other_oid in new_links:
@@ -1070,7 +2083,6 @@ class Database(base.Database):
                         other_entity_map = other_extent_map['entities'][
                             other_oid]
                     except KeyError:
-                        field_id_name = extent_map['field_id_name']
                         field_name = field_id_name[referrer_field_id]
                         other_extent_map = extent_maps_by_id[other_extent_id]
                         other_extent_name = other_extent_map['name']
@@ -1080,7 +2092,7 @@ class Database(base.Database):
                     links = other_entity_map['links']
                     link_key = (referrer_extent_id, referrer_field_id)
                     if link_key not in links:  # XXX Should already be there.
-                        mapping = links[link_key] = BTree()
+                        mapping = links[link_key] = LinksBTree()
                     else:
                         mapping = links[link_key]
                     if oid not in mapping:
@@ -1088,30 +2100,67 @@ class Database(base.Database):
                         links[link_key][oid] = None
                         other_entity_map['link_count'] += 1
                         lc_append((other_entity_map, links, link_key, oid))
+            # Update text indices of changed fields.
+            text_indices = extent_map.get('text_indices')
+            if text_indices and changed_fields_by_id:
+                for field_id, text_index in text_indices.iteritems():
+                    if field_id in changed_fields_by_id:
+                        _text_index_remove(
+                            text_index, oid, fields_by_id[field_id])
+                        _text_index_add(
+                            text_index, oid, changed_fields_by_id[field_id],
+                            IndexLeafBTree)
+            # Update full-text index if any of its fields changed.
+            fulltext_index = extent_map.get('fulltext_index')
+            if (fulltext_index is not None and changed_fields_by_id
+                and [field_id for field_id in fulltext_index['field_ids']
+                     if field_id in changed_fields_by_id]
+                ):
+                new_fields_by_id = dict(fields_by_id.iteritems())
+                new_fields_by_id.update(changed_fields_by_id)
+                _fulltext_index_remove(
+                    fulltext_index, oid,
+                    _fulltext_counts(fulltext_index, fields_by_id))
+                _fulltext_index_add(
+                    fulltext_index, oid,
+                    _fulltext_counts(fulltext_index, new_fields_by_id),
+                    IndexLeafBTree)
+            # Update materialized aggregates of changed fields.
+            aggregates = extent_map.get('aggregates')
+            if aggregates and changed_fields_by_id:
+                for aggregate in aggregates.itervalues():
+                    _aggregate_update(
+                        aggregate, fields_by_id, changed_fields_by_id)
             # Update actual fields and related entities.
-            for name, value in fields.iteritems():
-                fields_by_id[field_name_id[name]] = value
-            if updating_related:
-                for name, value in related_entities.iteritems():
-                    related_entities_by_id[field_name_id[name]] = value
+            if changed_fields_by_id:
+                fields_by_id.update(changed_fields_by_id)
+            if changed_related_by_id:
+                related_entities_by_id.update(changed_related_by_id)
             # Update revision.
             if rev is None:
                 entity_map['rev'] += 1
             else:
                 entity_map['rev'] = rev
-            # Allow inversion of this operation.
-            self._append_inversion(
-                self._update_entity, extent_name, oid, old_fields,
-                old_related_entities, old_rev)
             # Keep track of changes.
+            changed_field_names = frozenset(
+                field_id_name[field_id]
+                for field_id in changed_field_ids.union(changed_related_by_id)
+                )
             append_change = self._append_change
-            append_change(UPDATE, extent_name, oid)
+            append_change(UPDATE, extent_name, oid, changed_field_names)
+            if stats is not None:
+                stats.count(extent_name, 'index_add', len(indices_added))
+                stats.count(extent_name, 'index_remove', len(indices_removed))
+                stats.count(extent_name, 'link_add', len(links_created))
+                stats.count(extent_name, 'link_remove', len(links_deleted))
+                stats.add(extent_name, 'update', time() - start)
+            return old_fields, old_related_entities, old_rev
         except:
             # Revert changes made during update attempt.
             for _e, _i, _o, _f in indices_added:
                 _index_remove(_e, _i, _o, _f)
             for _e, _i, _r, _o, _f in indices_removed:
-                _index_add(_e, _i, _r, _o, _f, BTree)
+                _index_add(_e, _i, _r, _o, _f, IndexBTree, IndexLeafBTree)
             for other_entity_map, links, link_key, oid in links_created:
                 del links[link_key][oid]
                 other_entity_map['link_count'] -= 1
@@ -1123,7 +2172,7 @@ class Database(base.Database):
     def _create_extent(self, extent_name, field_names, entity_field_names,
                       key_spec=None, index_spec=None):
         """Create a new extent with a given name."""
-        BTree = self._BTree
+        IndexBTree = self._IndexBTree
         PList = self._PList
         PDict = self._PDict
         if extent_name in self._extent_maps_by_name:
@@ -1138,7 +2187,7 @@ class Database(base.Database):
         extent_map['index_map'] = PDict()
         normalized_index_map = extent_map[
             'normalized_index_map'] = PDict()
-        extent_map['entities'] = BTree()
+        extent_map['entities'] = self._EntitiesBTree()
         field_id_name = extent_map['field_id_name'] = PDict()
         field_name_id = extent_map['field_name_id'] = PDict()
         extent_map['id'] = extent_id
@@ -1157,14 +2206,14 @@ class Database(base.Database):
         # index structures.
         for field_names in key_spec:
             i_spec = _field_ids(extent_map, field_names)
-            _create_index(extent_map, i_spec, True, BTree, PList)
+            _create_index(extent_map, i_spec, True, IndexBTree, PList)
         # Convert field names to field IDs in index spec and create
         # index structures.
         for field_names in index_spec:
             i_spec = _field_ids(extent_map, field_names)
             # Although we tell it unique=False, it may find a subset
             # key, which will cause this superset to be unique=True.
-            _create_index(extent_map, i_spec, False, BTree, PList)
+            _create_index(extent_map, i_spec, False, IndexBTree, PList)
         # Convert field names to field IDs for entity field names.
         extent_map['entity_field_ids'] = _field_ids(
             extent_map, entity_field_names)
@@ -1200,6 +2249,16 @@ class Database(base.Database):
         del self._extent_maps_by_id[extent_id]
         del self._extent_maps_by_name[extent_name]
 
+    def _build_text_index(self, extent_map, field_id):
+        """Return a new text index of the field with ID `field_id` in
+        the extent in `extent_map`."""
+        text_index = self._IndexBTree()
+        IndexLeafBTree = self._IndexLeafBTree
+        for oid, entity_map in extent_map['entities'].iteritems():
+            value = entity_map['fields'].get(field_id, UNASSIGNED)
+            _text_index_add(text_index, oid, value, IndexLeafBTree)
+        return text_index
+
     def _create_schevo_structures(self):
         """Create or update Schevo structures in the database."""
         root = self._root
@@ -1314,6 +2373,24 @@ class Database(base.Database):
             if callable(fn):
                 fn(self)
 
+    def _rebuild_aggregate(self, extent_map, aggregate):
+        """Recompute a materialized `aggregate` of the extent in
+        `extent_map`."""
+        aggregate['groups'] = self._IndexBTree()
+        for oid, entity_map in extent_map['entities'].iteritems():
+            _aggregate_apply(aggregate, entity_map['fields'], 1)
+
+    def _rebuild_fulltext_index(self, extent_map):
+        """Rebuild the full-text index of the extent in `extent_map`."""
+        fulltext_index = extent_map['fulltext_index']
+        fulltext_index['terms'] = self._IndexBTree()
+        IndexLeafBTree = self._IndexLeafBTree
+        for oid, entity_map in extent_map['entities'].iteritems():
+            _fulltext_index_add(
+                fulltext_index, oid,
+                _fulltext_counts(fulltext_index, entity_map['fields']),
+                IndexLeafBTree)
+
     def _remove_stale_links(self, extent_id, field_id, FieldClass):
         # Remove links from this field to other entities that are held
         # in the structures for those other entities.
@@ -1363,6 +2440,10 @@ class Database(base.Database):
           database evolution.
         """
         self._sync_count += 1
+        self._equality_plans.clear()
+        if self.query_cache is not None:
+            self.query_cache.clear()
+        self._clear_label_cache()
         sync_schema_changes = True
         locked = False
         try:
@@ -1608,6 +2689,12 @@ class Database(base.Database):
             key_spec = EntityClass._key_spec
             index_spec = EntityClass._index_spec
             self._update_extent_key_spec(extent_name, key_spec, index_spec)
+            self._update_extent_text_index_spec(
+                extent_name, EntityClass._text_index_spec)
+            self._update_extent_fulltext_index_spec(
+                extent_name, EntityClass._fulltext_index_spec)
+            self._update_extent_aggregate_spec(
+                extent_name, EntityClass._aggregate_spec)
 
     def _unique_extent_id(self):
         """Return an unused random extent ID."""
@@ -1630,6 +2717,72 @@ class Database(base.Database):
         for extent in self._extent_maps_by_id.itervalues():
             extent_maps_by_name[extent['name']] = extent
 
+    def _update_extent_aggregate_spec(self, extent_name, aggregate_spec):
+        """Update an existing extent to match given materialized
+        aggregate spec."""
+        extent_map = self._extent_map(extent_name)
+        aggregates = extent_map.get('aggregates')
+        if aggregates is None:
+            if not aggregate_spec:
+                return
+            aggregates = extent_map['aggregates'] = self._PDict()
+        field_name_id = extent_map['field_name_id']
+        names = set()
+        for name, kind, field_name, group_by in aggregate_spec:
+            names.add(name)
+            spec = (
+                kind,
+                field_name and field_name_id[field_name],
+                group_by and field_name_id[group_by],
+                )
+            aggregate = aggregates.get(name)
+            if aggregate is None or aggregate['spec'] != spec:
+                # Create and populate new or changed aggregates.
+                aggregate = aggregates[name] = self._PDict()
+                aggregate['spec'] = spec
+                self._rebuild_aggregate(extent_map, aggregate)
+        # Remove aggregates that no longer exist.
+        for name in set(aggregates) - names:
+            del aggregates[name]
+
+    def _update_extent_fulltext_index_spec(self, extent_name,
+                                           fulltext_index_spec):
+        """Update an existing extent to match given full-text index
+        spec."""
+        extent_map = self._extent_map(extent_name)
+        fulltext_index = extent_map.get('fulltext_index')
+        if not fulltext_index_spec:
+            if fulltext_index is not None:
+                del extent_map['fulltext_index']
+            return
+        field_ids = tuple(sorted(
+            _field_ids(extent_map, fulltext_index_spec)))
+        if (fulltext_index is not None
+            and fulltext_index['field_ids'] == field_ids
+            ):
+            return
+        fulltext_index = extent_map['fulltext_index'] = self._PDict()
+        fulltext_index['field_ids'] = field_ids
+        self._rebuild_fulltext_index(extent_map)
+
+    def _update_extent_text_index_spec(self, extent_name, text_index_spec):
+        """Update an existing extent to match given text index spec."""
+        extent_map = self._extent_map(extent_name)
+        text_indices = extent_map.get('text_indices')
+        if text_indices is None:
+            if not text_index_spec:
+                return
+            text_indices = extent_map['text_indices'] = self._PDict()
+        field_ids = _field_ids(extent_map, text_index_spec)
+        # Create and populate new text indices.
+        for field_id in field_ids:
+            if field_id not in text_indices:
+                text_indices[field_id] = self._build_text_index(
+                    extent_map, field_id)
+        # Remove text indices that no longer exist.
+        for field_id in set(text_indices) - set(field_ids):
+            del text_indices[field_id]
+
     def _update_extent_key_spec(self, extent_name, key_spec, index_spec):
         """Update an existing extent to match given key spec."""
         extent_map = self._extent_map(extent_name)
@@ -1639,7 +2792,8 @@ class Database(base.Database):
                         for field_names in key_spec]
         index_spec_ids = [_field_ids(extent_map, field_names)
                           for field_names in index_spec]
-        BTree = self._BTree
+        IndexBTree = self._IndexBTree
+        IndexLeafBTree = self._IndexLeafBTree
         PList = self._PList
         # Convert key indices that have been changed to non-unique
         # incides.
@@ -1652,24 +2806,24 @@ class Database(base.Database):
             if i_spec not in indices:
                 # Create a new unique index and populate it.
                 _create_index(
-                    extent_map, i_spec, True, BTree, PList)
+                    extent_map, i_spec, True, IndexBTree, PList)
                 for oid in entities:
                     fields_by_id = entities[oid]['fields']
                     field_values = tuple(fields_by_id.get(field_id, UNASSIGNED)
                                          for field_id in i_spec)
                     _index_add(extent_map, i_spec, None, oid, field_values,
-                               BTree)
+                               IndexBTree, IndexLeafBTree)
         # Create new non-unique indices for those that don't exist.
         for i_spec in index_spec_ids:
             if i_spec not in indices:
                 # Create a new non-unique index and populate it.
-                _create_index(extent_map, i_spec, False, BTree, PList)
+                _create_index(extent_map, i_spec, False, IndexBTree, PList)
                 for oid in entities:
                     fields_by_id = entities[oid]['fields']
                     field_values = tuple(fields_by_id.get(field_id, UNASSIGNED)
                                          for field_id in i_spec)
                     _index_add(extent_map, i_spec, None, oid, field_values,
-                               BTree)
+                               IndexBTree, IndexLeafBTree)
         # Remove key indices that no longer exist.
         to_remove = set(indices) - set(key_spec_ids + index_spec_ids)
         for i_spec in to_remove:
@@ -1697,20 +2851,48 @@ class Database(base.Database):
                         field_values = tuple(fields_by_id[field_id]
                                              for field_id in i_spec)
                         _index_validate(extent_map, i_spec, oid, field_values,
-                                        BTree)
+                                        IndexBTree, IndexLeafBTree)
 
     def _validate_changes(self, changes):
+        """Validate the fields changed by `changes`, a list of
+        (typ, extent_name, oid, field_names) tuples.
+
+        Only fields changed by updates are validated, and fields whose
+        validation is a no-op are skipped entirely.  Validation is
+        performed extent by extent and field by field, so only the
+        fields that require validation are instantiated.
+        """
         # Here we are applying rules defined by the entity itself, not
         # the transaction, since transactions may relax certain rules.
         entity_classes = self._entity_classes
-        changes = change.normalize(changes)
-        for typ, extent_name, oid in changes:
-            if typ in (CREATE, UPDATE):
-                EntityClass = entity_classes[extent_name]
-                entity = EntityClass(oid)
-                field_map = entity.s.field_map(not_fget)
-                for field in field_map.itervalues():
+        stats = self._stats
+        for extent_name, rows in _changed_fields(changes):
+            if stats is not None:
+                start = time()
+            EntityClass = entity_classes[extent_name]
+            field_spec = EntityClass._field_spec
+            # Names of fields whose validation is not a no-op.
+            checked = [name for name, FieldClass in field_spec.iteritems()
+                       if not _validation_is_noop(FieldClass)]
+            if not checked:
+                continue
+            extent_map = self._extent_map(extent_name)
+            entities = extent_map['entities']
+            field_name_id = extent_map['field_name_id']
+            for name in checked:
+                FieldClass = field_spec[name]
+                field_id = field_name_id.get(name)
+                for oid, field_names in rows:
+                    if field_names is not None and name not in field_names:
+                        continue
+                    value = entities[oid]['fields'].get(field_id, UNASSIGNED)
+                    field = FieldClass(instance=EntityClass(oid), value=value)
+                    # Allow the field to restore itself from a stored
+                    # value.
+                    field._restore(self)
                     field.validate(field._value)
+            if stats is not None:
+                stats.add(extent_name, 'validate', time() - start)
 
     def _reset_all(self):
         """Clear all entities, indices, etc. in the database.
@@ -1719,22 +2901,185 @@ class Database(base.Database):
 
         NOT INDENDED FOR GENERAL USE.
         """
-        BTree = self._BTree
         for extent_name in self.extent_names():
             extent_map = self._extent_map(extent_name)
-            extent_map['entities'] = BTree()
+            extent_map['entities'] = self._EntitiesBTree()
             extent_map['len'] = 0
             extent_map['next_oid'] = 1
             indices = extent_map['indices']
             for index_spec, (unique, index_tree) in list(indices.items()):
-                indices[index_spec] = (unique, BTree())
+                indices[index_spec] = (unique, self._IndexBTree())
+            text_indices = extent_map.get('text_indices')
+            if text_indices:
+                for field_id in list(text_indices.keys()):
+                    text_indices[field_id] = self._IndexBTree()
+            fulltext_index = extent_map.get('fulltext_index')
+            if fulltext_index is not None:
+                fulltext_index['terms'] = self._IndexBTree()
+            aggregates = extent_map.get('aggregates')
+            if aggregates:
+                for aggregate in aggregates.itervalues():
+                    aggregate['groups'] = self._IndexBTree()
+            self._entity_classes[extent_name]._identities.clear()
         self._commit()
+        if self.query_cache is not None:
+            self.query_cache.clear()
+        self._clear_label_cache()
         self.dispatch = Database.dispatch
         self.label = Database.label
         self._initialize()
         self._on_open()
 
 
+def _changed_fields(changes):
+    """Return a sorted list of (extent_name, rows) tuples for entities
+    created or updated by `changes`, a list of (typ, extent_name, oid,
+    field_names) tuples.  Each of `rows` is a sorted list of (oid,
+    field_names) tuples, where field_names is None if all fields must
+    be validated."""
+    creates = set()
+    deletes = set()
+    updates = {}
+    for typ, extent_name, oid, field_names in changes:
+        key = (extent_name, oid)
+        if typ == CREATE:
+            creates.add(key)
+        elif typ == DELETE:
+            deletes.add(key)
+        elif key not in updates:
+            updates[key] = field_names
+        elif updates[key] is not None:
+            if field_names is None:
+                updates[key] = None
+            else:
+                updates[key] = updates[key].union(field_names)
+    extents = {}
+    for key in creates - deletes:
+        extent_name, oid = key
+        extents.setdefault(extent_name, []).append((oid, None))
+    for key, field_names in updates.iteritems():
+        if key in deletes or key in creates:
+            continue
+        extent_name, oid = key
+        extents.setdefault(extent_name, []).append((oid, field_names))
+    return sorted((extent_name, sorted(rows))
+                  for extent_name, rows in extents.iteritems())
+
+
+_noop_validation = WeakKeyDictionary()
+
+def _validation_is_noop(FieldClass):
+    """Return True if validating a value of `FieldClass` can never fail,
+    so that it may be skipped.  Fields that are calculated, or that use
+    the default validation with no constraints, are skipped."""
+    noop = _noop_validation.get(FieldClass)
+    if noop is None:
+        noop = _noop_validation[FieldClass] = (
+            FieldClass.fget is not None
+            or (FieldClass.validate.im_func is Field.validate.im_func
+                and not FieldClass.required
+                and FieldClass.valid_values is None
+                )
+            )
+    return noop
+
+
+def _writable_field_class(FieldClass):
+    """Return a writable subclass of `FieldClass`, used to convert
+    values to their _dump'd representation.
+
+    The subclass is created once and kept on `FieldClass`, since
+    creating field classes is expensive.
+    """
+    WritableField = FieldClass.__dict__.get('_writable_field_class')
+    if WritableField is None:
+        class WritableField(FieldClass):
+            readonly = False
+        FieldClass._writable_field_class = WritableField
+    return WritableField
+
+
+def _add_term_scores(scores, postings, total):
+    """Add the score of a term to `scores` for each entity in its
+    `postings`, out of `total` entities in the extent."""
+    weight = _log(1.0 + float(total) / len(postings))
+    for oid, count in postings.iteritems():
+        scores[oid] = scores.get(oid, 0.0) + count * weight
+
+
+def _aggregate_apply(aggregate, fields_by_id, sign):
+    """Add the contribution of an entity with `fields_by_id` to
+    `aggregate` if `sign` is 1, or remove it if `sign` is -1.
+
+    Each group of an aggregate is stored as a (count, total) tuple of
+    the number of values aggregated and their sum.  Groups are removed
+    when their count reaches zero.
+    """
+    kind, field_id, group_field_id = aggregate['spec']
+    if field_id is None:
+        amount = 0
+    else:
+        amount = fields_by_id.get(field_id, UNASSIGNED)
+        if amount is UNASSIGNED:
+            return
+        if kind == 'count':
+            amount = 0
+    if group_field_id is None:
+        key = None
+    else:
+        key = fields_by_id.get(group_field_id, UNASSIGNED)
+    groups = aggregate['groups']
+    count, total = groups.get(key, (0, 0))
+    count += sign
+    if count:
+        groups[key] = (count, total + sign * amount)
+    else:
+        del groups[key]
+
+
+def _aggregate_result(kind, state):
+    """Return the value of an aggregate of `kind` for a group stored as
+    `state`, which is None if the group has no values."""
+    if state is None:
+        if kind == 'avg':
+            return UNASSIGNED
+        return 0
+    count, total = state
+    if kind == 'count':
+        return count
+    elif kind == 'sum':
+        return total
+    else:
+        return total / float(count)
+
+
+def _aggregate_update(aggregate, fields_by_id, changed_fields_by_id):
+    """Update `aggregate` for an entity with `fields_by_id` whose
+    fields in `changed_fields_by_id` are changing."""
+    kind, field_id, group_field_id = aggregate['spec']
+    if (field_id not in changed_fields_by_id
+        and group_field_id not in changed_fields_by_id
+        ):
+        return
+    new_fields_by_id = {}
+    for f_id in (field_id, group_field_id):
+        if f_id is not None:
+            new_fields_by_id[f_id] = changed_fields_by_id.get(
+                f_id, fields_by_id.get(f_id, UNASSIGNED))
+    _aggregate_apply(aggregate, fields_by_id, -1)
+    _aggregate_apply(aggregate, new_fields_by_id, 1)
+
+
+def _btree_for(backend, role):
+    """Return a callable that creates BTrees for the given structure role,
+    or the backend's BTree class if it does not distinguish roles."""
+    btree_for = getattr(backend, 'btree_for', None)
+    if btree_for is None:
+        return backend.BTree
+    else:
+        return btree_for(role)
+
+
 def _create_index(extent_map, index_spec, unique, BTree, PList):
     """Create a new index in the extent with the given spec and
     uniqueness flag."""
@@ -1772,6 +3117,14 @@ def _create_index(extent_map, index_spec, unique, BTree, PList):
         2, 'normalized_index_map.keys()', list(normalized_index_map.keys()))
 
 
+def _criterion_extent(criterion):
+    """Return the extent of the fields in `criterion`."""
+    left = criterion.left
+    if isinstance(left, Expression):
+        return _criterion_extent(left)
+    return left._extent
+
+
 def _delete_index(extent_map, index_spec):
     indices = extent_map['indices']
     index_map = extent_map['index_map']
@@ -1792,6 +3145,35 @@ def _delete_index(extent_map, index_spec):
                 del normalized_index_map[normalized_spec]
 
 
+def _extreme_item(tree, maximum):
+    """Return the (key, value) item of `tree` with the maximum key if
+    `maximum` is True, or else with the minimum key."""
+    if maximum:
+        get_item = getattr(tree, 'get_max_item', None)
+    else:
+        get_item = getattr(tree, 'get_min_item', None)
+    if get_item is not None:
+        return get_item()
+    keys = tree.keys()
+    if maximum:
+        key = keys[-1]
+    else:
+        key = keys[0]
+    return key, tree[key]
+
+
+def _ordered_items(tree, backward):
+    """Return an iterator over the (key, value) items of `tree` in
+    descending order of key if `backward` is True, or else in ascending
+    order."""
+    if not backward:
+        return tree.iteritems()
+    items_backward = getattr(tree, 'items_backward', None)
+    if items_backward is not None:
+        return items_backward()
+    return reversed(tree.items())
+
+
 def _field_ids(extent_map, field_names):
     """Convert a (field-name, ...) tuple to a (field-id, ...)
     tuple for the given extent map."""
@@ -1806,17 +3188,53 @@ def _field_names(extent_map, field_ids):
     return tuple(field_id_name[id] for id in field_ids)
 
 
-def _index_add(extent_map, index_spec, relaxed, oid, field_values, BTree):
+def _fulltext_counts(fulltext_index, fields_by_id):
+    """Return a dictionary of the number of times each term occurs in
+    the fields of `fulltext_index` in `fields_by_id`."""
+    return term_counts(fields_by_id.get(field_id, UNASSIGNED)
+                       for field_id in fulltext_index['field_ids'])
+
+
+def _fulltext_index_add(fulltext_index, oid, counts, LeafBTree):
+    """Add the term `counts` of entity `oid` to `fulltext_index`.
+    Missing posting lists are created using `LeafBTree`."""
+    terms = fulltext_index['terms']
+    for term, count in counts.iteritems():
+        postings = terms.get(term)
+        if postings is None:
+            postings = terms[term] = LeafBTree()
+        postings[oid] = count
+
+
+def _fulltext_index_remove(fulltext_index, oid, counts):
+    """Remove the terms in `counts` of entity `oid` from
+    `fulltext_index`."""
+    terms = fulltext_index['terms']
+    for term in counts:
+        postings = terms.get(term)
+        if postings is not None and oid in postings:
+            del postings[oid]
+            if not postings:
+                del terms[term]
+
+
+def _index_add(extent_map, index_spec, relaxed, oid, field_values, BTree,
+               LeafBTree):
     """Add an entry to the specified index, of entity oid having the
-    given values in order of the index spec."""
+    given values in order of the index spec.  Missing branches are
+    created using `BTree`, and a missing leaf using `LeafBTree`."""
     indices = extent_map['indices']
     unique, branch = indices[index_spec]
+    last = len(index_spec) - 1
     # Traverse branches to find a leaf.
-    for field_id, field_value in zip(index_spec, field_values):
+    for position, field_value in enumerate(field_values):
         if field_value in branch:
             branch = branch[field_value]
         else:
-            new_branch = BTree()
+            if position == last:
+                new_branch = LeafBTree()
+            else:
+                new_branch = BTree()
             branch[field_value] = new_branch
             branch = new_branch
     # Raise error if unique index and not an empty leaf.
@@ -1870,16 +3288,21 @@ def _index_remove(extent_map, index_spec, oid, field_values):
     _index_clean(extent_map, index_spec, field_values)
 
 
-def _index_validate(extent_map, index_spec, oid, field_values, BTree):
+def _index_validate(extent_map, index_spec, oid, field_values, BTree,
+                    LeafBTree):
     """Validate the index entry for uniqueness."""
     indices = extent_map['indices']
     unique, branch = indices[index_spec]
+    last = len(index_spec) - 1
     # Traverse branches to find a leaf.
-    for field_id, field_value in zip(index_spec, field_values):
+    for position, field_value in enumerate(field_values):
         if field_value in branch:
             branch = branch[field_value]
         else:
-            new_branch = BTree()
+            if position == last:
+                new_branch = LeafBTree()
+            else:
+                new_branch = BTree()
             branch[field_value] = new_branch
             branch = new_branch
     # Raise error if unique index and not an empty leaf.
@@ -1892,6 +3315,65 @@ def _index_validate(extent_map, index_spec, oid, field_values, BTree):
             )
 
 
+def _items_from(tree, key):
+    """Return an iterator of the items of `tree` with keys greater than
+    or equal to `key`, in order."""
+    items_from = getattr(tree, 'items_from', None)
+    if items_from is not None:
+        return items_from(key)
+    return ((k, v) for k, v in tree.iteritems() if not k < key)
+
+
+def _join_back(entities, link_key):
+    """Return a function returning the OIDs of the entities linking to
+    the entity with a given OID in `entities` through `link_key`."""
+    def follow(oid):
+        entity_map = entities.get(oid)
+        if entity_map is None:
+            return ()
+        return entity_map['links'].get(link_key, ())
+    return follow
+
+
+def _join_forward(entities, field_id, extent_id):
+    """Return a function returning the OIDs of the entities in the
+    extent with `extent_id` that the field with `field_id` of the
+    entity with a given OID in `entities` refers to."""
+    def follow(oid):
+        entity_map = entities.get(oid)
+        if entity_map is None:
+            return ()
+        value = entity_map['fields'].get(field_id, UNASSIGNED)
+        return [placeholder.oid for placeholder in _placeholders(value)
+                if placeholder.extent_id == extent_id]
+    return follow
+
+
+def _join_rows(rows, steps):
+    """Return an iterator of `rows` extended by the OIDs each of
+    `steps` returns for the last OID of a row."""
+    if not steps:
+        for row in rows:
+            yield row
+        return
+    follow = steps[0]
+    rest = steps[1:]
+    for row in rows:
+        extended = [row + (oid, ) for oid in follow(row[-1])]
+        for joined in _join_rows(extended, rest):
+            yield joined
+
+
+def _label_is_tracked(value):
+    """Return True if the label of default key field `value` depends on
+    no entities, or only on one whose label is built by
+    `Database._entity_label`."""
+    if isinstance(value, Entity):
+        return (type(value).__unicode__ == Entity.__unicode__
+                and bool(value._default_key))
+    return not isinstance(value, (tuple, list, set, frozenset))
+
+
 def _normalized_index_specs(index_specs):
     """Return normalized index specs based on index_specs."""
     return [tuple(sorted(spec)) for spec in index_specs]
@@ -1902,6 +3384,44 @@ def _partial_index_specs(index_spec):
     return [tuple(index_spec[:x+1]) for x in xrange(len(index_spec))]
 
 
+def _placeholders(value):
+    """Return an iterator of the placeholders in an entity field
+    `value`, which may be a placeholder or a collection of them."""
+    if isinstance(value, Placeholder):
+        yield value
+    elif isinstance(value, (tuple, list, set, frozenset)):
+        for item in value:
+            for placeholder in _placeholders(item):
+                yield placeholder
+
+
+def _rank(item):
+    """Return the sort key of an (oid, score) search result."""
+    oid, score = item
+    return (-score, oid)
+
+
+def _text_index_add(text_index, oid, value, LeafBTree):
+    """Add the trigrams of `value` for entity `oid` to `text_index`.
+    Missing posting lists are created using `LeafBTree`."""
+    for term in trigrams(value):
+        oids = text_index.get(term)
+        if oids is None:
+            oids = text_index[term] = LeafBTree()
+        oids[oid] = None
+
+
+def _text_index_remove(text_index, oid, value):
+    """Remove the trigrams of `value` for entity `oid` from
+    `text_index`."""
+    for term in trigrams(value):
+        oids = text_index.get(term)
+        if oids is not None and oid in oids:
+            del oids[oid]
+            if not oids:
+                del text_index[term]
+
+
 def _walk_index(branch, ascending_seq, result_list):
     """Recursively walk a branch of an index, appending OIDs found to
     result_list.
@@ -1991,6 +3511,80 @@ def convert_from_format1(backend):
     schevo['format'] = 2
 
 
+def repack_btrees(backend):
+    """Rewrite the BTrees of a format 2 database so that their nodes use
+    the degrees the backend is configured with for each structure role.
+
+    - `backend`: Open backend connection to the database to repack.
+      Backends that do not provide `btree_for` are left untouched.
+    """
+    if getattr(backend, 'btree_for', None) is None:
+        return
+    EntitiesBTree = backend.btree_for('entities')
+    IndexBTree = backend.btree_for('index_branches')
+    IndexLeafBTree = backend.btree_for('index_leaves')
+    LinksBTree = backend.btree_for('links')
+    root = backend.get_root()
+    extents = root['SCHEVO']['extents']
+    # For each extent in the database...
+    for extent_id, extent in extents.iteritems():
+        assert log(1, 'Repacking', extent['name'])
+        entities = extent['entities'] = _repack_btree(
+            extent['entities'], EntitiesBTree)
+        # For each entity in the extent...
+        for entity_oid, entity in entities.iteritems():
+            links = entity['links']
+            for key, link_tree in list(links.iteritems()):
+                links[key] = _repack_btree(link_tree, LinksBTree)
+        # For each index...
+        indices = extent['indices']
+        for index_spec, (unique, index_tree) in list(indices.iteritems()):
+            index_tree = _repack_index(
+                index_tree, len(index_spec), IndexBTree, IndexLeafBTree)
+            indices[index_spec] = (unique, index_tree)
+        # For each text index...
+        text_indices = extent.get('text_indices')
+        if text_indices:
+            for field_id, text_index in list(text_indices.iteritems()):
+                text_indices[field_id] = _repack_index(
+                    text_index, 1, IndexBTree, IndexLeafBTree)
+        # And the full-text index.
+        fulltext_index = extent.get('fulltext_index')
+        if fulltext_index is not None:
+            fulltext_index['terms'] = _repack_index(
+                fulltext_index['terms'], 1, IndexBTree, IndexLeafBTree)
+        # And materialized aggregates.
+        aggregates = extent.get('aggregates')
+        if aggregates:
+            for aggregate in aggregates.itervalues():
+                aggregate['groups'] = _repack_btree(
+                    aggregate['groups'], IndexBTree)
+
+
+def _repack_btree(tree, BTree):
+    """Return `tree`, or a copy of it created by `BTree` if its nodes are
+    of a different class than those `BTree` creates."""
+    if tree.root.__class__ is BTree.node_constructor:
+        return tree
+    new_tree = BTree()
+    add = new_tree.add
+    for key, value in tree.iteritems():
+        add(key, value)
+    return new_tree
+
+
+def _repack_index(tree, depth, BTree, LeafBTree):
+    """Recursively repack an index tree `depth` levels above its leaves."""
+    if depth == 0:
+        return _repack_btree(tree, LeafBTree)
+    tree = _repack_btree(tree, BTree)
+    for key, child_tree in tree.items():
+        new_child_tree = _repack_index(child_tree, depth - 1, BTree, LeafBTree)
+        if new_child_tree is not child_tree:
+            tree[key] = new_child_tree
+    return tree
+
+
 def _convert_index_from_format1(entity_field_ids, index_spec, index_tree):
     current_field_id, next_index_spec = index_spec[0], index_spec[1:]
     is_entity_field = current_field_id in entity_field_ids
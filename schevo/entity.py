@@ -8,6 +8,7 @@ from schevo.lib import optimize
 
 from functools import wraps
 import inspect
+import threading
 
 from schevo import base
 from schevo.constant import UNASSIGNED
@@ -29,6 +30,65 @@ from schevo import transaction
 from schevo import view
 
 
+# Kinds of materialized aggregates, by the functions that name them.
+_aggregate_kinds = {
+    sum: 'sum',
+    'sum': 'sum',
+    len: 'count',
+    'count': 'count',
+    'avg': 'avg',
+    }
+
+
+# Attributes of entity classes that are set up when first gotten.
+_deferred_names = [
+    '_GenericUpdate',
+    '_q_instancemethod_names',
+    '_q_selectionmethod_names',
+    '_t_instancemethod_names',
+    '_t_selectionmethod_names',
+    '_v_instancemethod_names',
+    '_v_selectionmethod_names',
+    '_x_instancemethod_names',
+    '_x_selectionmethod_names',
+    ]
+
+# Classes whose subclasses are set up as attributes of entity classes
+# when first gotten.
+_deferred_classes = (base.Transaction, base.View)
+
+# Lock acquired while setting up entity classes.
+_setup_lock = threading.RLock()
+
+
+class _DeferredSetup(object):
+    """Attribute of an entity class that finishes setting up the class
+    when first gotten, then gets the attribute that replaces it."""
+
+    __slots__ = ['EntityClass', 'name']
+
+    def __init__(self, EntityClass, name):
+        self.EntityClass = EntityClass
+        self.name = name
+
+    def __get__(self, instance, owner):
+        EntityClass = self.EntityClass
+        EntityClass.setup_deferred()
+        originals = EntityClass.__dict__.get('_setting_up')
+        if originals is not None:
+            # This thread is setting up the class, which has not yet
+            # replaced this attribute, so get what it replaces.
+            name = self.name
+            if name in originals:
+                return originals[name]
+            if instance is None:
+                return getattr(super(EntityClass, owner), name)
+            return getattr(super(EntityClass, instance), name)
+        if instance is None:
+            return getattr(owner, self.name)
+        return getattr(instance, self.name)
+
+
 class EntityMeta(type):
     """Convert field definitions to a field specification ordered
     dictionary."""
@@ -36,9 +96,31 @@ class EntityMeta(type):
     def __new__(cls, class_name, bases, class_dict):
         # Only do something if creating an Entity subclass.
         if class_name != 'Entity':
-            class_dict['__slots__'] = bases[0].__slots__
+            # Instances only use the slots already defined by Entity;
+            # defining them again would give each instance unused
+            # copies of them.
+            class_dict['__slots__'] = ()
         return type.__new__(cls, class_name, bases, class_dict)
 
+    def __call__(cls, oid):
+        """Return the live instance of this class for `oid` if there is
+        one, or a new instance.
+
+        An instance with `_value_transforms` set is not shared with
+        later callers, who get a new instance instead.
+        """
+        identities = cls._identities
+        if identities is None:
+            return type.__call__(cls, oid)
+        entity = identities.get(oid)
+        if entity is None or entity._value_transforms is not None:
+            entity = identities[oid] = type.__call__(cls, oid)
+        else:
+            # Fields cached by the `f` namespace may have values from
+            # before the entity was last changed.
+            entity._f = None
+        return entity
+
     def __init__(cls, class_name, bases, class_dict):
         # Only do something if creating a subclass of Entity.
         type.__init__(cls, class_name, bases, class_dict)
@@ -56,6 +138,106 @@ class EntityMeta(type):
         cls.setup_fields()
         # Get slotless specs for queries, transactions and views.
         spec = field_spec_from_class(cls, class_dict)
+        # Normalize hidden information.
+        cls._hidden_actions = set(cls._hidden_actions)
+        cls._hidden_queries = set(cls._hidden_queries)
+        cls._hidden_views = set(cls._hidden_views)
+        # Setup key spec.
+        cls.setup_key_spec()
+        # Setup index spec.
+        cls.setup_index_spec()
+        # Setup text index spec.
+        cls.setup_text_index_spec()
+        # Setup full-text index spec.
+        cls.setup_fulltext_index_spec()
+        # Setup materialized aggregate spec.
+        cls.setup_aggregate_spec()
+        # Keep them from clashing.
+        cls.validate_key_and_index_specs()
+        if not class_name.startswith('_'):
+            # Assign labels if class name is "public".
+            cls.assign_labels(class_name, class_dict)
+        # Defer setting up transactions, views, and method names
+        # until they are first gotten.
+        cls.defer_setup(bases, class_dict, spec)
+        # Add this class to the schema.
+        cls.update_schema(class_name)
+
+    def defer_setup(cls, bases, class_dict, spec):
+        """Replace the attributes set up by `setup_deferred` with
+        `_DeferredSetup` descriptors, which call it when first gotten."""
+        names = set(_deferred_names)
+        for klass in cls.__mro__:
+            for name, attr in klass.__dict__.iteritems():
+                if (isinstance(attr, _DeferredSetup)
+                    or (isinstance(attr, type)
+                        and issubclass(attr, _deferred_classes))
+                    ):
+                    names.add(name)
+        originals = {}
+        class_attrs = cls.__dict__
+        for name in names:
+            if name in class_attrs:
+                originals[name] = class_attrs[name]
+            setattr(cls, name, _DeferredSetup(cls, name))
+        cls._deferred_setup = (names, originals, bases, class_dict, spec)
+
+    def setup_deferred(cls):
+        """Set up transactions, views, and method names, if that was
+        deferred by `defer_setup`.
+
+        Other threads get the attributes without taking the lock, so
+        each `_DeferredSetup` stays in place until the attribute that
+        replaces it is set, and is only then removed if nothing did.
+        """
+        _setup_lock.acquire()
+        try:
+            deferred = cls.__dict__.get('_deferred_setup')
+            if deferred is None or cls.__dict__.get('_setting_up') is not None:
+                # Already set up, perhaps by another thread, or being
+                # set up by this one.
+                return
+            names, originals, bases, class_dict, spec = deferred
+            cls._setting_up = originals
+            try:
+                for base_class in bases:
+                    if isinstance(base_class, EntityMeta):
+                        base_class.setup_deferred()
+                cls._setup_deferred(cls.__name__, bases, class_dict, spec)
+                class_attrs = cls.__dict__
+                for name in names:
+                    attr = class_attrs.get(name)
+                    if (isinstance(attr, _DeferredSetup)
+                        and attr.EntityClass is cls
+                        ):
+                        if name in originals:
+                            setattr(cls, name, originals[name])
+                        else:
+                            delattr(cls, name)
+                cls._deferred_setup = None
+            finally:
+                del cls._setting_up
+            transaction_db = cls._transaction_db
+            if transaction_db is not None:
+                cls.decorate_transactions(transaction_db)
+        finally:
+            _setup_lock.release()
+
+    def decorate_transactions(cls, db):
+        """Decorate the transaction classes of this class with `db`, or
+        remember to do so once they are set up."""
+        _setup_lock.acquire()
+        try:
+            cls._transaction_db = db
+            if cls.__dict__.get('_deferred_setup') is None:
+                for v in cls.__dict__.itervalues():
+                    if (inspect.isclass(v)
+                        and issubclass(v, transaction.Transaction)):
+                        v._db = db
+        finally:
+            _setup_lock.release()
+
+    def _setup_deferred(cls, class_name, bases, class_dict, spec):
         q_spec = spec.copy()
         t_spec = spec.copy()
         v_spec = spec.copy()
@@ -78,19 +260,6 @@ class EntityMeta(type):
             cls.setup_transactions(class_name, class_dict, t_spec)
             # Setup view classes.
             cls.setup_views(class_name, bases, class_dict, v_spec)
-        # Normalize hidden information.
-        cls._hidden_actions = set(cls._hidden_actions)
-        cls._hidden_queries = set(cls._hidden_queries)
-        cls._hidden_views = set(cls._hidden_views)
-        # Setup key spec.
-        cls.setup_key_spec()
-        # Setup index spec.
-        cls.setup_index_spec()
-        # Keep them from clashing.
-        cls.validate_key_and_index_specs()
-        if not class_name.startswith('_'):
-            # Assign labels if class name is "public".
-            cls.assign_labels(class_name, class_dict)
         # Remember queries for the EntityQueries namespace.
         prefix = 'q_'
         cls._q_instancemethod_names = cls.get_method_names(
@@ -115,8 +284,6 @@ class EntityMeta(type):
             prefix, isinstancemethod)
         cls._x_selectionmethod_names = cls.get_method_names(
             prefix, isselectionmethod)
-        # Add this class to the schema.
-        cls.update_schema(class_name)
 
     def assign_labels(cls, class_name, class_dict):
         # Assign labels for the class/extent.
@@ -195,6 +362,38 @@ class EntityMeta(type):
             setattr(cls, field_name, property(fget=get_field_value))
         cls._fget_fields = tuple(fget_fields)
 
+    def setup_aggregate_spec(cls):
+        # Create the materialized aggregate spec.
+        aggregates = dict((spec[0], spec) for spec in cls._aggregate_spec)
+        for name, function, field_def, group_def in (
+            cls._aggregate_spec_additions):
+            kind = _aggregate_kinds.get(function)
+            if kind is None:
+                raise ValueError(
+                    'Aggregate %r of %s uses unsupported function %r.'
+                    % (name, cls.__name__, function))
+            # Get just the names from field definitions.
+            # Note that field_def and group_def could be strings.
+            field_name = getattr(field_def, 'name', field_def)
+            group_by = getattr(group_def, 'name', group_def)
+            if field_name is None and kind != 'count':
+                raise ValueError(
+                    'Aggregate %r of %s needs a field to aggregate.'
+                    % (name, cls.__name__))
+            aggregates[name] = (name, kind, field_name, group_by)
+        cls._aggregate_spec = tuple(sorted(aggregates.itervalues()))
+        cls._aggregate_spec_additions = ()
+
+    def setup_fulltext_index_spec(cls):
+        # Create the full-text index spec.
+        fulltext_index_set = set(cls._fulltext_index_spec)
+        for field_def in cls._fulltext_index_spec_additions:
+            # Get just the name from the field definition.
+            # Note that field_def could be a string.
+            fulltext_index_set.add(getattr(field_def, 'name', field_def))
+        cls._fulltext_index_spec = tuple(sorted(fulltext_index_set))
+        cls._fulltext_index_spec_additions = ()
+
     def setup_index_spec(cls):
         # Create the index spec.
         index_set = set(cls._index_spec)
@@ -222,6 +421,16 @@ class EntityMeta(type):
         cls._key_spec = tuple(key_set)
         cls._key_spec_additions = ()
 
+    def setup_text_index_spec(cls):
+        # Create the text index spec.
+        text_index_set = set(cls._text_index_spec)
+        for field_def in cls._text_index_spec_additions:
+            # Get just the name from the field definition.
+            # Note that field_def could be a string.
+            text_index_set.add(getattr(field_def, 'name', field_def))
+        cls._text_index_spec = tuple(sorted(text_index_set))
+        cls._text_index_spec_additions = ()
+
     def setup_transactions(cls, class_name, class_dict, t_spec):
         """Create standard transaction classes."""
         # Fields in a transaction class defined in the schema appear
@@ -230,7 +439,8 @@ class EntityMeta(type):
             # Skip namespace names so we do not access them.
             if len(name) == 1 or name == 'sys':
                 continue
-            OldClass = getattr(cls, name)
+            # Attributes still deferred may have nothing to replace.
+            OldClass = getattr(cls, name, None)
             if not isinstance(OldClass, type):
                 continue
             if not issubclass(OldClass, (transaction.Create,
@@ -331,7 +541,8 @@ class Entity(base.Entity, LabelMixin):
     __metaclass__ = EntityMeta
 
     __slots__ = LabelMixin.__slots__ + [
-        '_oid', '_value_transforms', '_f', '_m', '_q', '_s', '_t', '_v', '_x']
+        '_oid', '_value_transforms', '_f', '_m', '_q', '_s', '_t', '_v', '_x',
+        '__weakref__']
 
     # Namespaces.
     f = namespaceproperty('f', cls=entityns.EntityClassFields,
@@ -356,6 +567,19 @@ class Entity(base.Entity, LabelMixin):
     # The database instance associated with this Entity type.
     _db = None
 
+    # Arguments for setting up transactions, views, and method names
+    # when they are first gotten, or None once they are set up.
+    _deferred_setup = None
+
+    # The database to decorate transaction classes with once they are
+    # set up.
+    _transaction_db = None
+
+    # Materialized aggregates of the related extent, as (name, kind,
+    # field_name, group_by) tuples.
+    _aggregate_spec = ()
+    _aggregate_spec_additions = ()      # Used during subclassing.
+
     # The first _key() specification defined.
     _default_key = None
 
@@ -369,6 +593,14 @@ class Entity(base.Entity, LabelMixin):
     # Field specification for this type of Entity.
     _field_spec = FieldSpecMap()
 
+    # Weak mapping of OIDs to the live instances of this type, or None
+    # if instances are not shared.
+    _identities = None
+
+    # Names of fields whose words are searchable in the related extent.
+    _fulltext_index_spec = ()
+    _fulltext_index_spec_additions = () # Used during subclassing.
+
     # True if typically hidden from a top-level view of the database
     # in a UI.
     _hidden = False
@@ -402,6 +634,10 @@ class Entity(base.Entity, LabelMixin):
     # Sample entity instances to optionally create in a new database.
     _sample = []
 
+    # Names of fields with trigram text indices in the related extent.
+    _text_index_spec = ()
+    _text_index_spec_additions = ()     # Used during subclassing.
+
     # Name of the class in the previous schema version, or None if not
     # being renamed.
     _was = None
@@ -472,10 +708,8 @@ class Entity(base.Entity, LabelMixin):
         return str(unicode(self).encode('utf8'))
 
     def __unicode__(self):
-        key = self._default_key
-        if key:
-            return u' :: '.join([unicode(getattr(self.f, name))
-                                 for name in key])
+        if self._default_key:
+            return self._db._entity_label(self)
         else:
             return repr(self)
 
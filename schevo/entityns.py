@@ -225,23 +225,12 @@ class EntitySys(NamespaceExtension):
         callable objects specified in `filters`."""
         i = self._i
         db = i._db
-        stored_values = i._db._entity_fields(i._extent.name, i._oid)
-        entity_field_map = i._field_spec.field_map(i, stored_values)
-        # Remove fields that should not be included.
-        new_fields = entity_field_map.itervalues()
-        for filt in filters:
-            new_fields = [field for field in new_fields if filt(field)]
-        entity_field_map = FieldMap(
-            (field.name, field) for field in new_fields)
-        for field in entity_field_map.itervalues():
-            if field.fget is not None:
-                # Update fields that have fget callables.
-                value = field.fget[0](i)
-            else:
-                # Allow fields to restore themselves from a stored
-                # value.
-                field._restore(db)
-        return entity_field_map
+        stored_values = db._entity_fields(i._extent.name, i._oid)
+        # Fields that should not be included are not created.  Other
+        # fields are created, restored from their stored values, and
+        # calculated when first gotten.
+        return i._field_spec.field_map(
+            i, stored_values, restore_db=db, filters=filters)
 
     def links(self, other_extent_name=None, other_field_name=None):
         """Return dictionary of (extent_name, field_name): entity_list
@@ -12,6 +12,19 @@ class Restricted(RuntimeError):
     """The attempted operation was restricted."""
 
 
+class AggregateDoesNotExist(KeyError):
+    """An aggregate does not exist."""
+
+    def __init__(self, extent_name, aggregate_name):
+        message = (
+            'Aggregate %r not found in extent %r.'
+            % (aggregate_name, extent_name)
+            )
+        KeyError.__init__(self, message)
+        self.extent_name = extent_name
+        self.aggregate_name = aggregate_name
+
+
 class BackendConflictError(RuntimeError):
     """Transaction could not be executed; too many backend conflict errors."""
 
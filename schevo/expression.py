@@ -46,4 +46,30 @@ class Expression(object):
                 'Not a single-extent field equality intersection criteria.')
 
 
+class Parameter(object):
+    """A named value to be bound when executing a prepared query.
+
+    See `schevo.extent.Extent.prepare`.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return '<Parameter %r>' % self.name
+
+
+def bind(criterion, params):
+    """Return a copy of `criterion` with each `Parameter` replaced by
+    its value in the `params` dictionary."""
+    left, right = criterion.left, criterion.right
+    if isinstance(left, Expression):
+        left = bind(left, params)
+    if isinstance(right, Expression):
+        right = bind(right, params)
+    elif isinstance(right, Parameter):
+        right = params[right.name]
+    return Expression(left, criterion.op, right)
+
+
 optimize.bind_all(sys.modules[__name__])  # Last line of module.
@@ -6,10 +6,13 @@
 import sys
 from schevo.lib import optimize
 
+from weakref import WeakValueDictionary
+
 from schevo import base
 from schevo.entity import Entity
 from schevo.error import EntityDoesNotExist
 from schevo.error import FindoneFoundMoreThanOne
+from schevo.expression import Expression, Parameter, bind
 from schevo.introspect import isextentmethod, isselectionmethod
 from schevo.namespace import NamespaceExtension
 from schevo.query import ResultsIterator, ResultsList
@@ -22,6 +25,7 @@ class Extent(base.Extent):
         # Decorate the EntityClass.
         EntityClass._db = db
         EntityClass._extent = self
+        EntityClass._identities = WeakValueDictionary()
         # Decorate the extent.
         self.__doc__ = EntityClass.__doc__
         self.hidden = EntityClass._hidden
@@ -46,6 +50,8 @@ class Extent(base.Extent):
         self._label = EntityClass._label
         self._plural = EntityClass._plural
         self._relax = db._relax_index
+        self._search = db._search_entity_oids
+        self._sorted = db._sorted_entity_oids
         # Attach extent to each field class.
         for field_name, field_class in self.field_spec.iteritems():
             field_class._extent = self
@@ -123,6 +129,15 @@ class Extent(base.Extent):
         code += ',\n    ]'
         return code
 
+    def aggregate(self, name, *group):
+        """Return the value of the named materialized aggregate.
+
+        If the aggregate is grouped, give the value of the grouped field
+        to return the aggregate of that group, or give no value to
+        return a dictionary of the aggregate of each group.
+        """
+        return self.db._aggregate_value(self.name, name, *group)
+
     def by(self, *index_spec):
         """Return an iterator of entities sorted by index_spec."""
         Entity = self.EntityClass
@@ -154,12 +169,28 @@ class Extent(base.Extent):
         self._enforce(self.name, *index_spec)
 
     def find(self, *criteria, **equality_criteria):
-        """Return list of entities matching given field value(s)."""
+        """Return list of entities matching given field value(s).
+
+        Give a `prefetch` keyword argument of a dotted field path, or a
+        tuple of them, to also restore the entities those entity fields
+        refer to in one batch; see `ResultsList.prefetch`.  If the
+        extent has a field named `prefetch`, the keyword argument is a
+        criterion for that field instead.
+        """
+        if 'prefetch' in self.field_spec:
+            prefetch = ()
+        else:
+            prefetch = equality_criteria.pop('prefetch', ())
+        if isinstance(prefetch, basestring):
+            prefetch = (prefetch, )
         criterion = self._scrub_criteria(criteria, equality_criteria)
         # Get OIDs from database and return entity instances.
         Entity = self.EntityClass
-        return ResultsList(
+        results = ResultsList(
             Entity(oid) for oid in self._find(self.name, criterion))
+        if prefetch:
+            results.prefetch(*prefetch)
+        return results
 
     def find_oids(self, *criteria, **equality_criteria):
         """Return list of OIDs matching given field value(s)."""
@@ -181,6 +212,13 @@ class Extent(base.Extent):
         else:
             raise FindoneFoundMoreThanOne(self.name, criteria)
 
+    def prepare(self, *criteria, **equality_criteria):
+        """Return a `PreparedQuery` for entities matching given field
+        value(s), any of which may be a `Parameter` whose value is given
+        when executing the query."""
+        criterion = self._scrub_criteria(criteria, equality_criteria)
+        return PreparedQuery(self, criterion)
+
     @property
     def next_oid(self):
         return self.db._extent_next_oid(self.name)
@@ -200,6 +238,133 @@ class Extent(base.Extent):
         for index_spec in self.key_spec:
             self.relax_index(*index_spec)
 
+    def search(self, query, limit=None):
+        """Return list of entities whose full-text indexed fields match
+        `query`, best matches first.
+
+        Words in `query` must all match unless separated by ``OR``.  A
+        word ending with ``*`` matches any word that starts with it.
+        If `limit` is given, return at most that many entities.
+        """
+        Entity = self.EntityClass
+        return ResultsList(
+            Entity(oid) for oid in self._search(self.name, query, limit))
+
+    def sorted(self, by=None):
+        """Return list of entities sorted by the field names in `by`, or
+        by the default key if `by` is not given.
+
+        As with `by`, a field name may be prefixed with '-' to sort in
+        descending order.  Entity fields sort by the default order of
+        the entities they refer to, as when comparing entities.
+        """
+        if isinstance(by, basestring):
+            by = (by, )
+        Entity = self.EntityClass
+        return ResultsList(
+            Entity(oid) for oid in self._sorted(self.name, by))
+
+
+class PreparedQuery(object):
+    """A query for entities in an extent, prepared once by
+    `Extent.prepare` and executed many times with parameter values
+    given as keyword arguments.
+
+    Field equality queries are planned when prepared, so that each
+    execution only converts the parameter values and searches the
+    chosen index.  The plan is renewed if the database is synchronized
+    with a schema.
+    """
+
+    def __init__(self, extent, criterion):
+        self.criterion = criterion
+        self.parameter_names = frozenset(_parameter_names(criterion))
+        self._db = extent.db
+        self._extent_name = extent.name
+        self._compile()
+
+    def __call__(self, **params):
+        """Return list of entities matching the query."""
+        oids = self.oids(**params)
+        Entity = self._extent.EntityClass
+        return ResultsList(Entity(oid) for oid in oids)
+
+    def __repr__(self):
+        return '<PreparedQuery on %r with %s>' % (
+            self._extent_name, ', '.join(sorted(self.parameter_names)))
+
+    def count(self, **params):
+        """Return count of entities matching the query."""
+        return len(self.oids(**params))
+
+    def findone(self, **params):
+        """Return single entity matching the query."""
+        results = self.oids(**params)
+        count = len(results)
+        if count == 1:
+            return self._extent.EntityClass(list(results)[0])
+        elif count == 0:
+            return None
+        else:
+            raise FindoneFoundMoreThanOne(
+                self._extent_name, (self.criterion, ))
+
+    def oids(self, **params):
+        """Return sequence of OIDs matching the query."""
+        if frozenset(params) != self.parameter_names:
+            raise TypeError('Expected values for parameters %s; got %s.' % (
+                sorted(self.parameter_names), sorted(params)))
+        db = self._db
+        if self._sync_count != db._sync_count:
+            self._compile()
+        plan = self._plan
+        if plan is not None:
+            values = []
+            for value in self._values:
+                if isinstance(value, Parameter):
+                    value = params[value.name]
+                values.append(value)
+            return db._find_entity_oids_planned(
+                self._extent_name, plan, values)
+        criterion = self.criterion
+        if params:
+            criterion = bind(criterion, params)
+        return db._find_entity_oids(self._extent_name, criterion)
+
+    def _compile(self):
+        db = self._db
+        self._sync_count = db._sync_count
+        self._extent = db.extent(self._extent_name)
+        self._plan = None
+        self._values = None
+        criterion = self.criterion
+        if criterion is None:
+            return
+        try:
+            criteria = criterion.single_extent_field_equality_criteria()
+        except ValueError:
+            # Evaluated as a general criterion upon execution.
+            return
+        field_name_value = dict(
+            (FieldClass.name, value)
+            for FieldClass, value in criteria.iteritems()
+            )
+        field_names = tuple(sorted(field_name_value))
+        self._plan = db._equality_plan(self._extent_name, field_names)
+        self._values = [field_name_value[name] for name in field_names]
+
+
+def _parameter_names(criterion):
+    """Return a list of names of parameters used in `criterion`."""
+    names = []
+    if criterion is not None:
+        for operand in (criterion.left, criterion.right):
+            if isinstance(operand, Expression):
+                names.extend(_parameter_names(operand))
+            elif isinstance(operand, Parameter):
+                names.append(operand.name)
+    return names
+
 
 class ExtentExtenders(NamespaceExtension):
     """Methods that extend the functionality of an extent."""
@@ -6,29 +6,57 @@
 import sys
 from schevo.lib import optimize
 
+from itertools import izip
 from warnings import warn
 
 from schevo.constant import UNASSIGNED
 from schevo.label import label_from_name
+from schevo.lib.cdict import cdict, KeyOrder
 from schevo.lib.odict import odict
 
 
-class FieldMap(odict):
-    """Field Mapping based on Ordered Dictionary."""
+class FieldMap(cdict):
+    """Field Mapping based on Compact Ordered Dictionary.
 
-    __slots__ = ['_keys']
+    A field may be given as None, in which case it is created by calling
+    `make_field` with its name when first gotten.
+    """
+
+    __slots__ = ['_order', '_values', '_make_field']
+
+    def __init__(self, seq=None, make_field=None, order=None, values=None):
+        cdict.__init__(self, seq, order, values)
+        self._make_field = make_field
+
+    def __getitem__(self, name):
+        position = self._order.positions[name]
+        field = self._values[position]
+        if field is None:
+            field = self._values[position] = self._make_field(name)
+        return field
+
+    def iteritems(self):
+        return izip(self._order.keys, self.itervalues())
+
+    def itervalues(self):
+        names = self._order.keys
+        values = self._values
+        for position, field in enumerate(values):
+            if field is None:
+                field = values[position] = self._make_field(names[position])
+            yield field
 
     def dump_map(self):
         """Return a dictionary of field_name:dumped_value pairs."""
         d = odict()
-        for name, field in self.items():
+        for name, field in self.iteritems():
             d[name] = field._dump()
         return d
 
     def related_entity_map(self):
         """Return a dictionary of field_name:related_entity_set pairs."""
         d = odict()
-        for name, field in self.items():
+        for name, field in self.iteritems():
             if field.may_store_entities:
                 d[name] = field._entities_in_value()
         return d
@@ -45,7 +73,7 @@ class FieldMap(odict):
     def value_map(self):
         """Return a dictionary of field_name:field_value pairs."""
         d = odict()
-        for name, field in self.items():
+        for name, field in self.iteritems():
             # Do not use field.get() here because we want the value to
             # be stored in the database, not the value that is exposed
             # to users.
@@ -57,9 +85,19 @@ class FieldMap(odict):
 
 
 class FieldSpecMap(odict):
-    """Field spec mapping based on Ordered Dictionary."""
+    """Field spec mapping based on Ordered Dictionary.
+
+    The field names and classes are compiled into a shared `KeyOrder`
+    and a tuple when first needed by `field_map`, and compiled again
+    after the field spec is changed.
+    """
+
+    __slots__ = ['_keys', '_compiled', '_orders']
 
-    __slots__ = ['_keys']
+    def __init__(self, seq=None):
+        odict.__init__(self, seq)
+        self._compiled = None
+        self._orders = {}
 
     def __call__(self, *filters):
         """Return FieldSpecMap instance based on self, filtered by optional
@@ -72,12 +110,91 @@ class FieldSpecMap(odict):
                 ]
         return FieldSpecMap(new_fields)
 
-    def field_map(self, instance=None, values={}):
-        """Return a FieldMap based on field specifications."""
-        pairs = [(name, FieldClass(instance=instance,
-                                   value=values.get(name, UNASSIGNED)))
-                 for name, FieldClass in self.iteritems()]
-        return FieldMap(pairs)
+    def __delitem__(self, key):
+        self._compiled = None
+        odict.__delitem__(self, key)
+
+    def __setitem__(self, key, item):
+        self._compiled = None
+        odict.__setitem__(self, key, item)
+
+    def clear(self):
+        self._compiled = None
+        odict.clear(self)
+
+    def insert(self, index, key, item):
+        self._compiled = None
+        odict.insert(self, index, key, item)
+
+    def pop(self, key, *failobj):
+        self._compiled = None
+        return odict.pop(self, key, *failobj)
+
+    def popitem(self):
+        self._compiled = None
+        return odict.popitem(self)
+
+    def reorder(self, pos, key):
+        self._compiled = None
+        odict.reorder(self, pos, key)
+
+    def setdefault(self, key, failobj=None):
+        self._compiled = None
+        return odict.setdefault(self, key, failobj)
+
+    def update(self, other, reorder=False):
+        self._compiled = None
+        odict.update(self, other, reorder)
+
+    def field_map(self, instance=None, values={}, restore_db=None,
+                  filters=()):
+        """Return a FieldMap based on field specifications, creating
+        each field when it is first gotten.
+
+        If `restore_db` is given, fields without an `fget` callable are
+        restored from their stored values in that database when
+        created.
+
+        If `filters` are given, only fields whose classes pass all of
+        them are included, as with `self(*filters).field_map(...)`.
+        """
+        compiled = self._compiled
+        if compiled is None:
+            compiled = self._compiled = (
+                self._key_order(tuple(self._keys)), tuple(self.values()))
+        order, field_classes = compiled
+        if filters:
+            names = []
+            classes = []
+            for name, FieldClass in izip(order.keys, field_classes):
+                for filt in filters:
+                    if not filt(FieldClass):
+                        break
+                else:
+                    names.append(name)
+                    classes.append(FieldClass)
+            order = self._key_order(tuple(names))
+            field_classes = classes
+        # Fields are made by name, since the keys of the field map may
+        # change before all of its fields are made.
+        positions = order.positions
+        def make_field(name):
+            FieldClass = field_classes[positions[name]]
+            field = FieldClass(
+                instance=instance, value=values.get(name, UNASSIGNED))
+            if restore_db is not None and FieldClass.fget is None:
+                field._restore(restore_db)
+            return field
+        return FieldMap(make_field=make_field, order=order,
+                        values=[None] * len(order.keys))
+
+    def _key_order(self, names):
+        """Return the KeyOrder of field `names` shared by field maps."""
+        orders = self._orders
+        order = orders.get(names)
+        if order is None:
+            order = orders[names] = KeyOrder(names)
+        return order
 
     def reorder_all(self):
         """Reorder all fields as requested by their `place_before` and
@@ -0,0 +1,188 @@
+"""Inversion logs for undoing the side-effects of transactions."""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+import sys
+from schevo.lib import optimize
+
+from array import array
+from cPickle import dumps, loads
+import tempfile
+
+
+# Default number of bytes of inversion records to keep in memory
+# before spilling them to a temporary file.
+MEMORY_LIMIT = 16 * 1024 * 1024
+
+
+class InversionLog(object):
+    """Log of pickled inversion records, shared by an outermost
+    transaction and the transactions executed within it.
+
+    Records are kept in memory until their total size exceeds
+    `memory_limit` bytes, at which point they are moved to a temporary
+    file.  Records are only ever appended to or truncated from the end
+    of the log.
+    """
+
+    def __init__(self, db, memory_limit=MEMORY_LIMIT):
+        """Create a new inversion log.
+
+        - `db`: The database whose methods the inversions call.
+        - `memory_limit`: Number of bytes of records to keep in memory
+          before spilling them to disk.
+        """
+        self.db = db
+        self.memory_limit = memory_limit
+        # End offset in the file of each spilled record.
+        self._ends = array('L')
+        self._file = None
+        self._memory = []
+        self._memory_size = 0
+        self.closed = False
+
+    def __len__(self):
+        return len(self._ends) + len(self._memory)
+
+    def __getitem__(self, index):
+        """Return the (method, args, kw) inversion at `index`."""
+        spilled = len(self._ends)
+        if index >= spilled:
+            data = self._memory[index - spilled]
+        else:
+            ends = self._ends
+            start = index and ends[index - 1]
+            f = self._file
+            f.seek(start)
+            data = f.read(ends[index] - start)
+        name, args, kw = loads(data)
+        return getattr(self.db, name), args, kw
+
+    @property
+    def spilled(self):
+        """True if records have been moved to a temporary file."""
+        return self._file is not None
+
+    def append(self, method, args, kw):
+        """Append an inversion that calls `method`, a method of the
+        database, with `args` and `kw`."""
+        data = dumps((method.__name__, args, kw), 2)
+        self._memory.append(data)
+        self._memory_size += len(data)
+        if self._memory_size > self.memory_limit:
+            self._spill()
+
+    def close(self):
+        """Discard all records and remove the temporary file, if any.
+
+        Views of a closed log can no longer be used to undo
+        transactions.
+        """
+        self.truncate(0)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.closed = True
+
+    def truncate(self, length):
+        """Discard all records after the first `length` records."""
+        spilled = len(self._ends)
+        memory = self._memory
+        if length >= spilled:
+            index = length - spilled
+            for data in memory[index:]:
+                self._memory_size -= len(data)
+            del memory[index:]
+        else:
+            del memory[:]
+            self._memory_size = 0
+            ends = self._ends
+            del ends[length:]
+            self._file.truncate(length and ends[length - 1])
+
+    def view(self):
+        """Return a new `Inversions` view that starts at the current
+        end of the log."""
+        return Inversions(self)
+
+    def _spill(self):
+        """Move records in memory to the temporary file."""
+        f = self._file
+        if f is None:
+            f = self._file = tempfile.TemporaryFile(
+                prefix='schevo-inversions-')
+        ends = self._ends
+        end = ends and ends[-1] or 0
+        for data in self._memory:
+            end += len(data)
+            ends.append(end)
+        f.seek(0, 2)
+        f.write(''.join(self._memory))
+        del self._memory[:]
+        self._memory_size = 0
+
+
+class Inversions(object):
+    """View of the inversions appended to an `InversionLog` by one
+    transaction, including those of the transactions executed within
+    it.
+
+    The view is open-ended while the transaction executes, and is
+    closed off by `freeze` once the transaction is done.
+    """
+
+    def __init__(self, log):
+        self.log = log
+        self._start = len(log)
+        self._end = None
+
+    def __iter__(self):
+        log = self.log
+        for index in xrange(self._start, self._stop()):
+            yield log[index]
+
+    def __len__(self):
+        return self._stop() - self._start
+
+    def __nonzero__(self):
+        return self._stop() > self._start
+
+    @property
+    def closed(self):
+        """True if the log viewed has been closed."""
+        return self.log.closed
+
+    def append(self, inversion):
+        """Append a (method, args, kw) inversion."""
+        if self._end is not None:
+            raise RuntimeError('Cannot append to frozen inversions.')
+        method, args, kw = inversion
+        self.log.append(method, args, kw)
+
+    def freeze(self):
+        """Close off the view at the current end of the log."""
+        if self._end is None:
+            self._end = len(self.log)
+
+    def pop(self):
+        """Remove and return the last (method, args, kw) inversion."""
+        log = self.log
+        stop = self._stop()
+        if stop <= self._start:
+            raise IndexError('pop from empty inversions')
+        inversion = log[stop - 1]
+        if stop == len(log):
+            log.truncate(stop - 1)
+        if self._end is not None:
+            self._end = stop - 1
+        return inversion
+
+    def _stop(self):
+        if self._end is None:
+            return len(self.log)
+        else:
+            return self._end
+
+
+optimize.bind_all(sys.modules[__name__])  # Last line of module.
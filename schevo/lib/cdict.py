@@ -0,0 +1,250 @@
+"""Compact ordered dictionary class."""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+import sys
+from schevo.lib import optimize
+
+from itertools import izip
+
+
+class KeyOrder(object):
+    """Immutable order of keys, shared by compact dictionaries.
+
+    `keys` is a tuple of keys and `positions` a dictionary of
+    key:position pairs.  Orders that result from appending a key are
+    cached, so that dictionaries built up the same way share them.
+    """
+
+    __slots__ = ['keys', 'positions', '_appended']
+
+    def __init__(self, keys=()):
+        self.keys = keys = tuple(keys)
+        self.positions = dict((key, position)
+                              for position, key in enumerate(keys))
+        if len(self.positions) != len(keys):
+            raise ValueError('Duplicate keys in %r' % (keys, ))
+        self._appended = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __repr__(self):
+        return '<KeyOrder %r>' % (self.keys, )
+
+    def appended(self, key):
+        """Return the order of these keys followed by `key`."""
+        order = self._appended.get(key)
+        if order is None:
+            order = self._appended[key] = KeyOrder(self.keys + (key, ))
+        return order
+
+    def removed(self, key):
+        """Return the order of these keys without `key`."""
+        return KeyOrder(k for k in self.keys if k != key)
+
+
+EMPTY = KeyOrder()
+
+
+class cdict(object):
+    """Dictionary whose keys maintain their order of membership.
+
+    Unlike odict, the keys are kept in a `KeyOrder` that may be shared
+    with other cdicts, and each cdict stores only a list of values in
+    the same order.  Creating a cdict from an existing order and a
+    list of values does not hash any keys.
+    """
+
+    __slots__ = ['_order', '_values']
+
+    def __init__(self, seq=None, order=None, values=None):
+        """cdict() -> new empty dictionary.
+
+        cdict(seq) -> new dictionary initialized as if via::
+
+            d = cdict()
+            for k, v in seq:
+                d[k] = v
+
+        cdict(order=order, values=values) -> new dictionary using the
+        keys of the KeyOrder `order` and the list `values`.
+        """
+        if order is not None:
+            if len(values) != len(order.keys):
+                raise ValueError('%i values given for %i keys'
+                                 % (len(values), len(order.keys)))
+            self._order = order
+            self._values = values
+        else:
+            self._order = EMPTY
+            self._values = []
+            if seq is not None:
+                for k, v in seq:
+                    self[k] = v
+
+    def __contains__(self, key):
+        """D.__contains__(k) -> True if D has a key k, else False"""
+        return key in self._order.positions
+
+    has_key = __contains__
+
+    def __delitem__(self, key):
+        """x.__delitem__(y) <==> del x[y]"""
+        order = self._order
+        position = order.positions[key]
+        del self._values[position]
+        self._order = order.removed(key)
+
+    def __eq__(self, other):
+        """x.__eq__(y) <==> x==y"""
+        if isinstance(other, cdict):
+            other = dict(other.iteritems())
+        return dict(self.iteritems()) == other
+
+    __hash__ = None
+
+    def __ne__(self, other):
+        """x.__ne__(y) <==> x!=y"""
+        return not self == other
+
+    def __getitem__(self, key):
+        """x.__getitem__(y) <==> x[y]"""
+        return self._values[self._order.positions[key]]
+
+    def __iter__(self):
+        """x.__iter__() <==> iter(x)"""
+        return iter(self._order.keys)
+
+    def __len__(self):
+        """x.__len__() <==> len(x)"""
+        return len(self._values)
+
+    def __repr__(self):
+        """x.__repr__() <==> repr(x)"""
+        itemreprs = ('%r: %r' % item for item in self.iteritems())
+        return '{' + ', '.join(itemreprs) + '}'
+
+    def __setitem__(self, key, item):
+        """x.__setitem__(i, y) <==> x[i]=y"""
+        order = self._order
+        position = order.positions.get(key)
+        if position is None:
+            self._order = order.appended(key)
+            self._values.append(item)
+        else:
+            self._values[position] = item
+
+    def append(self, key, item):
+        """Alias for D[key] = item."""
+        if key in self._order.positions:
+            raise KeyError('append(): key %r already in dictionary' % key)
+        self[key] = item
+
+    def clear(self):
+        """D.clear() -> None.  Remove all items from D."""
+        self._order = EMPTY
+        self._values = []
+
+    def copy(self):
+        """D.copy() -> a shallow copy of D"""
+        return self.__class__(self.iteritems())
+
+    def get(self, key, default=None):
+        """D.get(k[,d]) -> D[k] if k in D, else d."""
+        if key in self._order.positions:
+            return self[key]
+        return default
+
+    def index(self, key):
+        """Return index of key in keys."""
+        position = self._order.positions.get(key)
+        if position is None:
+            raise KeyError('index(): key %r not in dictionary' % key)
+        return position
+
+    def insert(self, index, key, item):
+        """Insert key:item at index."""
+        if key in self._order.positions:
+            raise KeyError('insert(): key %r already in dictionary' % key)
+        keys = list(self._order.keys)
+        keys.insert(index, key)
+        self._values.insert(index, item)
+        self._order = KeyOrder(keys)
+
+    def items(self):
+        """D.items() -> list of D's (key, value) pairs, as 2-tuples"""
+        return list(self.iteritems())
+
+    def iteritems(self):
+        """D.iteritems() -> an iterator over the (key, value) items of D"""
+        return izip(self._order.keys, self._values)
+
+    def iterkeys(self):
+        """D.iterkeys() -> an iterator over the keys of D"""
+        return iter(self._order.keys)
+
+    def itervalues(self):
+        """D.itervalues() -> an iterator over the values of D"""
+        return iter(self._values)
+
+    def keys(self):
+        """D.keys() -> list of D's keys"""
+        return list(self._order.keys)
+
+    def pop(self, key, *failobj):
+        """D.pop(k[,d]) -> v, remove specified key and return the
+        corresponding value
+
+        If key is not found, d is returned if given, otherwise
+        KeyError is raised
+        """
+        if key not in self._order.positions:
+            if failobj:
+                return failobj[0]
+            raise KeyError(key)
+        value = self[key]
+        del self[key]
+        return value
+
+    def popitem(self):
+        """D.popitem() -> (k, v), remove and return last (key, value)
+        pair as a 2-tuple; but raise KeyError if D is empty"""
+        try:
+            key = self._order.keys[-1]
+        except IndexError:
+            raise KeyError('popitem(): dictionary is empty')
+        return (key, self.pop(key))
+
+    def reorder(self, pos, key):
+        """Move key to position pos."""
+        if key not in self._order.positions:
+            raise KeyError('Key not in cdict', key)
+        value = self[key]
+        del self[key]
+        self.insert(pos, key, value)
+
+    def setdefault(self, key, failobj=None):
+        """D.setdefault(k[,d]) -> D.get(k,d), also set D[k]=d if k not in D"""
+        if key not in self._order.positions:
+            self[key] = failobj
+        return self[key]
+
+    def update(self, other, reorder=False):
+        """Update values in this cdict based on the `other` cdict."""
+        if not isinstance(other, cdict):
+            raise ValueError('other must be a cdict')
+        if other is self:
+            raise ValueError('other cannot be the same cdict')
+        for key, value in other.iteritems():
+            if reorder and key in self._order.positions:
+                del self[key]
+            self[key] = value
+
+    def values(self):
+        """D.values() -> list of D's values"""
+        return list(self.itervalues())
+
+
+optimize.bind_all(sys.modules[__name__])  # Last line of module.
@@ -4,8 +4,15 @@
 # See LICENSE for details.
 
 import imp
+import marshal
+import os
 import sys
 
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import sha as sha1
+
 try:
     # Py-lib offers a fancy `compile` that allows source code
     # introspection, etc. but py-lib is not always available in
@@ -17,6 +24,69 @@ except ImportError:
 
 MODULES = [] # List of modules remembered.
 
+# Directory where code compiled from module sources is cached for use
+# by other processes, or None to only cache it within this process.
+CODE_CACHE_DIR = os.environ.get('SCHEVO_CODE_CACHE') or None
+
+# Version stamp of cached code files.
+CODE_CACHE_MAGIC = 'SCHEVO1' + imp.get_magic()
+
+_code_cache = {}  # Code objects, by SHA-1 digest of their source.
+
+
+def compile_cached(source, name=''):
+    """Return a code object compiled from `source`, using the code
+    cached for the same source if there is any.
+
+    Code is cached by the SHA-1 digest of its source, so the name it
+    was first compiled with is kept in its tracebacks.  If
+    `CODE_CACHE_DIR` is set, the code is marshalled to a file in that
+    directory, stamped with the version of Python that compiled it.
+    """
+    if isinstance(source, unicode):
+        digest = sha1(source.encode('utf-8')).hexdigest()
+    else:
+        digest = sha1(source).hexdigest()
+    code = _code_cache.get(digest)
+    if code is not None:
+        return code
+    cache_dir = CODE_CACHE_DIR
+    if cache_dir is not None:
+        filename = os.path.join(cache_dir, digest + '.code')
+        try:
+            f = open(filename, 'rb')
+            try:
+                data = f.read()
+            finally:
+                f.close()
+        except (IOError, OSError):
+            data = ''
+        if data.startswith(CODE_CACHE_MAGIC):
+            try:
+                code = marshal.loads(data[len(CODE_CACHE_MAGIC):])
+            except (EOFError, ValueError, TypeError):
+                code = None
+    if code is None:
+        code = compile(source, name, 'exec')
+        if cache_dir is not None:
+            # Write to a temporary file first, so that other processes
+            # never read a partially written file.
+            temp_filename = '%s.%i.tmp' % (filename, os.getpid())
+            try:
+                f = open(temp_filename, 'wb')
+                try:
+                    f.write(CODE_CACHE_MAGIC + marshal.dumps(code))
+                finally:
+                    f.close()
+                if os.path.exists(filename):
+                    os.remove(filename)
+                os.rename(temp_filename, filename)
+            except (IOError, OSError):
+                # The cache is an optimization only.
+                pass
+    _code_cache[digest] = code
+    return code
+
 
 def forget(module):
     """Remove module from sys.modules"""
@@ -33,7 +103,7 @@ def from_string(source, name=''):
     # sure it ends with a newline.
     source = source.strip() + '\n'
     module = imp.new_module(name)
-    code = compile(source, name, 'exec')
+    code = compile_cached(source, name)
     exec code in module.__dict__
     return module
 
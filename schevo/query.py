@@ -3,6 +3,7 @@
 # Copyright (c) 2001-2009 ElevenCraft Inc.
 # See LICENSE for details.
 
+from itertools import izip
 import operator
 import sys
 from schevo.lib import optimize
@@ -36,9 +37,32 @@ class Query(base.Query):
     __metaclass__ = QueryMeta
 
     def __call__(self):
-        """Shortcut to get to `_query_results` method."""
+        """Shortcut to get to `_query_results` method.
+
+        If the database queried has a `query_cache`, results of queries
+        that have a cache key are cached until an extent they depend on
+        changes.
+        """
+        cache_key = self._cache_key()
+        if cache_key is not None:
+            key, extents = cache_key
+            db = iter(extents).next().db
+            cache = db.query_cache
+            if cache is not None and not db._executing:
+                return _cached_results(self, key, extents, db, cache)
         return self._results()
 
+    def _cache_key(self):
+        """Return a (key, extents) tuple, where `key` is a hashable
+        fingerprint of the structure of this query and `extents` is the
+        frozenset of extents its results depend on, or None if its
+        results may not be cached.
+
+        Subclasses whose results depend on state other than that used
+        by the key of their superclass must override this.
+        """
+        return None
+
     def _results(self):
         """Return a `Results` instance based on the current state of
         this query."""
@@ -152,8 +176,16 @@ class Exact(Param):
             field = field_map[name]
             field.assigned = True
 
+    def _cache_key(self):
+        extent = self._on
+        criteria = tuple(sorted(self._criteria.iteritems()))
+        if not _is_hashable(criteria):
+            return None
+        return (Exact, extent.name, criteria), frozenset([extent])
+
     def _results(self):
-        return results(self._on.find(**self._criteria))
+        extent = self._on
+        return oid_results(extent, extent.find_oids(**self._criteria))
 
     @property
     def _criteria(self):
@@ -223,6 +255,14 @@ def _contains(a, b):
         return b in a
 o_contains = MatchOperator('contains', u'contains', _contains)
 
+def _icontains(a, b):
+    if a is UNASSIGNED:
+        return False
+    else:
+        return b.lower() in a.lower()
+o_icontains = MatchOperator(
+    'icontains', u'contains, ignoring case', _icontains)
+
 def _startswith(a, b):
     if a is UNASSIGNED:
         return False
@@ -246,11 +286,16 @@ o_aliases = {
     'any': o_any,
     'assigned': o_assigned,
     'contains': o_contains,
+    'icontains': o_icontains,
     'in': o_in,
     'startswith': o_startswith,
     'unassigned': o_unassigned,
     }
 
+# Operators whose results only depend on the identity of entities.
+_identity_operators = frozenset(
+    [o_any, o_assigned, o_unassigned, o_eq, o_in, o_ne])
+
 class Match(Query):
     """Field match query."""
 
@@ -289,6 +334,47 @@ class Match(Query):
         self.operator = operator
         self.value = value
 
+    def _cache_key(self):
+        on = self.on
+        if isinstance(on, base.Extent):
+            on_key = on.name
+            extents = frozenset([on])
+        elif isinstance(on, Query):
+            cache_key = on._cache_key()
+            if cache_key is None:
+                return None
+            on_key, extents = cache_key
+        else:
+            return None
+        FieldClass = self.FieldClass.__bases__[0]
+        operator = self.operator
+        if FieldClass.fget is not None and operator is not o_any:
+            # Calculated values may depend on anything.
+            return None
+        if (FieldClass.may_store_entities
+            and operator not in _identity_operators
+            ):
+            # Entities are ordered by the fields of other extents.
+            return None
+        value = self.value
+        if isinstance(value, Query):
+            cache_key = value._cache_key()
+            if cache_key is None:
+                return None
+            value_key, value_extents = cache_key
+            extents = extents | value_extents
+        else:
+            if isinstance(value, (list, set, frozenset)):
+                value = tuple(value)
+            if not _is_hashable(value):
+                return None
+            value_key = value
+        # Field classes are identified by ID, since comparing them
+        # creates expressions.
+        key = (self.__class__, on_key, self.field_name, operator.name,
+               id(FieldClass), value_key)
+        return key, extents
+
     def _results(self):
         on = self.on
         if isinstance(on, base.Query):
@@ -304,6 +390,8 @@ class Match(Query):
                 obj for obj in on if getattr(obj, field_name) in value)
         else:
             if operator is o_any:
+                if isinstance(on, base.Extent):
+                    return oid_results(on, on.find_oids())
                 return results(on)
             elif operator is o_assigned:
                 return results(
@@ -312,7 +400,7 @@ class Match(Query):
             elif operator is o_unassigned:
                 if isinstance(on, base.Extent):
                     kw = {field_name: UNASSIGNED}
-                    return results(on.find(**kw))
+                    return oid_results(on, on.find_oids(**kw))
                 else:
                     return results(
                         obj for obj in on
@@ -323,7 +411,22 @@ class Match(Query):
                 value = field.get()
             if isinstance(on, base.Extent) and operator is o_eq:
                 kw = {field_name: value}
-                return results(on.find(**kw))
+                return oid_results(on, on.find_oids(**kw))
+            if (isinstance(on, base.Extent)
+                and operator in (o_startswith, o_contains, o_icontains)
+                and isinstance(value, basestring)
+                and _is_stored_string(on, field_name)
+                ):
+                # Use indices of stored values.
+                db, extent_name = on.db, on.name
+                if operator is o_startswith:
+                    oids = db._find_entity_oids_prefix(
+                        extent_name, field_name, value)
+                else:
+                    oids = db._find_entity_oids_contains(
+                        extent_name, field_name, value,
+                        ignore_case=(operator is o_icontains))
+                return oid_results(on, oids)
             elif operator.operator:
                 oper = operator.operator
                 def generator():
@@ -365,6 +468,7 @@ class Match(Query):
             valid.append(o_ne)
         if issubclass(FieldClass, (field.String, field.Unicode)):
             valid.append(o_contains)
+            valid.append(o_icontains)
             valid.append(o_startswith)
         if not issubclass(FieldClass, field.Entity):
             valid.append(o_le)
@@ -406,19 +510,38 @@ class Intersection(Query):
     def __init__(self, *queries):
         self.queries = list(queries)
 
+    def _cache_key(self):
+        return _combined_cache_key(self.__class__, self.queries)
+
     def _results(self):
         assert log(1, 'called Intersection')
+        subresults = [query() for query in self.queries]
+        oids_by_extents = _oids_by_extents(subresults)
+        if oids_by_extents is not None:
+            # Intersect OIDs without creating entities.
+            resultmap = None
+            for oids_by_extent in oids_by_extents:
+                assert log(2, 'resultmap is', resultmap)
+                if resultmap is None:
+                    resultmap = oids_by_extent
+                else:
+                    resultmap = dict(
+                        (extent, oids & oids_by_extent[extent])
+                        for extent, oids in resultmap.iteritems()
+                        if extent in oids_by_extent
+                        )
+            assert log(2, 'resultmap is finally', resultmap)
+            return ResultsOids(resultmap or {})
         resultset = None
-        for query in self.queries:
+        for s in subresults:
             assert log(2, 'resultset is', resultset)
-            assert log(2, 'intersecting with', query)
-            s = set(query())
+            s = set(s)
             if resultset is None:
                 resultset = s
             else:
                 resultset = resultset.intersection(s)
         assert log(2, 'resultset is finally', resultset)
-        return results(frozenset(resultset))
+        return results(frozenset(resultset or ()))
 
     def __unicode__(self):
         if not self.queries:
@@ -469,14 +592,9 @@ class ByExample(Intersection):
         queries = []
         self.extent = extent
         for name, FieldClass in extent.field_spec.iteritems():
-            # Make sure calculated fields are -not- calculated in the
-            # match query.
-            class NoSlotsField(FieldClass):
-                fget = None
-                readonly = False
-                required = False
-            NoSlotsField.__name__ = FieldClass.__name__
-            match = Match(extent, name, 'any', FieldClass=NoSlotsField)
+            # Match makes sure calculated fields are -not- calculated
+            # in the match query.
+            match = Match(extent, name, 'any', FieldClass=FieldClass)
             if name in kw:
                 match.value = kw[name]
                 match.operator = '=='
@@ -493,10 +611,25 @@ class Union(Query):
     def __init__(self, *queries):
         self.queries = list(queries)
 
+    def _cache_key(self):
+        return _combined_cache_key(self.__class__, self.queries)
+
     def _results(self):
+        subresults = [query() for query in self.queries]
+        oids_by_extents = _oids_by_extents(subresults)
+        if oids_by_extents is not None:
+            # Unite OIDs without creating entities.
+            resultmap = {}
+            for oids_by_extent in oids_by_extents:
+                for extent, oids in oids_by_extent.iteritems():
+                    if extent in resultmap:
+                        resultmap[extent] = resultmap[extent] | oids
+                    else:
+                        resultmap[extent] = oids
+            return ResultsOids(resultmap)
         resultset = set()
-        for query in self.queries:
-            resultset.update(query())
+        for s in subresults:
+            resultset.update(s)
         return results(frozenset(resultset))
 
     def __unicode__(self):
@@ -514,14 +647,43 @@ class Group(Query):
         self.field_name = field_name
         self.FieldClass = FieldClass
 
+    def _cache_key(self):
+        # Groups are distinguished by entity identity, so grouping by
+        # an entity field only depends on the grouped entities.
+        return _field_cache_key(self, entities_ok=True)
+
     def _results(self):
+        return results([values for key, values in self._groups()])
+
+    def _groups(self, subresults=None):
+        """Return a list of (value, results) tuples, one for each
+        distinct value of the field in `subresults`, or in the results
+        of the query if `subresults` is None."""
+        if subresults is None:
+            subresults = self.query()
         field_name = self.field_name
+        extent_oids = _single_extent_oids(subresults)
+        if extent_oids is not None:
+            extent, oids = extent_oids
+            if _is_stored_scalar(extent, field_name):
+                # Group by stored values without creating entities.
+                oids = sorted(oids)
+                values = extent.db._entity_field_values(
+                    extent.name, field_name, oids)
+                oids_by_value = {}
+                for oid, value in izip(oids, values):
+                    oids_by_value.setdefault(value, []).append(oid)
+                return [
+                    (_restored_value(extent, field_name, value),
+                     oid_results(extent, value_oids))
+                    for value, value_oids in oids_by_value.iteritems()
+                    ]
         groups = {}
-        for result in self.query():
+        for result in subresults:
             key = getattr(result, field_name)
             L = groups.setdefault(key, [])
             L.append(result)
-        return results(values for values in groups.itervalues())
+        return [(key, results(values)) for key, values in groups.iteritems()]
 
     def __unicode__(self):
         field = self.FieldClass(self, self.field_name)
@@ -537,21 +699,11 @@ class Min(Query):
         self.field_name = field_name
         self.FieldClass = FieldClass
 
+    def _cache_key(self):
+        return _field_cache_key(self)
+
     def _results(self):
-        def generator():
-            field_name = self.field_name
-            groups = self.query()
-            for group in groups:
-                min_result = None
-                min_value = None
-                for result in group:
-                    value = getattr(result, field_name)
-                    if min_result is None or value < min_value:
-                        min_result = result
-                        min_value = value
-                if min_result is not None:
-                    yield min_result
-        return results(generator())
+        return results(_extremes(self.query, self.field_name, False))
 
     def __unicode__(self):
         field = self.FieldClass(self, self.field_name)
@@ -569,21 +721,11 @@ class Max(Query):
         self.field_name = field_name
         self.FieldClass = FieldClass
 
+    def _cache_key(self):
+        return _field_cache_key(self)
+
     def _results(self):
-        def generator():
-            field_name = self.field_name
-            groups = self.query()
-            for group in groups:
-                max_result = None
-                max_value = None
-                for result in group:
-                    value = getattr(result, field_name)
-                    if max_result is None or value > max_value:
-                        max_result = result
-                        max_value = value
-                if max_result is not None:
-                    yield max_result
-        return results(generator())
+        return results(_extremes(self.query, self.field_name, True))
 
     def __unicode__(self):
         field = self.FieldClass(self, self.field_name)
@@ -592,6 +734,90 @@ class Max(Query):
             )
 
 
+class Aggregate(Query):
+    """Base class for queries that aggregate the values of a field in
+    a query's results.
+
+    If the query is a Group query, the results are a (value,
+    aggregate) tuple for each group, where value is the value of the
+    grouped field.  Otherwise the results are the single aggregate of
+    all of the query's results.
+
+    Stored field values are read without creating entities where
+    possible.
+    """
+
+    _aggregate_label = u'aggregate'
+
+    def __init__(self, query, field_name=None, FieldClass=None):
+        self.query = query
+        self.field_name = field_name
+        self.FieldClass = FieldClass
+
+    def _cache_key(self):
+        return _field_cache_key(self)
+
+    def _results(self):
+        query = self.query
+        if isinstance(query, Group):
+            return results([(key, self._aggregate(group))
+                            for key, group in query._groups()])
+        return results([self._aggregate(query())])
+
+    def _aggregate(self, group):
+        """Return the aggregate of the results in `group`."""
+        raise NotImplementedError()
+
+    def _assigned_values(self, group):
+        """Return a list of the assigned values of the field in
+        `group`."""
+        return [value for value in _field_values(group, self.field_name)
+                if value is not UNASSIGNED]
+
+    def __unicode__(self):
+        if self.field_name is None:
+            return u'the %s of (%s)' % (self._aggregate_label, self.query)
+        field = self.FieldClass(self, self.field_name)
+        return u'the %s %s of (%s)' % (
+            self._aggregate_label, label(field), self.query)
+
+
+class Count(Aggregate):
+    """The number of results, or the number of results that have a
+    value assigned to a field if a field name is given."""
+
+    _aggregate_label = u'count'
+
+    def _aggregate(self, group):
+        if self.field_name is not None:
+            return len(self._assigned_values(group))
+        if isinstance(group, (ResultsOids, list, tuple, set, frozenset)):
+            return len(group)
+        return sum(1 for result in group)
+
+
+class Sum(Aggregate):
+    """The sum of the assigned values of a field."""
+
+    _aggregate_label = u'sum'
+
+    def _aggregate(self, group):
+        return sum(self._assigned_values(group))
+
+
+class Avg(Aggregate):
+    """The average of the assigned values of a field, or UNASSIGNED if
+    no values are assigned."""
+
+    _aggregate_label = u'average'
+
+    def _aggregate(self, group):
+        values = self._assigned_values(group)
+        if not values:
+            return UNASSIGNED
+        return sum(values) / float(len(values))
+
+
 # --------------------------------------------------------------------
 
 
@@ -610,11 +836,355 @@ def results(obj):
         return ResultsIterator(obj)
 
 
+def _cached_results(query, key, extents, db, cache):
+    """Return the results of `query` from `cache`, computing and
+    storing them first if they are not cached or are out of date.
+
+    Results are stored in an immutable form, and mutable results are
+    copied when returned.
+    """
+    stamp = db._extent_stamp(extents)
+    entry = cache.get(key, stamp)
+    if entry is None:
+        results = query._results()
+        if isinstance(results, (ResultsOids, ResultsFrozenset, ResultsTuple)):
+            entry = (results, None)
+        elif isinstance(results, ResultsSet):
+            entry = (ResultsFrozenset(results), ResultsSet)
+        else:
+            entry = (ResultsTuple(results), ResultsList)
+        cache.put(key, stamp, entry, len(entry[0]))
+    results, thaw = entry
+    if thaw is not None:
+        results = thaw(results)
+    return results
+
+
+def _combined_cache_key(cls, queries):
+    """Return a cache key for a query of class `cls` that combines the
+    results of `queries`, or None if any of them has no cache key."""
+    keys = []
+    extents = frozenset()
+    for query in queries:
+        cache_key = query._cache_key()
+        if cache_key is None:
+            return None
+        key, query_extents = cache_key
+        keys.append(key)
+        extents |= query_extents
+    if not extents:
+        return None
+    return (cls, tuple(keys)), extents
+
+
+def _extremes(query, field_name, maximum):
+    """Return a list of the result of each group in the results of
+    Group `query` that has the minimum value, or the maximum value if
+    `maximum` is True, of the named field.
+
+    Where possible, an index on the grouped field followed by the
+    named field is used to find the results, or else stored field
+    values are compared without creating entities.
+    """
+    if isinstance(query, Group):
+        subresults = query.query()
+        extent_oids = _single_extent_oids(subresults)
+        if extent_oids is not None:
+            extent, oids = extent_oids
+            if (_is_stored_scalar(extent, query.field_name)
+                and _is_stored_scalar(extent, field_name)
+                and not extent.field_spec[field_name].may_store_entities
+                ):
+                if len(oids) == len(extent):
+                    # All entities in the extent.
+                    oids = None
+                found = extent.db._find_extreme_oids(
+                    extent.name, query.field_name, field_name, maximum,
+                    oids)
+                if found is not None:
+                    Entity = extent.EntityClass
+                    return [Entity(oid) for oid in found]
+        groups = [group for key, group in query._groups(subresults)]
+    else:
+        groups = query()
+    extremes = []
+    for group in groups:
+        stored = _stored_values(group, field_name)
+        if stored is not None:
+            # Compare stored values, then create only the entity found.
+            extent, oids, values = stored
+            pairs = izip(oids, values)
+        else:
+            extent = None
+            pairs = ((result, getattr(result, field_name))
+                     for result in group)
+        best_result = None
+        best_value = None
+        for result, value in pairs:
+            if (best_result is None
+                or (maximum and value > best_value)
+                or (not maximum and value < best_value)
+                ):
+                best_result = result
+                best_value = value
+        if best_result is not None:
+            if extent is not None:
+                best_result = extent.EntityClass(best_result)
+            extremes.append(best_result)
+    return extremes
+
+
+def _field_cache_key(query, entities_ok=False):
+    """Return a cache key for `query`, which computes its results from
+    the values of its `field_name` in the results of its `query`.
+
+    Return None if that query has no cache key, or if the field is
+    calculated, or stores entities and `entities_ok` is False, in any
+    of the extents the results depend on.
+    """
+    cache_key = query.query._cache_key()
+    if cache_key is None:
+        return None
+    key, extents = cache_key
+    field_name = query.field_name
+    if field_name is not None:
+        for extent in extents:
+            FieldClass = extent.field_spec.get(field_name)
+            if FieldClass is None:
+                continue
+            if (FieldClass.fget is not None
+                or (FieldClass.may_store_entities and not entities_ok)
+                ):
+                return None
+    return (query.__class__, key, field_name), extents
+
+
+def _field_values(results, field_name):
+    """Return an iterable of the values of the named field of each of
+    `results`."""
+    stored = _stored_values(results, field_name)
+    if stored is not None:
+        extent, oids, values = stored
+        return values
+    return (getattr(result, field_name) for result in results)
+
+
+def _is_hashable(value):
+    """Return True if `value` may be used in a cache key."""
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+def _is_stored_scalar(extent, field_name):
+    """Return True if the named field of `extent` stores a single value
+    rather than calculating it or storing a collection."""
+    FieldClass = extent.field_spec.get(field_name)
+    return (FieldClass is not None
+            and FieldClass.fget is None
+            and (issubclass(FieldClass, field.Entity)
+                 or not issubclass(FieldClass, field._EntityBase))
+            )
+
+
+def _is_stored_string(extent, field_name):
+    """Return True if the named field of `extent` is a string field
+    whose value is stored rather than calculated."""
+    FieldClass = extent.field_spec.get(field_name)
+    return (FieldClass is not None
+            and FieldClass.fget is None
+            and issubclass(FieldClass, field.String)
+            )
+
+
+def _restored_value(extent, field_name, value):
+    """Return the value of the named field of an entity in `extent`
+    whose stored value is `value`."""
+    field = extent.field_spec[field_name](instance=None)
+    field._value = value
+    field._restore(extent.db)
+    return field.get_immutable()
+
+
+def _stored_values(results, field_name):
+    """Return an (extent, oids, values) tuple of the sorted OIDs of the
+    entities in `results` and the stored values of the named field of
+    each, or None if they cannot be read without creating entities.
+
+    Stored values are only read if `results` is a `ResultsOids`
+    instance for one extent and the field stores a single value other
+    than an entity.
+    """
+    extent_oids = _single_extent_oids(results)
+    if extent_oids is not None:
+        extent, oids = extent_oids
+        if (_is_stored_scalar(extent, field_name)
+            and not extent.field_spec[field_name].may_store_entities
+            ):
+            oids = sorted(oids)
+            values = extent.db._entity_field_values(
+                extent.name, field_name, oids)
+            return extent, oids, values
+    return None
+
+
+def _single_extent_oids(results):
+    """Return an (extent, oids) tuple if `results` is a `ResultsOids`
+    instance for a single extent, or else None."""
+    if isinstance(results, ResultsOids):
+        oids_by_extent = results.oids_by_extent
+        if len(oids_by_extent) == 1:
+            return oids_by_extent.items()[0]
+    return None
+
+
+def oid_results(extent, oids):
+    """Return a `ResultsOids` instance for the entities in `extent`
+    with the given OIDs."""
+    return ResultsOids({extent: frozenset(oids)})
+
+
+def _oids_by_extents(subresults):
+    """Return a list of extent:oids dictionaries for each of the
+    `subresults`, or None if any of them contains objects other than
+    entities.
+
+    Iterators in `subresults` are replaced by lists in place, so that
+    they may still be used if None is returned.
+    """
+    oids_by_extents = []
+    for index, subresult in enumerate(subresults):
+        if isinstance(subresult, ResultsOids):
+            oids_by_extents.append(subresult.oids_by_extent)
+            continue
+        if not isinstance(subresult, (list, tuple, set, frozenset)):
+            subresult = subresults[index] = list(subresult)
+        oids_by_extent = {}
+        for obj in subresult:
+            if not isinstance(obj, base.Entity):
+                return None
+            oids_by_extent.setdefault(obj._extent, set()).add(obj._oid)
+        oids_by_extents.append(dict(
+            (extent, frozenset(oids))
+            for extent, oids in oids_by_extent.iteritems()
+            ))
+    return oids_by_extents
+
+
+class ResultsOids(base.Results):
+    """Results that are entities identified by OID.
+
+    OIDs are kept in a frozenset for each extent, so that they may be
+    intersected and united without creating entity instances.
+    Entities are created when first iterated over or indexed, in order
+    of extent name, then OID.
+
+    Like `ResultsList`, the results may be indexed, sliced and compared
+    with lists, but they are immutable.
+    """
+
+    __hash__ = None
+
+    def __init__(self, oids_by_extent):
+        self.oids_by_extent = dict(
+            (extent, oids)
+            for extent, oids in oids_by_extent.iteritems()
+            if oids
+            )
+        self._entities = None
+
+    def __contains__(self, entity):
+        oids = self.oids_by_extent.get(getattr(entity, '_extent', None))
+        return oids is not None and entity._oid in oids
+
+    def __eq__(self, other):
+        if isinstance(other, ResultsOids):
+            return self.oids_by_extent == other.oids_by_extent
+        elif isinstance(other, list):
+            return self._entity_list() == other
+        elif isinstance(other, (set, frozenset)):
+            return set(self._entity_list()) == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ResultsList(self._entity_list()[index])
+        return self._entity_list()[index]
+
+    def __iter__(self):
+        return iter(self._entity_list())
+
+    def __len__(self):
+        return sum(len(oids) for oids in self.oids_by_extent.itervalues())
+
+    def __nonzero__(self):
+        return bool(self.oids_by_extent)
+
+    def __repr__(self):
+        return '<ResultsOids %r>' % (self.oids_by_extent, )
+
+    def count(self, entity):
+        """Return 1 if `entity` is in these results, else 0."""
+        return int(entity in self)
+
+    def _entity_list(self):
+        """Return the list of entities in these results, which must not
+        be changed."""
+        entities = self._entities
+        if entities is None:
+            entities = self._entities = []
+            oids_by_extent = self.oids_by_extent
+            for extent in sorted(oids_by_extent):
+                Entity = extent.EntityClass
+                entities.extend(
+                    Entity(oid) for oid in sorted(oids_by_extent[extent]))
+        return entities
+
+    def index(self, entity):
+        """Return the position of `entity` in these results."""
+        if entity not in self:
+            raise ValueError('%r is not in results' % (entity, ))
+        return self._entity_list().index(entity)
+
+    def prefetch(self, *paths):
+        """Restore the entities referred to by the entity fields named by
+        each of the dotted `paths` of the entities in these results, and
+        return these results.  See `ResultsList.prefetch`."""
+        ResultsList(self._entity_list()).prefetch(*paths)
+        return self
+
+
 class ResultsFrozenset(frozenset, base.Results):
     pass
 
 class ResultsList(list, base.Results):
-    pass
+
+    def prefetch(self, *paths):
+        """Restore the entities referred to by the entity fields named by
+        each of the dotted `paths`, such as ``'customer.region'``, of the
+        entities in these results, and return these results.
+
+        The referred-to entities are read in one batch per field rather
+        than one at a time as each field is first gotten.
+        """
+        entities = [obj for obj in self if isinstance(obj, base.Entity)]
+        if entities:
+            db = entities[0]._db
+            for path in paths:
+                # A path is also prefetched by any longer path it starts.
+                prefix = path + '.'
+                if not [p for p in paths if p.startswith(prefix)]:
+                    db._prefetch_entities(entities, path)
+        return self
+
 
 class ResultsSet(set, base.Results):
     pass
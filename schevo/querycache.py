@@ -0,0 +1,109 @@
+"""Query result cache."""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+import sys
+from schevo.lib import optimize
+
+
+# Default estimated number of bytes of results to keep in a cache.
+MAX_SIZE = 32 * 1024 * 1024
+
+# Estimated number of bytes used by an entry, and by each result in it.
+ENTRY_SIZE = 256
+RESULT_SIZE = 64
+
+
+class QueryCache(object):
+    """Cache of query results, evicting the least recently used
+    results when their estimated size exceeds `max_size` bytes.
+
+    Each entry is stored with a stamp, and is only returned when
+    looked up with an equal stamp.  The database uses the modification
+    counters of the extents a query depends on as its stamp, so that
+    results are invalidated when one of those extents changes.
+
+    Assign an instance to the `query_cache` attribute of a database to
+    cache the results of queries on it.
+    """
+
+    def __init__(self, max_size=MAX_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+        # key: [stamp, results, size, last_used]
+        self._entries = {}
+        self._clock = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """Remove all entries."""
+        self._entries.clear()
+        self.size = 0
+
+    def get(self, key, stamp):
+        """Return the results stored for `key` with `stamp`, or None if
+        there are none."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != stamp:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._clock += 1
+        entry[3] = self._clock
+        return entry[1]
+
+    def put(self, key, stamp, results, count):
+        """Store `results`, which contain `count` results, for `key` with
+        `stamp`."""
+        self.remove(key)
+        size = ENTRY_SIZE + RESULT_SIZE * count
+        if size > self.max_size:
+            return
+        self._clock += 1
+        self._entries[key] = [stamp, results, size, self._clock]
+        self.size += size
+        if self.size > self.max_size:
+            self._evict()
+
+    def remove(self, key):
+        """Remove the entry for `key`, if any."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def stats(self):
+        """Return a dictionary of cache statistics."""
+        return dict(
+            entries=len(self._entries),
+            evictions=self.evictions,
+            hits=self.hits,
+            max_size=self.max_size,
+            misses=self.misses,
+            size=self.size,
+            )
+
+    def _evict(self):
+        """Remove least recently used entries until at most three
+        quarters of `max_size` is used."""
+        entries = self._entries
+        target = self.max_size * 3 // 4
+        by_age = sorted(entries.iteritems(), key=_last_used)
+        for key, entry in by_age:
+            if self.size <= target:
+                break
+            del entries[key]
+            self.size -= entry[2]
+            self.evictions += 1
+
+
+def _last_used(item):
+    return item[1][3]
+
+
+optimize.bind_all(sys.modules[__name__])  # Last line of module.
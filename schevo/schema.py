@@ -12,9 +12,12 @@ schevo.schema.prep(locals())
 # See LICENSE for details.
 
 __all__ = [
+    '_aggregate',
     '_hide',
     '_key',
     '_index',
+    '_index_fulltext',
+    '_index_text',
     'ANY',
     'CASCADE',
     'DEFAULT',
@@ -92,6 +95,24 @@ def _hide(*args):
             hidden_views.add(name[2:])
 
 
+# _aggregate provides support for Entity materialized aggregate
+# specification.
+def _aggregate(name, function, field_name=None, group_by=None):
+    """Append a materialized aggregate to the Entity subclass currently
+    being defined.
+
+    - `name`: Name of the aggregate.
+    - `function`: `sum` or 'sum', `len` or 'count', or 'avg'.
+    - `field_name`: Field whose assigned values are aggregated.  If
+      None, `function` must count entities.
+    - `group_by`: If not None, field whose values the entities are
+      grouped by.
+    """
+    clsLocals = inspect.currentframe(1).f_locals
+    spec = clsLocals.setdefault('_aggregate_spec_additions', [])
+    spec.append((name, function, field_name, group_by))
+
+
 # _key provides support for Entity key specification.
 def _key(*args):
     """Append a key spec to the Entity subclass currently being
@@ -110,6 +131,25 @@ def _index(*args):
     spec.append(args)
 
 
+# _index_fulltext provides support for Entity full-text index
+# specification.
+def _index_fulltext(*args):
+    """Append field names to the full-text index spec of the Entity
+    subclass currently being defined."""
+    clsLocals = inspect.currentframe(1).f_locals
+    spec = clsLocals.setdefault('_fulltext_index_spec_additions', [])
+    spec.extend(args)
+
+
+# _index_text provides support for Entity text index specification.
+def _index_text(*args):
+    """Append field names to the text index spec of the Entity
+    subclass currently being defined."""
+    clsLocals = inspect.currentframe(1).f_locals
+    spec = clsLocals.setdefault('_text_index_spec_additions', [])
+    spec.extend(args)
+
+
 # 'import_lock' is a lock that is acquired during a schema import,
 # then released when the import is finished.  It is used to prevent
 # the schevo.schema.* namespace from being clobbered if multiple
@@ -187,10 +227,7 @@ def finish(db, schema_module=None):
     # Decorate all Entity transaction classes with the current database.
     for entity_name in schema_def.E:
         EntityClass = schema_def.E[entity_name]
-        for v in EntityClass.__dict__.itervalues():
-            if (inspect.isclass(v)
-                and issubclass(v, schevo.transaction.Transaction)):
-                v._db = db
+        EntityClass.decorate_transactions(db)
     # Decorate all View transaction classes with the current database.
     for view_name in schema_def.V:
         ViewClass = schema_def.V[view_name]
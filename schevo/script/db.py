@@ -12,7 +12,9 @@ from schevo.script import (
     db_evolve,
     db_inject,
     db_pack,
+    db_reindex,
     db_repair,
+    db_stats,
     db_update,
     )
 
@@ -31,7 +33,9 @@ class Database(CommandSet):
             'evolve': db_evolve.start,
             'inject': db_inject.start,
             'pack': db_pack.start,
+            'reindex': db_reindex.start,
             'repair': db_repair.start,
+            'stats': db_stats.start,
             'update': db_update.start,
             }
 
@@ -13,7 +13,12 @@ from schevo.script import opt
 usage = """\
 schevo db convert [options] URL
 
-URL: The database file to convert to a new format."""
+URL: The database file to convert to a new format.
+
+To change the BTree node degrees of an existing database, use --repack
+along with backend arguments, e.g.:
+
+  schevo db convert --repack -a entities_degree=256 example.db"""
 
 
 def _parser():
@@ -23,6 +28,19 @@ def _parser():
                  metavar='FORMAT',
                  default=None,
                  )
+    p.add_option('-r', '--repack', dest='repack',
+                 help='Rewrite BTrees using the node degrees given in '
+                 'backend arguments, then pack the database.',
+                 action='store_true',
+                 default=False,
+                 )
+    p.add_option('-a', '--backend-arg', dest='backend_args',
+                 help='Pass NAME=VALUE as an argument to the backend. '
+                 'May be given more than once.',
+                 metavar='NAME=VALUE',
+                 action='append',
+                 default=[],
+                 )
     return p
 
 
@@ -39,13 +57,21 @@ class Format(Command):
         if len(args) != 1:
             parser.error('Please specify URL.')
         url = args[0]
+        backend_args = {}
+        for arg in options.backend_args:
+            if '=' not in arg:
+                parser.error('Backend arguments must be in NAME=VALUE form.')
+            name, value = arg.split('=', 1)
+            backend_args[name] = value
         format = options.format
         if format is not None:
             format = int(format)
             print 'Converting %r to format %r...' % (url, format)
         else:
             print 'Converting %r to latest format...' % url
-        schevo.database.convert_format(url, format=format)
+        schevo.database.convert_format(
+            url, backend_args=backend_args, format=format,
+            repack=options.repack)
         print 'Conversion complete.'
 
 
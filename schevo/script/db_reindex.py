@@ -0,0 +1,57 @@
+"""Reindex database command."""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+import schevo.database
+
+from schevo.script.command import Command
+from schevo.script import opt
+
+usage = """\
+schevo db reindex [options] URL
+
+URL: URL of the database to reindex.
+"""
+
+
+def _parser():
+    p = opt.parser(usage)
+    p.add_option('-e', '--extent',
+                 dest='extent_name',
+                 help='Only reindex the extent named EXTENT.',
+                 metavar='EXTENT',
+                 default=None,
+                 )
+    return p
+
+
+class Reindex(Command):
+
+    name = 'Reindex Database'
+    description = 'Rebuild text indices and aggregates of a database.'
+
+    def main(self, arg0, args):
+        print
+        print
+        parser = _parser()
+        options, args = parser.parse_args(list(args))
+        if len(args) != 1:
+            parser.error('Please specify URL.')
+        url = args[0]
+        # Open the database.
+        db = schevo.database.open(url)
+        if (options.extent_name is not None
+            and options.extent_name not in db.extent_names()
+            ):
+            db.close()
+            parser.error('Extent %r not found.' % options.extent_name)
+        # Reindex the database.
+        print 'Reindexing the database...'
+        db.reindex(options.extent_name)
+        # Done.
+        db.close()
+        print 'Database reindex complete.'
+
+
+start = Reindex
@@ -0,0 +1,165 @@
+"""Database statistics command."""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+import schevo.database
+import schevo.stats
+
+from schevo.script.command import Command
+from schevo.script import opt
+
+usage = """\
+schevo db stats [options] --from FILE
+schevo db stats [options] --scan URL
+
+FILE: File that a database appends statistics to, as given to its
+enable_stats method.
+
+URL: URL of the database to read.
+
+With --from, shows the statistics of the operations performed by the
+database, such as a running server, that last dumped them to FILE.
+
+With --scan, opens the database and reads every entity of it, or of one
+extent, then shows the statistics of that.  This is a synthetic read
+benchmark: it shows nothing about how the database is otherwise used.
+"""
+
+
+def _parser():
+    p = opt.parser(usage)
+    p.add_option('-f', '--from',
+                 dest='from_filename',
+                 help='Show the last statistics dumped to FILE.',
+                 metavar='FILE',
+                 default=None,
+                 )
+    p.add_option('-c', '--changes',
+                 dest='changes',
+                 help=('With --from, show only the operations since the '
+                       'first dump of the same collection in FILE.'),
+                 action='store_true',
+                 default=False,
+                 )
+    p.add_option('-s', '--scan',
+                 dest='scan',
+                 help='Read the database at URL and show statistics of that.',
+                 action='store_true',
+                 default=False,
+                 )
+    p.add_option('-e', '--extent',
+                 dest='extent_name',
+                 help='With --scan, only read the extent named EXTENT.',
+                 metavar='EXTENT',
+                 default=None,
+                 )
+    p.add_option('-j', '--json',
+                 dest='json',
+                 help='Show statistics as JSON.',
+                 action='store_true',
+                 default=False,
+                 )
+    p.add_option('-d', '--dump',
+                 dest='dump_filename',
+                 help=('With --scan, append statistics to FILE as a line '
+                       'of JSON.'),
+                 metavar='FILE',
+                 default=None,
+                 )
+    return p
+
+
+def _print_values(title, values):
+    print title
+    for name, value in sorted(values.iteritems()):
+        if isinstance(value, dict):
+            count = value['count']
+            if count:
+                mean = value['total'] / count * 1000.0
+            else:
+                mean = 0.0
+            maximum = value['maximum'] * 1000.0
+            print '  %-20s %10i  mean %10.3fms  max %10.3fms' % (
+                name, count, mean, maximum)
+        else:
+            print '  %-20s %10i' % (name, value)
+
+
+def _read_stats(parser, options):
+    """Return the statistics last dumped to the file given by --from."""
+    try:
+        dumps = schevo.stats.read_dumps(options.from_filename)
+    except (IOError, ValueError), e:
+        parser.error('Cannot read %r: %s' % (options.from_filename, e))
+    if not dumps:
+        parser.error('No statistics in %r.' % options.from_filename)
+    stats = dumps[-1]
+    if options.changes:
+        # Dumps of the same collection share the time it started.
+        same = [dump for dump in dumps if dump['started'] == stats['started']]
+        if len(same) > 1:
+            stats = schevo.stats.difference(same[0], stats)
+    return stats
+
+
+def _scan_stats(parser, options, url):
+    """Return the statistics of reading the database at `url`."""
+    db = schevo.database.open(url)
+    if options.extent_name is None:
+        extent_names = db.extent_names()
+    elif options.extent_name in db.extent_names():
+        extent_names = [options.extent_name]
+    else:
+        db.close()
+        parser.error('Extent %r not found.' % options.extent_name)
+    # Read entities.
+    db.enable_stats()
+    for extent_name in extent_names:
+        for entity in db.extent(extent_name):
+            entity.s.field_map()
+    stats = db.stats()
+    db.disable_stats()
+    db.close()
+    if options.dump_filename is not None:
+        f = open(options.dump_filename, 'a')
+        try:
+            f.write(schevo.stats.to_json(stats) + '\n')
+        finally:
+            f.close()
+    return stats
+
+
+class Stats(Command):
+
+    name = 'Database Statistics'
+    description = 'Show statistics of database operations.'
+
+    def main(self, arg0, args):
+        print
+        print
+        parser = _parser()
+        options, args = parser.parse_args(list(args))
+        if options.from_filename is not None:
+            if args or options.scan:
+                parser.error('Please specify either --from FILE or '
+                             '--scan URL.')
+            stats = _read_stats(parser, options)
+        elif options.scan:
+            if len(args) != 1:
+                parser.error('Please specify URL.')
+            stats = _scan_stats(parser, options, args[0])
+        else:
+            parser.error('Please specify --from FILE, or --scan URL to '
+                         'read the database.')
+        # Report.
+        if options.json:
+            print schevo.stats.to_json(stats)
+        else:
+            print 'Statistics over %.3fs:' % stats['elapsed']
+            _print_values('storage', stats['storage'])
+            for extent_name, values in sorted(stats['extents'].iteritems()):
+                _print_values(extent_name, values)
+
+
+start = Stats
@@ -0,0 +1,204 @@
+"""Database operation statistics."""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+import sys
+from schevo.lib import optimize
+
+from bisect import bisect_left
+from time import time
+
+
+# Upper bounds, in seconds, of the buckets of latency histograms.  A
+# final bucket holds latencies above the last bound.
+BOUNDS = (0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0, 10.0)
+
+# Default number of seconds between dumps to a statistics file.
+DUMP_INTERVAL = 60.0
+
+
+class Histogram(object):
+    """Count, total, maximum, and distribution of latencies."""
+
+    __slots__ = ['count', 'total', 'maximum', 'buckets']
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.buckets = [0] * (len(BOUNDS) + 1)
+
+    def add(self, seconds):
+        """Add a latency of `seconds`."""
+        self.count += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+        self.buckets[bisect_left(BOUNDS, seconds)] += 1
+
+    def as_dict(self):
+        """Return a dictionary of the histogram's values, where
+        `buckets` is a list of [bound, count] pairs and the bound of the
+        last bucket is None."""
+        return dict(
+            count=self.count,
+            total=self.total,
+            maximum=self.maximum,
+            buckets=[[bound, count] for bound, count
+                     in zip(BOUNDS + (None, ), self.buckets)],
+            )
+
+
+class Stats(object):
+    """Counters and latency histograms of database operations.
+
+    Each counter and histogram is kept for a scope, which is either the
+    name of an extent or None for storage-wide operations.  Collection
+    is enabled on a database with its `enable_stats` method, and the
+    results are returned by its `stats` method.
+
+    Extents have `create`, `create_batch`, `update`, `delete`,
+    `validate`, and `find_index`, `find_link`, or `find_scan`
+    histograms, one for each path a find may take, and `index_add`,
+    `index_remove`, `link_add`, and `link_remove` counters.  Storage
+    has `commit` and `storage_end` histograms, and `commit_objects`,
+    `commit_bytes`, `cache_hit`, `cache_miss`, and `ghost_load`
+    counters.
+
+    Statistics can also be dumped to a file every `dump_interval`
+    seconds, as one line of JSON per dump, when `tick` is called.
+    """
+
+    def __init__(self, dump_filename=None, dump_interval=DUMP_INTERVAL):
+        self.dump_filename = dump_filename
+        self.dump_interval = dump_interval
+        self.clear()
+
+    def add(self, scope, name, seconds):
+        """Count an operation that took `seconds`."""
+        key = (scope, name)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.add(seconds)
+
+    def as_dict(self):
+        """Return the statistics as a dictionary.
+
+        Statistics of extents are in an `extents` dictionary keyed by
+        extent name, and storage-wide statistics are in a `storage`
+        dictionary.  Each of them maps counter names to counts and
+        histogram names to the result of `Histogram.as_dict`.
+        """
+        now = time()
+        extents = {}
+        storage = {}
+        for items in (self.counters.iteritems(), self.histograms.iteritems()):
+            for (scope, name), value in items:
+                if scope is None:
+                    values = storage
+                else:
+                    values = extents.setdefault(scope, {})
+                if isinstance(value, Histogram):
+                    value = value.as_dict()
+                values[name] = value
+        return dict(
+            started=self.started,
+            time=now,
+            elapsed=now - self.started,
+            extents=extents,
+            storage=storage,
+            )
+
+    def clear(self):
+        """Reset all counters and histograms."""
+        self.counters = {}
+        self.histograms = {}
+        self.started = self.last_dump = time()
+
+    def count(self, scope, name, n=1):
+        """Add `n` to the counter `name`."""
+        key = (scope, name)
+        counters = self.counters
+        counters[key] = counters.get(key, 0) + n
+
+    def dump(self, filename=None):
+        """Append the statistics to `filename`, or the dump file, as one
+        line of JSON."""
+        if filename is None:
+            filename = self.dump_filename
+        # Even if dumping fails, wait for the next interval to try again.
+        self.last_dump = time()
+        f = open(filename, 'a')
+        try:
+            f.write(to_json(self.as_dict()) + '\n')
+        finally:
+            f.close()
+
+    def tick(self):
+        """Dump the statistics if there is a dump file and
+        `dump_interval` seconds have passed since the last dump."""
+        if (self.dump_filename is not None
+            and time() - self.last_dump >= self.dump_interval
+            ):
+            self.dump()
+
+
+def to_json(stats):
+    """Return the statistics dictionary `stats` as a line of JSON."""
+    import json
+    return json.dumps(stats, sort_keys=True)
+
+
+def read_dumps(filename):
+    """Return the list of statistics dictionaries dumped to `filename`,
+    oldest first."""
+    import json
+    f = open(filename)
+    try:
+        return [json.loads(line) for line in f if line.strip()]
+    finally:
+        f.close()
+
+
+def difference(earlier, later):
+    """Return the statistics dictionary of the operations counted in
+    `later` but not in `earlier`, two dumps of the same collection.
+
+    Histograms have no maximum of their own over that time, so they
+    keep the maximum of `later`.
+    """
+    def subtract(before, after):
+        values = {}
+        for name, value in after.iteritems():
+            previous = before.get(name)
+            if previous is None:
+                values[name] = value
+            elif isinstance(value, dict):
+                values[name] = dict(
+                    count=value['count'] - previous['count'],
+                    total=value['total'] - previous['total'],
+                    maximum=value['maximum'],
+                    buckets=[[bound, count - previous_count]
+                             for (bound, count), (_, previous_count)
+                             in zip(value['buckets'], previous['buckets'])],
+                    )
+            else:
+                values[name] = value - previous
+        return values
+    earlier_extents = earlier['extents']
+    return dict(
+        started=earlier['time'],
+        time=later['time'],
+        elapsed=later['time'] - earlier['time'],
+        extents=dict(
+            (extent_name, subtract(earlier_extents.get(extent_name, {}),
+                                   values))
+            for extent_name, values in later['extents'].iteritems()
+            ),
+        storage=subtract(earlier['storage'], later['storage']),
+        )
+
+
+optimize.bind_all(sys.modules[__name__])  # Last line of module.
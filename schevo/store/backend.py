@@ -14,7 +14,7 @@ from schevo.store.backend_test_classes import (
     TestMethods_CreatesSchema,
     TestMethods_EvolvesSchemata,
     )
-from schevo.store.btree import BTree
+from schevo.store.btree import BTree, bnode_class, btree_constructor
 from schevo.store.persistent_dict import PersistentDict
 from schevo.store.persistent_list import PersistentList
 from schevo.store.file_storage import FileStorage
@@ -24,6 +24,7 @@ from schevo.store.connection import Connection
 class SchevoStoreBackend(object):
 
     DEFAULT_CACHE_SIZE = 100000
+    DEFAULT_DEGREE = 16
 
     description = 'Built-in backend, based on Durus 3.4'
     backend_args_help = """
@@ -37,6 +38,23 @@ class SchevoStoreBackend(object):
     fp=None (file-like object)
         Optional file object to use instead of an actual file in the
         filesystem.
+
+    entities_degree=%(DEFAULT_DEGREE)i (int)
+        Minimum degree of BTree nodes that hold the entities of each
+        extent.  One of 2, 4, 8, 16, 32, 64, 128, 256, or 512.
+
+    index_branch_degree=%(DEFAULT_DEGREE)i (int)
+        Minimum degree of BTree nodes that hold index branches.
+
+    index_leaf_degree=%(DEFAULT_DEGREE)i (int)
+        Minimum degree of BTree nodes that hold the OIDs at the leaves
+        of indices.
+
+    links_degree=%(DEFAULT_DEGREE)i (int)
+        Minimum degree of BTree nodes that hold links between entities.
+
+    Degrees only apply to BTrees created after the database is opened.
+    Use "schevo db convert --repack" to rewrite existing BTrees.
     """ % locals()
 
     __test__ = False
@@ -49,16 +67,30 @@ class SchevoStoreBackend(object):
     TestMethods_CreatesSchema = TestMethods_CreatesSchema
     TestMethods_EvolvesSchemata = TestMethods_EvolvesSchemata
 
+    # Statistics assigned by set_stats.
+    stats = None
+
     def __init__(self,
                  database,
                  fp=None,
                  cache_size=DEFAULT_CACHE_SIZE,
+                 entities_degree=DEFAULT_DEGREE,
+                 index_branch_degree=DEFAULT_DEGREE,
+                 index_leaf_degree=DEFAULT_DEGREE,
+                 links_degree=DEFAULT_DEGREE,
                  ):
         self.database = database
         if database == ':memory:' and fp is None:
             fp = StringIO()
         self.fp = fp
         self.cache_size = cache_size
+        # BNode classes to use for each structure role.
+        self.node_classes = {
+            'entities': bnode_class(entities_degree),
+            'index_branches': bnode_class(index_branch_degree),
+            'index_leaves': bnode_class(index_leaf_degree),
+            'links': bnode_class(links_degree),
+            }
         self.is_open = False
         self.open()
 
@@ -90,6 +122,12 @@ class SchevoStoreBackend(object):
         """Return `True` if the backend contains a Schevo database."""
         return self.get_root().has_key('SCHEVO')
 
+    def btree_for(self, role):
+        """Return a callable that creates empty BTrees for the given
+        structure `role`: 'entities', 'index_branches', 'index_leaves', or
+        'links'."""
+        return btree_constructor(self.node_classes[role])
+
     def close(self):
         """Close the underlying storage (and the connection if
         needed)."""
@@ -112,6 +150,7 @@ class SchevoStoreBackend(object):
             except RuntimeError:
                 raise DatabaseFileLocked()
             self.conn = Connection(self.storage, cache_size=self.cache_size)
+            self.conn.set_stats(self.stats)
             self.is_open = True
 
     def pack(self):
@@ -121,3 +160,11 @@ class SchevoStoreBackend(object):
     def rollback(self):
         """Abort the current transaction."""
         self.conn.abort()
+
+    def set_stats(self, stats):
+        """Collect statistics of storage operations in `stats`, a
+        `schevo.stats.Stats` instance, or stop collecting them if
+        `stats` is None."""
+        self.stats = stats
+        if self.is_open:
+            self.conn.set_stats(stats)
@@ -6,6 +6,8 @@ $Id$
 import sys
 from schevo.lib import optimize
 
+from bisect import bisect_left
+
 from schevo.store.persistent import GHOST
 from schevo.store.persistent import Persistent
 
@@ -98,10 +100,14 @@ class BNode(Persistent):
         return len(self.items) == 2 * self.minimum_degree - 1
 
     def get_position(self, key):
-        for position, item in enumerate(self.items):
-            if item[0] >= key:
-                return position
-        return len(self.items)
+        """(key:anything) -> int
+        Return the position of the first item whose key is greater than
+        or equal to `key`, or len(self.items) if there is none.
+        """
+        # Items are (key, value) tuples, and a 1-tuple probe sorts
+        # before any item having an equal key, so bisecting on it finds
+        # the leftmost match without comparing values.
+        return bisect_left(self.items, (key,))
 
     def search(self, key):
         """(key:anything) -> None | (key:anything, value:anything)
@@ -131,6 +137,10 @@ class BNode(Persistent):
             child = self.nodes[position]
             if child.is_full():
                 self.split_child(position, child)
+                if key == self.items[position][0]:
+                    # The split promoted the matching item.
+                    self.items[position] = item
+                    return
                 if key > self.items[position][0]:
                     position += 1
             self.nodes[position].insert_item(item)
@@ -211,15 +221,16 @@ class BNode(Persistent):
                     upper_sibling.delete(extreme[0])
                     self.items[p] = extreme
                 else:
-                    # Case 2c.
-                    extreme = upper_sibling.get_min_item()
-                    upper_sibling.delete(extreme[0])
-                    node.items = node.items + [extreme] + upper_sibling.items
+                    # Case 2c: Merge the item and upper_sibling into
+                    # node, then delete the item from node.
+                    node.items = (node.items + [self.items[p]] +
+                                  upper_sibling.items)
                     if not node.is_leaf():
                         node.nodes = node.nodes + upper_sibling.nodes
                     node._p_note_change()
                     del self.items[p]
                     del self.nodes[p + 1]
+                    node.delete(key)
                 self._p_note_change()
             else:
                 if not is_big(node):
@@ -291,6 +302,38 @@ for bnode_class in [BNode] + BNode.__subclasses__():
 del bnode_class
 
 
+# BNode classes by minimum degree.
+bnode_classes = dict(
+    (bnode_class.minimum_degree, bnode_class)
+    for bnode_class in BNode.__subclasses__()
+    )
+
+
+def bnode_class(degree):
+    """(degree:int) -> BNode subclass
+    Return the BNode subclass whose minimum degree is `degree`.
+    """
+    degree = int(degree)
+    try:
+        return bnode_classes[degree]
+    except KeyError:
+        raise ValueError(
+            'No BNode class of degree %r; choose from %r.'
+            % (degree, sorted(bnode_classes)))
+
+
+def btree_constructor(node_constructor):
+    """(node_constructor:BNode subclass) -> callable
+    Return a callable that creates empty BTrees whose nodes are
+    instances of `node_constructor`.  The node class is available as the
+    `node_constructor` attribute of the callable.
+    """
+    def constructor():
+        return BTree(node_constructor)
+    constructor.node_constructor = node_constructor
+    return constructor
+
+
 class BTree(Persistent):
     """
     Instance attributes:
@@ -38,8 +38,13 @@ class Connection(ConnectionBase):
         Number of calls to commit() or abort() since this instance was created.
         This is used to maintain consistency, and to implement LRU replacement
         in the cache.
+      stats: schevo.stats.Stats | None
+        Statistics to count cache hits, misses, and ghost loads, and to
+        time commits in, if any.
     """
 
+    stats = None
+
     def __init__(self, storage, cache_size=100000):
         """(storage:Storage, cache_size:int=100000)
         Make a connection to `storage`.
@@ -86,6 +91,13 @@ class Connection(ConnectionBase):
         """
         self.cache.set_size(size)
 
+    def set_stats(self, stats):
+        """(stats:schevo.stats.Stats|None)
+        Collect statistics of the cache and storage in `stats`, or stop
+        collecting them if `stats` is None.
+        """
+        self.stats = self.cache.stats = self.storage.stats = stats
+
     def get_transaction_serial(self):
         """() -> int
         Return the number of calls to commit() or abort() on this instance.
@@ -126,6 +138,8 @@ class Connection(ConnectionBase):
             oid = p64(oid)
         obj = self.cache.get(oid)
         if obj is not None:
+            if self.stats is not None:
+                self.stats.count(None, 'cache_hit')
             return obj
         try:
             pickle = self.get_stored_pickle(oid)
@@ -184,6 +198,8 @@ class Connection(ConnectionBase):
         """
         assert self.storage is not None, 'connection is closed'
         assert obj._p_is_ghost()
+        if self.stats is not None:
+            self.stats.count(None, 'ghost_load')
         oid = obj._p_oid
         setstate = obj.__setstate__
         try:
@@ -249,9 +265,12 @@ class Connection(ConnectionBase):
         raise ConflictError if there are any invalid oids saved
         or if there are any invalid oids for non-ghost objects.
         """
+        stats = self.stats
         if not self.changed:
             self._sync()
         else:
+            if stats is not None:
+                start = time()
             if self.invalid_oids:
                 # someone is trying to commit after a read or write conflict
                 raise ConflictError(list(self.invalid_oids))
@@ -282,6 +301,9 @@ class Connection(ConnectionBase):
                     obj._p_connection = None
                     obj._p_ref = None
                 raise
+            if stats is not None:
+                stats.count(None, 'commit_objects', len(self.changed))
+                stats.add(None, 'commit', time() - start)
             self.changed.clear()
         self.shrink_cache()
         self.transaction_serial += 1
@@ -354,6 +376,8 @@ class ObjectDictionary (object):
 
 class Cache(object):
 
+    stats = None
+
     def __init__(self, size):
         self.objects = ObjectDictionary()
         self.recent_objects = set()
@@ -393,6 +417,10 @@ class Cache(object):
             obj._p_connection = connection
             obj._p_status = -1 # obj._p_set_status_ghost()
             objects[oid] = obj
+            if self.stats is not None:
+                self.stats.count(None, 'cache_miss')
+        elif self.stats is not None:
+            self.stats.count(None, 'cache_hit')
         return obj
 
     def get(self, oid):
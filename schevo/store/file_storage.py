@@ -12,6 +12,7 @@ from schevo.store.serialize import split_oids, unpack_record
 from schevo.store.storage import Storage
 from schevo.store.utils import p32, u32, p64, u64
 from tempfile import NamedTemporaryFile
+from time import time
 from zlib import compress, decompress
 import os
 
@@ -58,10 +59,14 @@ class FileStorage(Storage):
       pack_extra : [oid:str] | None
         oids of objects that have been committed after the pack began.  It is
         None if a pack is not in progress.
+      stats : schevo.stats.Stats | None
+        Statistics to count bytes written and time commits in, if any.
     """
 
     _PACK_INCREMENT = 20 # number of records to pack before yielding
 
+    stats = None
+
     def __init__(self, filename=None, readonly=False, repair=False, fp=None):
         """(filename:str=None, readonly:bool=False, repair:bool=False)
         If filename is empty (or None), a temporary file will be used.
@@ -162,6 +167,11 @@ class FileStorage(Storage):
         """
         if self.fp is None:
             raise IOError, 'storage is closed'
+        stats = self.stats
+        if stats is not None:
+            start = time()
+            self.fp.seek(0, 2)
+            start_size = self.fp.tell()
         index = {}
         for z in self._write_transaction(
             self.fp, self._generate_pending_records(), index):
@@ -169,6 +179,9 @@ class FileStorage(Storage):
         self.fp.flush()
         if hasattr(self.fp, 'fileno'):
             fsync(self.fp)
+        if stats is not None:
+            stats.count(None, 'commit_bytes', self.fp.tell() - start_size)
+            stats.add(None, 'storage_end', time() - start)
         self.index.update(index)
         if self.pack_extra is not None:
             self.pack_extra.extend(index)
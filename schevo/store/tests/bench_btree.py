@@ -0,0 +1,54 @@
+"""BTree lookup benchmark across node degrees.
+
+Usage::
+
+    python -m schevo.store.tests.bench_btree [SIZE [LOOKUPS]]
+
+For each available node degree, fills a BTree with SIZE integer keys and
+reports how many random lookups per second it performs, both in memory
+and after committing to a file storage and ghosting its nodes so that
+lookups load them from disk.
+"""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+import sys
+from random import Random
+from time import time
+
+from schevo.store.btree import BTree, bnode_classes
+from schevo.store.connection import Connection
+from schevo.store.file_storage import TempFileStorage
+
+
+def lookups_per_second(bt, keys):
+    """Return the number of lookups of `keys` in `bt` done per second."""
+    start = time()
+    for key in keys:
+        bt[key]
+    return len(keys) / (time() - start)
+
+
+def bench(size=100000, lookups=100000):
+    random = Random(0)
+    keys = range(size)
+    random.shuffle(keys)
+    lookup_keys = [random.randrange(size) for x in xrange(lookups)]
+    print '%6s %14s %14s' % ('degree', 'in memory/s', 'from disk/s')
+    for degree, node_class in sorted(bnode_classes.iteritems()):
+        connection = Connection(TempFileStorage())
+        bt = connection.get_root()['bt'] = BTree(node_class)
+        for key in keys:
+            bt.add(key)
+        connection.commit()
+        warm = lookups_per_second(bt, lookup_keys)
+        connection.shrink_cache()
+        connection.set_cache_size(1)
+        connection.shrink_cache()
+        cold = lookups_per_second(bt, lookup_keys)
+        print '%6i %14i %14i' % (degree, warm, cold)
+
+
+if __name__ == '__main__':
+    bench(*[int(arg) for arg in sys.argv[1:]])
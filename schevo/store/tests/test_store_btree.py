@@ -5,7 +5,9 @@ $Id: utest_btree.py 27868 2006-01-25 14:55:43Z dbinger $
 
 import os
 
-from schevo.store.btree import BTree, BNode
+from schevo.store.btree import (
+    BTree, BNode, BNode4, BNode256, bnode_class, bnode_classes,
+    btree_constructor)
 from schevo.store.connection import Connection
 from schevo.store.file_storage import TempFileStorage
 from random import randint
@@ -192,6 +194,70 @@ class TestCoverage(object):
         assert not bt.has_key(2)
         assert bt.keys() == []
 
+
+class TestDegrees(object):
+
+    def test_get_position(self):
+        for node_class in bnode_classes.itervalues():
+            node = node_class()
+            node.items = [(key, True) for key in range(0, 40, 2)]
+            for key in range(-1, 42):
+                expected = len(node.items)
+                for position, item in enumerate(node.items):
+                    if item[0] >= key:
+                        expected = position
+                        break
+                assert node.get_position(key) == expected, (node_class, key)
+
+    def test_get_position_ignores_values(self):
+        node = BNode()
+        node.items = [(1, 'z'), (2, None), (3, 'a')]
+        assert node.get_position(2) == 1
+        assert node.get_position(3) == 2
+
+    def test_all_degrees(self):
+        for degree, node_class in bnode_classes.iteritems():
+            bt = BTree(node_class)
+            keys = range(1000)
+            keys.reverse()
+            map(bt.add, keys)
+            assert bt.root.__class__ is node_class
+            assert bt.keys() == range(1000)
+            assert len(bt) == 1000
+            for key in (0, 1, 499, 999):
+                assert bt[key] is True
+            for key in range(0, 1000, 3):
+                del bt[key]
+            assert bt.keys() == [k for k in range(1000) if k % 3]
+
+    def test_random_operations(self):
+        for node_class in bnode_classes.itervalues():
+            bt = BTree(node_class)
+            d = {}
+            for k in xrange(2000):
+                number = randint(0, 300)
+                if number in d and randint(0, 1) == 1:
+                    del bt[number]
+                    del d[number]
+                else:
+                    bt[number] = k
+                    d[number] = k
+            assert bt.items() == sorted(d.items()), node_class
+            assert len(bt) == len(d)
+
+    def test_bnode_class(self):
+        assert bnode_class(4) is BNode4
+        assert bnode_class('256') is BNode256
+        assert raises(ValueError, bnode_class, 3)
+
+    def test_btree_constructor(self):
+        constructor = btree_constructor(BNode4)
+        assert constructor.node_constructor is BNode4
+        bt = constructor()
+        assert isinstance(bt, BTree)
+        assert bt.root.__class__ is BNode4
+
+
 if not 'SKIP_SLOW' in os.environ:
     class TestSlow(object):
 
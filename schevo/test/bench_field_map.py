@@ -0,0 +1,86 @@
+"""Field map construction and iteration benchmark.
+
+Usage::
+
+    python -m schevo.test.bench_field_map [FIELDS [REPEAT]]
+
+Creates a field spec of FIELDS string fields, then reports how many
+field maps per second are created, and created and iterated over, both
+with the ordered dictionary previously used for field maps and with
+the compact field maps that share their field spec's key order.
+"""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+import sys
+from time import time
+
+from schevo.constant import UNASSIGNED
+from schevo.field import String
+from schevo.fieldspec import FieldSpecMap, new_field_class
+from schevo.lib.odict import odict
+
+
+def field_spec(size):
+    spec = FieldSpecMap()
+    for x in xrange(size):
+        name = 'field%02i' % x
+        FieldClass = new_field_class(String, slots=False)
+        FieldClass._name = name
+        spec[name] = FieldClass
+    return spec
+
+
+def odict_field_map(spec, instance=None, values={}):
+    """Return a field map as an odict with lazily created fields, the way
+    field maps were created before using compact dictionaries."""
+    field_classes = dict(spec)
+    field_map = odict([(name, None) for name in spec])
+    def field(name):
+        value = dict.__getitem__(field_map, name)
+        if value is None:
+            value = field_classes[name](
+                instance=instance, value=values.get(name, UNASSIGNED))
+            dict.__setitem__(field_map, name, value)
+        return value
+    return field_map, field
+
+
+def maps_per_second(function, repeat):
+    start = time()
+    for x in xrange(repeat):
+        function()
+    return repeat / (time() - start)
+
+
+def bench(size=50, repeat=10000):
+    spec = field_spec(size)
+    values = dict((name, u'value') for name in spec)
+    def odict_create():
+        odict_field_map(spec, values=values)
+    def odict_iterate():
+        field_map, field = odict_field_map(spec, values=values)
+        for name in field_map:
+            field(name)
+    def cdict_create():
+        spec.field_map(values=values)
+    def cdict_iterate():
+        for field in spec.field_map(values=values).itervalues():
+            pass
+    print '%i fields, %i field maps' % (size, repeat)
+    print '%10s %14s %14s' % ('', 'create/s', 'iterate/s')
+    print '%10s %14i %14i' % (
+        'odict',
+        maps_per_second(odict_create, repeat),
+        maps_per_second(odict_iterate, repeat),
+        )
+    print '%10s %14i %14i' % (
+        'cdict',
+        maps_per_second(cdict_create, repeat),
+        maps_per_second(cdict_iterate, repeat),
+        )
+
+
+if __name__ == '__main__':
+    bench(*[int(arg) for arg in sys.argv[1:]])
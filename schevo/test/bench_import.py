@@ -0,0 +1,55 @@
+"""Import time benchmark.
+
+Usage::
+
+    python -m schevo.test.bench_import [REPEAT]
+
+Starts a fresh interpreter REPEAT times for each of a bare start-up,
+importing schevo.database, and importing it then opening an in-memory
+database with a one-extent schema, and reports the fastest and median
+wall-clock times, so that start-up costs such as scanning installed
+packages for backends show up.
+"""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+import os
+import subprocess
+import sys
+from time import time
+
+
+SCRIPTS = [
+    ('startup', 'pass'),
+    ('import', 'import schevo.database'),
+    ('open', 'import schevo.database\n'
+             'from schevo.test import DocTest\n'
+             'DocTest("class Foo(E.Entity):\\n    name = f.string()")'),
+    ]
+
+
+def run_seconds(script):
+    env = os.environ.copy()
+    env['PYTHONPATH'] = os.pathsep.join(sys.path)
+    start = time()
+    process = subprocess.Popen(
+        [sys.executable, '-c', script], env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    errors = process.communicate()[1]
+    elapsed = time() - start
+    if process.returncode != 0:
+        raise RuntimeError('%r failed:\n%s' % (script, errors))
+    return elapsed
+
+
+def bench(repeat=10):
+    print '%i runs each' % repeat
+    print '%10s %10s %10s' % ('', 'fastest', 'median')
+    for name, script in SCRIPTS:
+        times = sorted(run_seconds(script) for x in xrange(repeat))
+        print '%10s %9.3fs %9.3fs' % (name, times[0], times[len(times) // 2])
+
+
+if __name__ == '__main__':
+    bench(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,137 @@
+"""Materialized aggregate unit tests."""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+from schevo.constant import UNASSIGNED
+from schevo import error
+from schevo.test import CreatesSchema, raises
+from schevo.transaction import CallableWrapper
+
+
+class BaseAggregate(CreatesSchema):
+
+    body = """
+
+    class Account(E.Entity):
+
+        name = f.string()
+
+        _key(name)
+
+        _sample_unittest = [
+            (u'cash', ),
+            (u'bank', ),
+            (u'loan', ),
+            ]
+
+
+    class Entry(E.Entity):
+
+        account = f.entity('Account', required=False)
+        amount = f.integer(required=False)
+
+        _aggregate('amount_by_account', sum, 'amount', group_by='account')
+        _aggregate('entries_by_account', len, group_by=account)
+        _aggregate('average_amount', 'avg', amount)
+        _aggregate('entries', 'count')
+
+        _sample_unittest = [
+            ((u'cash', ), 10),
+            ((u'cash', ), 5),
+            ((u'bank', ), 100),
+            ((u'bank', ), UNASSIGNED),
+            (UNASSIGNED, 1),
+            ]
+    """
+
+    def check_rebuilt(self):
+        """Check that aggregates equal those computed from scratch."""
+        values = [(name, db.Entry.aggregate(name))
+                  for name, kind, field_name, group_by
+                  in db.Entry.EntityClass._aggregate_spec]
+        db.reindex('Entry')
+        assert values == [(name, db.Entry.aggregate(name))
+                          for name, value in values]
+
+    def test_spec(self):
+        assert db.Entry.EntityClass._aggregate_spec == (
+            ('amount_by_account', 'sum', 'amount', 'account'),
+            ('average_amount', 'avg', 'amount', None),
+            ('entries', 'count', None, None),
+            ('entries_by_account', 'count', None, 'account'),
+            )
+        assert raises(error.AggregateDoesNotExist,
+                      db.Entry.aggregate, 'missing')
+        assert raises(error.AggregateDoesNotExist,
+                      db.Account.aggregate, 'entries')
+
+    def test_values(self):
+        cash = db.Account.findone(name=u'cash')
+        bank = db.Account.findone(name=u'bank')
+        loan = db.Account.findone(name=u'loan')
+        assert db.Entry.aggregate('amount_by_account', cash) == 15
+        assert db.Entry.aggregate('amount_by_account', bank) == 100
+        assert db.Entry.aggregate('amount_by_account', loan) == 0
+        assert db.Entry.aggregate('amount_by_account', UNASSIGNED) == 1
+        assert db.Entry.aggregate('amount_by_account') == {
+            cash: 15, bank: 100, UNASSIGNED: 1}
+        assert db.Entry.aggregate('entries_by_account', bank) == 2
+        assert db.Entry.aggregate('entries') == 5
+        assert db.Entry.aggregate('average_amount') == 29.0
+        assert raises(TypeError, db.Entry.aggregate, 'entries', cash)
+
+    def test_maintained_by_transactions(self):
+        cash = db.Account.findone(name=u'cash')
+        bank = db.Account.findone(name=u'bank')
+        loan = db.Account.findone(name=u'loan')
+        entry = ex(db.Entry.t.create(account=loan, amount=7))
+        assert db.Entry.aggregate('amount_by_account', loan) == 7
+        assert db.Entry.aggregate('entries') == 6
+        ex(entry.t.update(amount=8))
+        assert db.Entry.aggregate('amount_by_account', loan) == 8
+        ex(entry.t.update(account=cash))
+        assert db.Entry.aggregate('amount_by_account', loan) == 0
+        assert db.Entry.aggregate('amount_by_account', cash) == 23
+        assert db.Entry.aggregate('entries_by_account', cash) == 3
+        ex(entry.t.update(amount=UNASSIGNED))
+        assert db.Entry.aggregate('amount_by_account', cash) == 15
+        assert db.Entry.aggregate('entries_by_account', cash) == 3
+        self.check_rebuilt()
+        ex(entry.t.delete())
+        assert db.Entry.aggregate('entries_by_account', cash) == 2
+        assert db.Entry.aggregate('entries') == 5
+        # Groups without entries are removed.
+        for entry in db.Entry.find(account=bank):
+            ex(entry.t.delete())
+        assert bank not in db.Entry.aggregate('amount_by_account')
+        self.check_rebuilt()
+
+    def test_inverted(self):
+        cash = db.Account.findone(name=u'cash')
+        before = [db.Entry.aggregate(name) for name in
+                  ('amount_by_account', 'entries_by_account',
+                   'average_amount', 'entries')]
+        def change_then_fail(db):
+            for entry in db.Entry.find(account=cash):
+                db.execute(entry.t.update(amount=1000))
+            db.execute(db.Entry.t.create(account=cash, amount=3))
+            db.execute(db.Entry.find(amount=1)[0].t.delete())
+            raise RuntimeError()
+        def outer(db):
+            try:
+                db.execute(CallableWrapper(change_then_fail))
+            except RuntimeError:
+                pass
+        ex(CallableWrapper(outer))
+        after = [db.Entry.aggregate(name) for name in
+                 ('amount_by_account', 'entries_by_account',
+                  'average_amount', 'entries')]
+        assert before == after
+
+
+class TestAggregate2(BaseAggregate):
+
+    include = True
+
+    format = 2
@@ -0,0 +1,134 @@
+"""BTree node degree tuning tests."""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+import os
+import tempfile
+from textwrap import dedent
+
+from schevo import database
+from schevo.store.btree import BNode4, BNode8, BNode16, BNode64
+from schevo.test.base import BaseTest, PREAMBLE
+
+
+BODY = """
+    class Foo(E.Entity):
+
+        name = f.string()
+
+        _key(name)
+
+        _initial = [
+            (u'Foo %i' % i, ) for i in xrange(100)
+            ]
+
+    class Bar(E.Entity):
+
+        id = f.integer()
+        foo = f.entity('Foo')
+
+        _key(id)
+        _index(foo)
+
+        _initial = [
+            (i, (u'Foo %i' % (i % 10), )) for i in xrange(100)
+            ]
+    """
+
+SCHEMA = PREAMBLE + dedent(BODY)
+
+
+class TestBTreeDegrees(BaseTest):
+
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        os.remove(self.filename)
+        self.url = 'schevostore:///' + self.filename
+
+    def tearDown(self):
+        for filename in [self.filename, self.filename + '.prepack']:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def node_classes(self, db):
+        """Return a dictionary of role:node-class-set items."""
+        classes = dict(entities=set(), index_branches=set(),
+                       index_leaves=set(), links=set())
+        def walk(tree, depth):
+            if depth == 0:
+                classes['index_leaves'].add(tree.root.__class__)
+            else:
+                classes['index_branches'].add(tree.root.__class__)
+                for child in tree.itervalues():
+                    walk(child, depth - 1)
+        for extent in db._extent_maps_by_id.itervalues():
+            classes['entities'].add(extent['entities'].root.__class__)
+            for entity in extent['entities'].itervalues():
+                for link_tree in entity['links'].itervalues():
+                    classes['links'].add(link_tree.root.__class__)
+            for index_spec, (unique, tree) in extent['indices'].iteritems():
+                walk(tree, len(index_spec))
+        return classes
+
+    def test_default_degrees(self):
+        db = database.create(self.url, schema_source=SCHEMA)
+        try:
+            classes = self.node_classes(db)
+            for role in classes:
+                assert classes[role] == set([BNode16]), role
+        finally:
+            db.close()
+
+    def test_backend_args(self):
+        backend_args = dict(
+            entities_degree='64',
+            index_branch_degree='8',
+            index_leaf_degree='4',
+            links_degree='4',
+            )
+        db = database.create(self.url, backend_args=backend_args,
+                             schema_source=SCHEMA)
+        try:
+            classes = self.node_classes(db)
+            assert classes['entities'] == set([BNode64])
+            assert classes['index_branches'] == set([BNode8])
+            assert classes['index_leaves'] == set([BNode4])
+            assert classes['links'] == set([BNode4])
+            assert len(db.Bar.find(foo=db.Foo.findone(name=u'Foo 3'))) == 10
+            assert db.Foo.findone(name=u'Foo 42') is not None
+        finally:
+            db.close()
+
+    def test_repack(self):
+        db = database.create(self.url, schema_source=SCHEMA)
+        db.close()
+        backend_args = dict(
+            entities_degree=64,
+            index_branch_degree=8,
+            index_leaf_degree=4,
+            links_degree=4,
+            )
+        database.convert_format(
+            self.url, backend_args=backend_args, repack=True)
+        db = database.open(self.url)
+        try:
+            classes = self.node_classes(db)
+            assert classes['entities'] == set([BNode64])
+            assert classes['index_branches'] == set([BNode8])
+            assert classes['index_leaves'] == set([BNode4])
+            assert classes['links'] == set([BNode4])
+            assert len(db.Foo) == 100
+            assert len(db.Bar) == 100
+            foo = db.Foo.findone(name=u'Foo 3')
+            assert len(db.Bar.find(foo=foo)) == 10
+            assert foo.s.count() == 10
+            assert sorted(bar.id for bar in foo.m.bars()) == range(3, 100, 10)
+            # Changes after repacking maintain the structures.
+            db.execute(db.Bar.findone(id=3).t.delete())
+            assert foo.s.count() == 9
+            db.execute(db.Bar.t.create(id=100, foo=foo))
+            assert len(db.Bar.find(foo=foo)) == 10
+        finally:
+            db.close()
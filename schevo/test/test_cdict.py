@@ -0,0 +1,124 @@
+"""
+
+Initialization::
+
+  >>> from schevo.lib.cdict import cdict, KeyOrder
+  >>> VALUES = range(1, 21)
+  >>> KEYS = [str(v) for v in VALUES]
+  >>> ITEMS = zip(KEYS, VALUES)
+  >>> REPR = '{' + ', '.join(['%r: %r' % item for item in ITEMS]) + '}'
+
+Create an empty cdict::
+
+  >>> cd = cdict()
+  >>> assert cd.keys() == []
+  >>> assert cd.values() == []
+  >>> assert cd.items() == []
+
+Create a cdict based on a list or a generator::
+
+  >>> cd = cdict(ITEMS)
+  >>> assert cd.keys() == KEYS
+  >>> assert cd.values() == VALUES
+  >>> assert cd.items() == ITEMS
+  >>> assert repr(cd) == REPR
+  >>> cd = cdict(i for i in ITEMS)
+  >>> assert cd.items() == ITEMS
+
+Create a cdict with duplicate items; the last value wins but the
+first position is kept::
+
+  >>> cd = cdict([('a', 1), ('b', 2), ('a', 3)])
+  >>> cd.items()
+  [('a', 3), ('b', 2)]
+
+cdicts built up with the same keys in the same order share their key
+order, and only keep their own values::
+
+  >>> cd1 = cdict(ITEMS)
+  >>> cd2 = cdict((k, v * 2) for k, v in ITEMS)
+  >>> assert cd1._order is cd2._order
+  >>> assert cd2['3'] == 6
+
+A cdict may also be created directly from a key order and a list of
+values, which are used as-is::
+
+  >>> order = KeyOrder(['x', 'y'])
+  >>> values = [None, None]
+  >>> cd = cdict(order=order, values=values)
+  >>> cd['y'] = 2
+  >>> cd.items()
+  [('x', None), ('y', 2)]
+  >>> values
+  [None, 2]
+  >>> cdict(order=order, values=[1])
+  Traceback (most recent call last):
+      ...
+  ValueError: 1 values given for 2 keys
+
+Adding keys to a cdict created from a key order does not change it::
+
+  >>> cd['z'] = 3
+  >>> cd.keys()
+  ['x', 'y', 'z']
+  >>> order.keys
+  ('x', 'y')
+
+Get, test for, pop, and delete items::
+
+  >>> cd = cdict(ITEMS)
+  >>> assert cd.get('5') == 5
+  >>> assert cd.get('99') is None
+  >>> assert '5' in cd
+  >>> assert not cd.has_key('99')
+  >>> assert cd.pop('5') == 5
+  >>> assert cd.pop('5', 'foo') == 'foo'
+  >>> del cd['6']
+  >>> assert len(cd) == 18
+  >>> assert cd.keys() == KEYS[:4] + KEYS[6:]
+  >>> cd['5'] = 5
+  >>> assert cd.keys()[-1] == '5'
+  >>> cd.popitem()
+  ('5', 5)
+  >>> cd['99']
+  Traceback (most recent call last):
+      ...
+  KeyError: '99'
+
+Compare to other cdicts and dicts::
+
+  >>> assert cdict(ITEMS) == dict(ITEMS)
+  >>> assert cdict(ITEMS) == cdict(reversed(ITEMS))
+  >>> assert cdict(ITEMS) != cdict(ITEMS[1:])
+
+Use `insert`, `index`, and `reorder` as with odict::
+
+  >>> cd = cdict()
+  >>> cd['c'] = 3
+  >>> cd['b'] = 2
+  >>> cd['a'] = 1
+  >>> cd.insert(1, 'd', 4)
+  >>> cd.keys()
+  ['c', 'd', 'b', 'a']
+  >>> cd.index('b')
+  2
+  >>> cd.reorder(0, 'a')
+  >>> cd.items()
+  [('a', 1), ('c', 3), ('d', 4), ('b', 2)]
+
+Update a cdict from another, optionally moving updated keys to the
+end::
+
+  >>> cd = cdict([('a', 1), ('b', 2)])
+  >>> cd.update(cdict([('a', 10), ('c', 3)]))
+  >>> cd.items()
+  [('a', 10), ('b', 2), ('c', 3)]
+  >>> cd.update(cdict([('a', 1)]), reorder=True)
+  >>> cd.items()
+  [('b', 2), ('c', 3), ('a', 1)]
+  >>> cd.update(dict(ITEMS))
+  Traceback (most recent call last):
+      ...
+  ValueError: other must be a cdict
+
+"""
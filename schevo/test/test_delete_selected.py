@@ -0,0 +1,159 @@
+"""Delete Selected transaction unit tests."""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+from schevo.constant import UNASSIGNED
+from schevo import error
+from schevo.test import CreatesSchema, raises
+from schevo.transaction import CallableWrapper
+
+
+class BaseDeleteSelected(CreatesSchema):
+
+    body = """
+
+    class Record(E.Entity):
+
+        name = f.string()
+        previous = f.entity('Record', required=False)
+        alias = f.entity('Record', on_delete=UNASSIGN, required=False)
+
+        _key(name)
+
+
+    class Detail(E.Entity):
+
+        record = f.entity('Record', on_delete=CASCADE)
+        number = f.integer()
+
+
+    class Audit(E.Entity):
+
+        record = f.entity('Record', on_delete=UNASSIGN, required=False)
+
+        class _Update(T.Update):
+
+            def _before_execute(self, db, entity):
+                db.execute(db.Log.t.create(text=u'audit updated'))
+
+
+    class Archive(E.Entity):
+
+        name = f.string()
+
+        class _Delete(T.Delete):
+
+            def _after_execute(self, db):
+                db.execute(db.Log.t.create(text=u'archive deleted'))
+
+
+    class Log(E.Entity):
+
+        text = f.string()
+    """
+
+    def _chain(self, count):
+        """Create a chain of records, each referring to the previous one,
+        with two details each."""
+        records = []
+        previous = UNASSIGNED
+        for i in xrange(count):
+            record = ex(db.Record.t.create(
+                name='record %i' % i, previous=previous, alias=previous))
+            for number in xrange(2):
+                ex(db.Detail.t.create(record=record, number=number))
+            records.append(record)
+            previous = record
+        return records
+
+    def test_delete_selected(self):
+        records = self._chain(10)
+        tx = db.Record.EntityClass.t.delete_selected(records[5:])
+        counts = ex(tx)
+        assert counts == dict(Record=5, Detail=10)
+        assert len(db.Record) == 5
+        assert len(db.Detail) == 10
+        assert records[4] in db.Record
+        assert records[5] not in db.Record
+        # Links from the deleted records are gone.
+        assert records[4].s.count() == 2
+        ex(records[4].t.delete())
+
+    def test_references_within_selection_are_allowed(self):
+        # Each record restricts deletion of the previous one, so they
+        # can only be deleted together.
+        records = self._chain(5)
+        assert raises(error.DeleteRestricted, ex, records[0].t.delete())
+        tx = db.Record.EntityClass.t.delete_selected(list(reversed(records)))
+        assert ex(tx) == dict(Record=5, Detail=10)
+        assert len(db.Record) == 0
+        assert len(db.Detail) == 0
+
+    def test_references_from_outside_selection_restrict(self):
+        records = self._chain(3)
+        tx = db.Record.EntityClass.t.delete_selected(records[:2])
+        try:
+            ex(tx)
+        except error.DeleteRestricted, e:
+            assert e.restrictions == set(
+                [(records[1], records[2], 'previous')])
+        else:
+            raise AssertionError('DeleteRestricted not raised.')
+        assert len(db.Record) == 3
+        assert len(db.Detail) == 6
+
+    def test_unassigners_outside_selection(self):
+        records = self._chain(3)
+        audit = ex(db.Audit.t.create(record=records[0]))
+        ex(db.Record.EntityClass.t.delete_selected(records))
+        assert audit.record is UNASSIGNED
+        # Unassigning used the customized update transaction.
+        assert len(db.Log) == 1
+
+    def test_duplicates_and_deleted_entities_ignored(self):
+        records = self._chain(2)
+        ex(db.Record.t.create(name='lone'))
+        lone = db.Record.findone(name='lone')
+        tx = db.Record.EntityClass.t.delete_selected([lone, lone])
+        assert ex(tx) == dict(Record=1)
+        tx = db.Record.EntityClass.t.delete_selected(records + [records[0]])
+        assert ex(tx) == dict(Record=2, Detail=4)
+        assert len(db.Record) == 0
+
+    def test_customized_delete_hooks(self):
+        archives = [ex(db.Archive.t.create(name=u'archive %i' % i))
+                    for i in xrange(3)]
+        counts = ex(db.Archive.EntityClass.t.delete_selected(archives))
+        assert counts == dict(Archive=3)
+        assert len(db.Log) == 3
+
+    def test_inverted(self):
+        records = self._chain(4)
+        audit = ex(db.Audit.t.create(record=records[1]))
+        def delete_then_fail(db):
+            db.execute(db.Record.EntityClass.t.delete_selected(records))
+            raise RuntimeError()
+        def outer(db):
+            assert raises(RuntimeError, db.execute,
+                          CallableWrapper(delete_then_fail))
+        ex(CallableWrapper(outer))
+        assert len(db.Record) == 4
+        assert len(db.Detail) == 8
+        assert audit.record == records[1]
+        for previous, record in zip(records, records[1:]):
+            assert record.previous == previous
+            assert record.alias == previous
+        counts = [record.s.count() for record in records]
+        assert counts == [4, 5, 4, 2]
+        assert db.Record.findone(name='record 2') == records[2]
+        # The restored entities may be deleted again.
+        ex(db.Record.EntityClass.t.delete_selected(records))
+        assert len(db.Record) == 0
+
+
+class TestDeleteSelected2(BaseDeleteSelected):
+
+    include = True
+
+    format = 2
@@ -4,6 +4,7 @@
 # See LICENSE for details.
 
 import datetime
+import gc
 import random
 
 from schevo.constant import UNASSIGNED
@@ -854,6 +855,37 @@ class BaseEntityExtent(CreatesSchema):
         assert realm.s.rev == 1
         assert realm.name == realm2.name
 
+    def test_entity_identity(self):
+        """While an entity instance is in use, getting the same entity
+        again gives the same instance."""
+        account = db.Account.findone(name='Savings')
+        assert db.Account[account.s.oid] is account
+        assert id(account) in map(id, db.Account.find())
+        assert not hasattr(account, '__dict__')
+        # Instances no longer in use are not kept.
+        oid = account.s.oid
+        del account
+        gc.collect()
+        assert oid not in db.Account.EntityClass._identities
+        # Fields gotten through the `f` namespace are current.
+        realm = db.execute(db.Realm.t.create(name='Foo'))
+        assert db.Realm.findone(name='Foo') is realm
+        assert realm.f.name.get() == 'Foo'
+        db.execute(realm.t.update(name='Bar'))
+        assert db.Realm[realm.s.oid].f.name.get() == 'Bar'
+
+    def test_entity_identity_value_transforms(self):
+        """Value transforms set on an entity instance are not shared
+        with those who get the same entity later."""
+        realm = db.execute(db.Realm.t.create(name='Foo'))
+        realm._value_transforms = {'name': lambda value: value.upper()}
+        assert realm.name == 'FOO'
+        other = db.Realm[realm.s.oid]
+        assert other is not realm
+        assert other.name == 'Foo'
+        assert db.Realm.findone(name='Foo') is other
+        assert realm.name == 'FOO'
+
     def test_extent_sorting(self):
         """When sorting sequences of extent instances, their sort
         order is determined by their name."""
@@ -7,6 +7,7 @@ import datetime
 
 from schevo.constant import UNASSIGNED
 from schevo import error
+from schevo.entity import _DeferredSetup
 from schevo.label import plural
 from schevo.test import CreatesSchema
 from schevo.transaction import Transaction
@@ -124,6 +125,86 @@ class BaseSubclassTransactionCorrectness(CreatesSchema):
         assert tx.s.extent_name == 'Second'
 
 
+class BaseDeferredSetup(CreatesSchema):
+
+    body = '''
+
+    class _HotelBase(E.Entity):
+
+        name = f.string()
+
+        _key(name)
+
+        class _Update(T.Update):
+
+            def _setup(self):
+                self.f.name.readonly = True
+
+        class _DefaultView(V.View):
+
+            def _setup(self, entity):
+                self.f.upper_name = f.string()
+                self.upper_name = entity.name.upper()
+
+
+    class Hotel(E._HotelBase):
+
+        rooms = f.integer(required=False)
+
+        def t_close(self):
+            return self.t.delete()
+    '''
+
+    _use_db_cache = False
+
+    def test_deferred_setup(self):
+        Hotel = db.Hotel.EntityClass
+        HotelBase = db.schema.E._HotelBase
+        # Transactions, views and method names are not set up until one
+        # of them is first gotten.
+        assert Hotel._deferred_setup is not None
+        assert HotelBase._deferred_setup is not None
+        hotel = db.execute(db.Hotel.t.create(name=u'Ritz', rooms=10))
+        assert Hotel._deferred_setup is None
+        assert HotelBase._deferred_setup is None
+        assert Hotel._Create._EntityClass is Hotel
+        assert Hotel._Create._db is db
+        assert Hotel._Update._db is db
+        assert 't_close' in Hotel._t_instancemethod_names
+        assert '_t_instancemethod_names' in Hotel.__dict__
+        tx = hotel.t.update()
+        assert tx._field_spec.keys() == ['name', 'rooms']
+        assert tx.f.name.readonly
+        assert tx.s.extent_name == 'Hotel'
+        view = hotel.v.default()
+        assert view.upper_name == u'RITZ'
+        assert view._EntityClass is Hotel
+        db.execute(hotel.t.close())
+        assert len(db.Hotel) == 0
+
+    def test_deferred_setup_keeps_attributes(self):
+        # Other threads get the attributes without taking the setup
+        # lock, so none may go missing while the class is set up.
+        Hotel = db.Hotel.EntityClass
+        names = Hotel._deferred_setup[0]
+        missing = []
+        setup_views = Hotel.setup_views
+        def check_setup_views(*args):
+            for name in names:
+                if name not in Hotel.__dict__:
+                    missing.append(name)
+            return setup_views(*args)
+        Hotel.setup_views = staticmethod(check_setup_views)
+        try:
+            assert Hotel._Create._EntityClass is Hotel
+        finally:
+            del Hotel.setup_views
+        assert missing == []
+        assert '_setting_up' not in Hotel.__dict__
+        for name in names:
+            assert not isinstance(getattr(Hotel, name, None), _DeferredSetup)
+
+
 # class TestHiddenBases1(BaseHiddenBases):
 
 #     include = True
@@ -164,3 +245,10 @@ class TestSubclassTransactionCorrectness2(BaseSubclassTransactionCorrectness):
     include = True
 
     format = 2
+
+
+class TestDeferredSetup2(BaseDeferredSetup):
+
+    include = True
+
+    format = 2
@@ -8,6 +8,7 @@ TODO:
 # Copyright (c) 2001-2009 ElevenCraft Inc.
 # See LICENSE for details.
 
+from schevo.constant import UNASSIGNED
 from schevo.test import CreatesSchema
 
 from schevo.field import not_expensive, not_fget, not_hidden
@@ -27,6 +28,31 @@ class BaseFieldMaps(CreatesSchema):
         @f.string(expensive=True)
         def ddd(self):
             return 'def'
+
+
+    class Bar(E.Entity):
+
+        foo = f.entity('Foo')
+        name = f.string()
+
+        @f.string()
+        def upper_name(self):
+            self._calculated.append(self.name)
+            return self.name.upper()
+
+        _calculated = []
+
+
+    class Baz(E.Entity):
+
+        aaa = f.integer(required=False)
+        bbb = f.string()
+        ccc = f.float()
+
+        class _Create(T.Create):
+
+            def _setup(self):
+                del self.f.aaa
     '''
 
     def test_entity_sys_field_map(self):
@@ -92,6 +118,62 @@ class BaseFieldMaps(CreatesSchema):
         keys = fkeys(not_fget, not_hidden)
         assert expected == keys
 
+    def test_entity_sys_field_map_is_lazy(self):
+        foo = db.execute(db.Foo.t.create(aaa='a', bbb='b'))
+        bar = db.execute(db.Bar.t.create(foo=foo, name='bar'))
+        calculated = db.Bar.EntityClass._calculated
+        del calculated[:]
+        field_map = bar.s.field_map()
+        assert field_map.keys() == ['foo', 'name', 'upper_name']
+        # Fields are created when first gotten.
+        assert field_map._values[0] is None
+        assert field_map['foo'].get() == foo
+        assert field_map._values[0] is not None
+        assert field_map._values[1] is None
+        # Calculated fields are only calculated when their value is
+        # gotten.
+        field = field_map['upper_name']
+        assert calculated == []
+        assert field.get() == 'BAR'
+        assert calculated == ['bar']
+        # Filtered fields are not created.
+        field_map = bar.s.field_map(not_fget)
+        assert field_map.keys() == ['foo', 'name']
+        assert field_map.get('name').get() == 'bar'
+        assert field_map.get('upper_name') is None
+        assert calculated == ['bar']
+
+    def test_field_map_keys_changed_before_fields_made(self):
+        foo = db.execute(db.Foo.t.create(aaa='a', bbb='b'))
+        bar = db.execute(db.Bar.t.create(foo=foo, name='bar'))
+        field_map = bar.s.field_map()
+        del field_map['foo']
+        assert field_map['name'].get() == 'bar'
+        field_map = bar.s.field_map()
+        field_map.pop('foo')
+        assert field_map.values()[0].get() == 'bar'
+        field_map = bar.s.field_map()
+        field_map.insert(0, 'other', field_map['upper_name'])
+        assert field_map['foo'].get() == foo
+        assert [field.get() for field in field_map.values()] == [
+            'BAR', foo, 'bar', 'BAR']
+        field_map = bar.s.field_map()
+        field_map.reorder(2, 'foo')
+        assert [name for name, field in field_map.iteritems()] == [
+            'name', 'upper_name', 'foo']
+        assert field_map['name'].get() == 'bar'
+        assert field_map['upper_name'].get() == 'BAR'
+
+    def test_field_deleted_in_setup(self):
+        tx = db.Baz.t.create()
+        assert tx.s.field_map().keys() == ['bbb', 'ccc']
+        tx.bbb = 'b'
+        tx.ccc = 3.5
+        baz = db.execute(tx)
+        assert baz.aaa is UNASSIGNED
+        assert baz.bbb == 'b'
+        assert baz.ccc == 3.5
+
 
 # class TestFieldMaps1(BaseFieldMaps):
 
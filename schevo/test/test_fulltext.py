@@ -0,0 +1,139 @@
+"""Full-text index unit tests."""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+from schevo.constant import UNASSIGNED
+from schevo import error
+from schevo.test import CreatesSchema, raises
+from schevo.text import parse_query, term_counts, tokenize
+from schevo.transaction import CallableWrapper
+
+
+class BaseFulltext(CreatesSchema):
+
+    body = """
+
+    class Article(E.Entity):
+
+        title = f.string()
+        body = f.string(multiline=True, required=False)
+        author = f.string(required=False)
+
+        _key(title)
+        _index_fulltext(title, body)
+
+        _sample_unittest = [
+            (u'Gardening basics', u'Water the garden. Garden daily.',
+             u'Alice'),
+            (u'Garden parties', u'Hosting a party in the garden.', u'Bob'),
+            (u'Cooking', u'Recipes from the kitchen garden.', u'Garden'),
+            (u'Painting', UNASSIGNED, u'Carol'),
+            ]
+
+
+    class Note(E.Entity):
+
+        text = f.string()
+    """
+
+    def titles(self, articles):
+        return [article.title for article in articles]
+
+    def test_tokenize(self):
+        assert tokenize(u'Hello, World! 42') == [u'hello', u'world', u'42']
+        assert tokenize(UNASSIGNED) == []
+        assert term_counts([u'a b', u'A', UNASSIGNED]) == {u'a': 2, u'b': 1}
+
+    def test_parse_query(self):
+        assert parse_query(u'garden party') == [
+            [(u'garden', False), (u'party', False)]]
+        assert parse_query(u'garden AND part* OR cook*') == [
+            [(u'garden', False), (u'part', True)], [(u'cook', True)]]
+        assert parse_query(u'OR kitchen-garden OR') == [
+            [(u'kitchen', False), (u'garden', False)]]
+        assert parse_query(u'') == []
+
+    def test_spec(self):
+        assert db.Article.EntityClass._fulltext_index_spec == (
+            'body', 'title')
+        assert db.Note.EntityClass._fulltext_index_spec == ()
+        assert 'fulltext_index' not in db._extent_map('Note')
+        assert raises(error.IndexDoesNotExist, db.Note.search, u'x')
+
+    def test_ranked(self):
+        # Articles mentioning "garden" most often come first.
+        assert self.titles(db.Article.search(u'garden')) == [
+            u'Gardening basics', u'Garden parties', u'Cooking']
+        assert self.titles(db.Article.search(u'garden', limit=1)) == [
+            u'Gardening basics']
+        # Fields not in the full-text index are not searched.
+        assert db.Article.search(u'alice') == []
+        assert db.Article.search(u'') == []
+
+    def test_and_or_prefix(self):
+        assert self.titles(db.Article.search(u'garden party')) == [
+            u'Garden parties']
+        assert self.titles(db.Article.search(u'garden AND kitchen')) == [
+            u'Cooking']
+        assert db.Article.search(u'garden missing') == []
+        assert self.titles(db.Article.search(u'painting OR recipes')) == [
+            u'Cooking', u'Painting']
+        assert self.titles(db.Article.search(u'gard*')) == [
+            u'Gardening basics', u'Garden parties', u'Cooking']
+        assert self.titles(db.Article.search(u'part* OR paint*')) == [
+            u'Garden parties', u'Painting']
+
+    def test_maintained_by_transactions(self):
+        painting = db.Article.findone(title=u'Painting')
+        ex(painting.t.update(body=u'Painting the garden fence.'))
+        assert self.titles(db.Article.search(u'fence')) == [u'Painting']
+        ex(painting.t.update(author=u'Dave'))
+        assert self.titles(db.Article.search(u'fence')) == [u'Painting']
+        ex(painting.t.update(body=UNASSIGNED))
+        assert db.Article.search(u'fence') == []
+        new = ex(db.Article.t.create(title=u'Fences'))
+        assert self.titles(db.Article.search(u'fence*')) == [u'Fences']
+        ex(new.t.delete())
+        assert db.Article.search(u'fence*') == []
+        terms = db._extent_map('Article')['fulltext_index']['terms']
+        assert u'fences' not in terms
+
+    def test_inverted(self):
+        cooking = db.Article.findone(title=u'Cooking')
+        def change_then_fail(db):
+            db.execute(cooking.t.update(body=u'Baking bread.'))
+            db.execute(db.Article.t.create(title=u'Bread'))
+            raise RuntimeError()
+        def outer(db):
+            try:
+                db.execute(CallableWrapper(change_then_fail))
+            except RuntimeError:
+                pass
+        ex(CallableWrapper(outer))
+        assert self.titles(db.Article.search(u'kitchen')) == [u'Cooking']
+        assert db.Article.search(u'bread') == []
+
+    def test_reindex(self):
+        extent_map = db._extent_map('Article')
+        fulltext_index = extent_map['fulltext_index']
+        terms = fulltext_index['terms']
+        terms[u'stale'] = db._IndexLeafBTree()
+        terms[u'stale'][1] = 1
+        assert self.titles(db.Article.search(u'stale')) == [
+            u'Gardening basics']
+        db.reindex()
+        assert db.Article.search(u'stale') == []
+        assert self.titles(db.Article.search(u'garden')) == [
+            u'Gardening basics', u'Garden parties', u'Cooking']
+        def reindex_within(db):
+            db.reindex('Article')
+        assert raises(error.DatabaseExecutingTransaction,
+                      ex, CallableWrapper(reindex_within))
+
+
+class TestFulltext2(BaseFulltext):
+
+    include = True
+
+    format = 2
@@ -0,0 +1,68 @@
+"""Import time and backend discovery unit tests."""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+import os
+import subprocess
+import sys
+
+from schevo.backend import BackendRegistry, backends
+
+
+# Seconds that importing schevo.database may take in a fresh
+# interpreter.  This is generous enough for slow machines; use
+# bench_import to measure it.
+IMPORT_BUDGET = 5.0
+
+IMPORT_SCRIPT = """
+import sys
+from time import time
+start = time()
+import schevo.database
+print time() - start
+for name in ['pkg_resources', 'schevo.store.backend']:
+    print name in sys.modules
+"""
+
+
+def run_import_script():
+    env = os.environ.copy()
+    env['PYTHONPATH'] = os.pathsep.join(sys.path)
+    process = subprocess.Popen(
+        [sys.executable, '-c', IMPORT_SCRIPT],
+        env=env, stdout=subprocess.PIPE)
+    output = process.communicate()[0]
+    assert process.returncode == 0
+    elapsed, pkg_resources, store_backend = output.split()
+    return float(elapsed), pkg_resources == 'True', store_backend == 'True'
+
+
+def test_import_is_lazy():
+    elapsed, pkg_resources, store_backend = run_import_script()
+    assert elapsed < IMPORT_BUDGET, (
+        'import schevo.database took %.2fs' % elapsed)
+    # Backends are not discovered or loaded until used.
+    assert not pkg_resources
+    assert not store_backend
+
+
+def test_backend_by_name():
+    from schevo.store.backend import SchevoStoreBackend
+    assert backends['schevostore'] is SchevoStoreBackend
+    assert backends.get('nonexistent') is None
+    assert 'nonexistent' not in backends
+    # Installed packages are scanned only once.
+    scanned = backends._entry_points
+    assert scanned is not None
+    assert backends.get('nonexistent') is None
+    assert backends._entry_points is scanned
+
+
+def test_registered_backend():
+    class FakeBackend(object):
+        pass
+    registry = BackendRegistry({})
+    registry['fake'] = FakeBackend
+    assert registry['fake'] is FakeBackend
+    assert ('fake', FakeBackend) in registry.items()
@@ -0,0 +1,185 @@
+"""Inversion log unit tests."""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+from schevo.constant import UNASSIGNED
+from schevo.inversion import InversionLog
+from schevo.test import CreatesSchema, raises
+from schevo.transaction import CallableWrapper
+
+
+class Recorder(object):
+    """Stand-in for a database, with a method to invert to."""
+
+    def undo(self, *args, **kw):
+        return args, kw
+
+
+class TestInversionLog(object):
+
+    def setUp(self):
+        self.db = Recorder()
+
+    def test_in_memory(self):
+        log = InversionLog(self.db)
+        undo = self.db.undo
+        for i in xrange(5):
+            log.append(undo, (i, ), dict(x=i))
+        assert len(log) == 5
+        assert log._file is None
+        method, args, kw = log[3]
+        assert method == undo
+        assert args == (3, )
+        assert kw == dict(x=3)
+        log.truncate(2)
+        assert len(log) == 2
+        assert log[0][1] == (0, )
+        assert log[1][1] == (1, )
+
+    def test_spill(self):
+        log = InversionLog(self.db, memory_limit=200)
+        undo = self.db.undo
+        for i in xrange(100):
+            log.append(undo, ('x' * i, i), {})
+        assert log._file is not None
+        assert len(log._ends) > 0
+        assert len(log) == 100
+        for i in [0, 1, 50, 98, 99]:
+            method, args, kw = log[i]
+            assert args == ('x' * i, i)
+        # Truncate into the spilled records, then append again.
+        log.truncate(10)
+        assert len(log) == 10
+        assert len(log._memory) == 0
+        log.append(undo, ('again', ), {})
+        assert log[10][1] == ('again', )
+        assert log[9][1] == ('x' * 9, 9)
+        log.close()
+        assert len(log) == 0
+        assert log._file is None
+
+    def test_views(self):
+        log = InversionLog(self.db, memory_limit=100)
+        undo = self.db.undo
+        outer = log.view()
+        outer.append((undo, (1, ), {}))
+        inner = log.view()
+        assert not inner
+        inner.append((undo, (2, ), {}))
+        inner.append((undo, (3, ), {}))
+        inner.freeze()
+        assert raises(RuntimeError, inner.append, (undo, (4, ), {}))
+        outer.append((undo, (4, ), {}))
+        assert [args for method, args, kw in inner] == [(2, ), (3, )]
+        assert ([args for method, args, kw in outer]
+                == [(1, ), (2, ), (3, ), (4, )])
+        # Popping from a frozen view leaves later records alone.
+        assert inner.pop()[1] == (3, )
+        assert len(inner) == 1
+        assert len(log) == 4
+        # Popping from the end of the log truncates it.
+        assert outer.pop()[1] == (4, )
+        assert len(log) == 3
+        failed = log.view()
+        failed.append((undo, (5, ), {}))
+        assert failed.pop()[1] == (5, )
+        assert not failed
+        assert raises(IndexError, failed.pop)
+        assert len(log) == 3
+
+
+class BaseInversionSpill(CreatesSchema):
+
+    body = """
+
+    class Foo(E.Entity):
+
+        name = f.string()
+        count = f.integer()
+        bar = f.entity('Bar', required=False)
+
+        _key(name)
+
+
+    class Bar(E.Entity):
+
+        name = f.string()
+
+        _key(name)
+    """
+
+    def setUp(self):
+        CreatesSchema.setUp(self)
+        db.inversion_memory_limit = 500
+
+    def test_inner_failure_inverted_from_disk(self):
+        bar = ex(db.Bar.t.create(name=u'bar'))
+        foos = [ex(db.Foo.t.create(name=u'foo %i' % i, count=i))
+                for i in xrange(20)]
+        def change_then_fail(db):
+            for i, foo in enumerate(foos):
+                db.execute(foo.t.update(count=i * 10, bar=bar))
+            for i in xrange(20, 40):
+                db.execute(db.Foo.t.create(name=u'foo %i' % i, count=i))
+            db.execute(foos[0].t.delete())
+            assert db._executing[-1]._inversions.log._file is not None
+            raise RuntimeError()
+        def outer(db):
+            ex(db.Foo.t.create(name=u'kept', count=0))
+            assert raises(RuntimeError, db.execute,
+                          CallableWrapper(change_then_fail))
+            assert len(db._executing[-1]._inversions) == 1
+        ex(CallableWrapper(outer))
+        assert len(db.Foo) == 21
+        assert db.Foo.findone(name=u'foo 30') is None
+        assert db.Foo.findone(name=u'kept') is not None
+        for i, foo in enumerate(foos):
+            assert foo.count == i
+            assert foo.bar is UNASSIGNED
+        assert bar.s.count() == 0
+
+    def test_spilled_log_closed_on_commit(self):
+        inner = []
+        def create_many(db):
+            for i in xrange(20):
+                tx = db.Foo.t.create(name=u'foo %i' % i, count=i)
+                db.execute(tx)
+                inner.append(tx)
+            assert db._executing[-1]._inversions.log.spilled
+        tx = CallableWrapper(create_many)
+        ex(tx)
+        assert len(db.Foo) == 20
+        assert tx._inversions.closed
+        assert tx._undo() is None
+        # Transactions executed within it cannot be undone either.
+        for inner_tx in inner:
+            assert inner_tx._undo() is None
+
+    def test_inner_undo_after_commit(self):
+        inner = []
+        def create_two(db):
+            for i in xrange(2):
+                tx = db.Foo.t.create(name=u'foo %i' % i, count=i)
+                db.execute(tx)
+                inner.append(tx)
+        ex(CallableWrapper(create_two))
+        assert len(db.Foo) == 2
+        ex(inner[0]._undo())
+        assert len(db.Foo) == 1
+        assert db.Foo.findone(name=u'foo 0') is None
+
+    def test_inverse(self):
+        foo = ex(db.Foo.t.create(name=u'foo', count=1))
+        tx = foo.t.update(count=2)
+        ex(tx)
+        assert foo.count == 2
+        ex(tx._undo())
+        assert foo.count == 1
+
+
+class TestInversionSpill2(BaseInversionSpill):
+
+    include = True
+
+    format = 2
@@ -0,0 +1,150 @@
+"""Join unit tests."""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+from schevo.constant import UNASSIGNED
+from schevo.test import CreatesSchema, raises
+
+
+class BaseJoin(CreatesSchema):
+
+    body = """
+
+    class Region(E.Entity):
+
+        name = f.string()
+
+        _key(name)
+
+        _sample_unittest = [
+            (u'North', ),
+            (u'South', ),
+            ]
+
+
+    class Customer(E.Entity):
+
+        name = f.string()
+        region = f.entity('Region', required=False)
+
+        _key(name)
+
+        _sample_unittest = [
+            (u'Acme', (u'North', )),
+            (u'Bolt', (u'South', )),
+            (u'Cog', (u'North', )),
+            (u'Dyne', UNASSIGNED),
+            ]
+
+
+    class Order(E.Entity):
+
+        number = f.integer()
+        customer = f.entity('Customer')
+
+        _key(number)
+
+        _sample_unittest = [
+            (1, (u'Acme', )),
+            (2, (u'Bolt', )),
+            (3, (u'Acme', )),
+            (4, (u'Cog', )),
+            ]
+
+
+    class LineItem(E.Entity):
+
+        order = f.entity('Order')
+        product = f.string()
+        parts = f.entity_list('Part', required=False)
+
+        _key(order, product)
+
+        _sample_unittest = [
+            ((1, ), u'bolts', []),
+            ((1, ), u'nuts', []),
+            ((2, ), u'gears', []),
+            ((3, ), u'nuts', []),
+            ]
+
+
+    class Part(E.Entity):
+
+        name = f.string()
+
+        _key(name)
+
+        _sample_unittest = [
+            (u'head', ),
+            (u'thread', ),
+            ]
+    """
+
+    def products(self, rows):
+        return sorted((row[1].number, row[2].product) for row in rows)
+
+    def test_join_back(self):
+        north = db.Region.findone(name=u'North')
+        rows = db.join(
+            db.Customer.f.region == north, db.Order.f.customer,
+            db.LineItem.f.order)
+        rows = list(rows)
+        assert [row[0].name for row in rows] == [u'Acme', u'Acme', u'Acme']
+        assert self.products(rows) == [
+            (1, u'bolts'), (1, u'nuts'), (3, u'nuts')]
+
+    def test_join_oids(self):
+        north = db.Region.findone(name=u'North')
+        acme = db.Customer.findone(name=u'Acme')
+        cog = db.Customer.findone(name=u'Cog')
+        orders = dict((order.number, order.s.oid) for order in db.Order)
+        rows = db.join_oids(db.Customer.f.region == north, db.Order.f.customer)
+        assert sorted(rows) == sorted([
+            (acme.s.oid, orders[1]),
+            (acme.s.oid, orders[3]),
+            (cog.s.oid, orders[4]),
+            ])
+        # Starting from an entity, and with no fields.
+        assert db.join_oids(north) == [(north.s.oid, )]
+        assert db.join_oids(north, db.Customer.f.region) == [
+            (north.s.oid, acme.s.oid), (north.s.oid, cog.s.oid)]
+
+    def test_join_forward(self):
+        rows = db.join(db.LineItem, db.LineItem.f.order,
+                       db.Order.f.customer, db.Customer.f.region)
+        assert sorted((row[0].product, row[3].name) for row in rows) == [
+            (u'bolts', u'North'), (u'gears', u'South'), (u'nuts', u'North'),
+            (u'nuts', u'North')]
+        # Unassigned fields join nothing.
+        rows = db.join(db.Customer.f.name == u'Dyne', db.Customer.f.region)
+        assert list(rows) == []
+
+    def test_join_entity_list(self):
+        item = db.LineItem.findone(product=u'gears')
+        head = db.Part.findone(name=u'head')
+        thread = db.Part.findone(name=u'thread')
+        ex(item.t.update(parts=[thread, head]))
+        rows = list(db.join(item, db.LineItem.f.parts))
+        assert rows == [(item, thread), (item, head)]
+        rows = list(db.join(head, db.LineItem.f.parts, db.LineItem.f.order))
+        assert rows == [(head, item, item.order)]
+
+    def test_join_is_lazy(self):
+        rows = iter(db.join(db.Order, db.Order.f.customer))
+        ex(db.Order.findone(number=4).t.delete())
+        # The rows are joined as they are iterated over.
+        assert sorted(row[0].number for row in rows) == [1, 2, 3]
+
+    def test_bad_fields(self):
+        assert raises(ValueError, db.join_oids, db.Customer,
+                      db.Customer.f.name)
+        assert raises(ValueError, db.join_oids, db.Region,
+                      db.LineItem.f.order)
+
+
+class TestJoin2(BaseJoin):
+
+    include = True
+
+    format = 2
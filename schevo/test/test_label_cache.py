@@ -0,0 +1,146 @@
+"""Entity label cache unit tests."""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+from schevo.test import CreatesSchema
+from schevo.transaction import CallableWrapper
+
+
+class BaseLabelCache(CreatesSchema):
+
+    body = """
+
+    class Country(E.Entity):
+
+        name = f.string()
+
+        _key(name)
+
+        _sample_unittest = [
+            (u'France', ),
+            (u'Peru', ),
+            ]
+
+
+    class City(E.Entity):
+
+        country = f.entity('Country')
+        name = f.string()
+
+        _key(country, name)
+
+        _sample_unittest = [
+            ((u'France', ), u'Paris'),
+            ((u'Peru', ), u'Lima'),
+            ]
+
+
+    class Street(E.Entity):
+
+        city = f.entity('City')
+        name = f.string()
+
+        _key(city, name)
+
+        _sample_unittest = [
+            (((u'France', ), u'Paris'), u'Rue Cler'),
+            ]
+
+
+    class Planet(E.Entity):
+
+        name = f.string()
+
+        _key(name)
+
+        def __unicode__(self):
+            return u'Planet ' + self.name
+
+        _sample_unittest = [
+            (u'Earth', ),
+            ]
+
+
+    class Moon(E.Entity):
+
+        planet = f.entity('Planet')
+        name = f.string()
+
+        _key(planet, name)
+
+        _sample_unittest = [
+            ((u'Earth', ), u'Luna'),
+            ]
+    """
+
+    def setUp(self):
+        CreatesSchema.setUp(self)
+        db._clear_label_cache()
+
+    def cached_labels(self):
+        return sorted(label for label, chain in db._label_cache.values())
+
+    def test_cached(self):
+        street = db.Street.findone(name=u'Rue Cler')
+        assert unicode(street) == u'France :: Paris :: Rue Cler'
+        assert self.cached_labels() == [
+            u'France', u'France :: Paris', u'France :: Paris :: Rue Cler']
+        # Cached labels are used.
+        db._label_cache[
+            (db.Street.id, street.s.oid, street.s.rev)] = (u'Cached', set())
+        assert unicode(street) == u'Cached'
+
+    def test_key_chain_changes(self):
+        street = db.Street.findone(name=u'Rue Cler')
+        lima = db.City.findone(name=u'Lima')
+        assert unicode(street) == u'France :: Paris :: Rue Cler'
+        assert unicode(lima) == u'Peru :: Lima'
+        france = db.Country.findone(name=u'France')
+        ex(france.t.update(name=u'Francia'))
+        assert self.cached_labels() == [u'Peru', u'Peru :: Lima']
+        assert unicode(street) == u'Francia :: Paris :: Rue Cler'
+        paris = street.city
+        ex(paris.t.update(country=db.Country.findone(name=u'Peru')))
+        assert unicode(street) == u'Peru :: Paris :: Rue Cler'
+        assert unicode(lima) == u'Peru :: Lima'
+
+    def test_not_cached(self):
+        # Entities labelling themselves differently.
+        moon = db.Moon.findone(name=u'Luna')
+        assert unicode(moon) == u'Planet Earth :: Luna'
+        assert self.cached_labels() == []
+        # Value transforms.
+        paris = db.City.findone(name=u'Paris')
+        paris._value_transforms = {'name': unicode.upper}
+        try:
+            assert unicode(paris) == u'France :: PARIS'
+        finally:
+            paris._value_transforms = None
+        assert self.cached_labels() == [u'France']
+        # Labels built while executing a transaction.
+        def label_within(db):
+            return unicode(paris)
+        assert ex(CallableWrapper(label_within)) == u'France :: Paris'
+        assert self.cached_labels() == [u'France']
+
+    def test_bounded(self):
+        db.label_cache_size = 2
+        try:
+            street = db.Street.findone(name=u'Rue Cler')
+            assert unicode(street) == u'France :: Paris :: Rue Cler'
+            assert len(db._label_cache) <= 2
+            assert unicode(street) == u'France :: Paris :: Rue Cler'
+            db.label_cache_size = 0
+            db._clear_label_cache()
+            assert unicode(street) == u'France :: Paris :: Rue Cler'
+            assert self.cached_labels() == []
+        finally:
+            del db.label_cache_size
+
+
+class TestLabelCache2(BaseLabelCache):
+
+    include = True
+
+    format = 2
@@ -3,7 +3,10 @@
 # Copyright (c) 2001-2009 ElevenCraft Inc.
 # See LICENSE for details.
 
+import os
+import shutil
 import sys
+from tempfile import mkdtemp
 
 from schevo.lib import module
 
@@ -41,3 +44,39 @@ def test_remember_forget():
     assert m.__name__ in sys.modules
     module.forget(m)
     assert m.__name__ not in sys.modules
+
+def test_compile_cached():
+    code = module.compile_cached(MODULE_SRC, 'cached_module')
+    assert module.compile_cached(MODULE_SRC, 'other_module') is code
+    assert module.compile_cached(MODULE_SRC + '\n', 'other_module') is not code
+
+def test_compile_cached_in_directory():
+    cache_dir = mkdtemp()
+    code_cache = module._code_cache
+    code_cache_dir = module.CODE_CACHE_DIR
+    try:
+        module.CODE_CACHE_DIR = cache_dir
+        module._code_cache = {}
+        code = module.compile_cached(MODULE_SRC, 'cached_module')
+        filenames = os.listdir(cache_dir)
+        assert len(filenames) == 1
+        filename = os.path.join(cache_dir, filenames[0])
+        assert open(filename, 'rb').read().startswith(module.CODE_CACHE_MAGIC)
+        # Code is loaded from the cache directory in other processes.
+        module._code_cache = {}
+        loaded = module.compile_cached(MODULE_SRC, 'other_module')
+        assert loaded is not code
+        assert loaded == code
+        assert loaded.co_filename == 'cached_module'
+        # Files with another version stamp are replaced.
+        open(filename, 'wb').write('stale')
+        module._code_cache = {}
+        recompiled = module.compile_cached(MODULE_SRC, 'other_module')
+        assert recompiled.co_filename == 'other_module'
+        assert open(filename, 'rb').read().startswith(module.CODE_CACHE_MAGIC)
+        m = module.from_string(MODULE_SRC, 'some_module')
+        assert m.Foo.bar() is m.SomeClass
+    finally:
+        module.CODE_CACHE_DIR = code_cache_dir
+        module._code_cache = code_cache
+        shutil.rmtree(cache_dir)
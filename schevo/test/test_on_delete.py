@@ -7,6 +7,7 @@ from schevo.constant import UNASSIGNED
 from schevo import error
 from schevo.placeholder import Placeholder
 from schevo.test import CreatesSchema, raises
+from schevo.transaction import CallableWrapper, plan_cascade
 
 
 class BaseOnDelete(CreatesSchema):
@@ -1017,3 +1018,197 @@ class TestOnDeleteUnassignEntityList2(BaseOnDeleteUnassignEntityList):
     include = True
 
     format = 2
+
+
+# --------------------------------------------------------------------
+
+
+class BaseOnDeleteCascadePlan(CreatesSchema):
+
+    body = """
+
+    class Customer(E.Entity):
+
+        name = f.string()
+
+        _key(name)
+
+
+    class Order(E.Entity):
+
+        customer = f.entity('Customer', on_delete=CASCADE)
+        number = f.integer()
+
+        _key(number)
+
+
+    class OrderLine(E.Entity):
+
+        order = f.entity('Order', on_delete=CASCADE)
+        product = f.entity('Product')
+        quantity = f.integer()
+
+        _index(product)
+
+
+    class Product(E.Entity):
+
+        name = f.string()
+
+        _key(name)
+
+
+    class Note(E.Entity):
+
+        order = f.entity('Order', on_delete=UNASSIGN, required=False)
+        text = f.string()
+
+
+    class Shipment(E.Entity):
+
+        order = f.entity('Order', on_delete=CASCADE)
+
+        class _Delete(T.Delete):
+
+            def _after_execute(self, db):
+                db.execute(db.Note.t.create(text=u'shipment deleted'))
+
+
+    class Invoice(E.Entity):
+
+        order = f.entity('Order', on_delete=CASCADE)
+
+        def t_delete(self):
+            return self._ArchivingDelete(self)
+
+        class _ArchivingDelete(T.Delete):
+
+            def _before_execute(self, db, entity):
+                text = u'%i invoices before delete' % len(db.Invoice)
+                db.execute(db.Note.t.create(text=text))
+    """
+
+    def _populate(self, orders=10, lines=20):
+        customer = ex(db.Customer.t.create(name='Acme'))
+        other = ex(db.Customer.t.create(name='Other'))
+        product = ex(db.Product.t.create(name='Widget'))
+        for number in xrange(orders):
+            order = ex(db.Order.t.create(customer=customer, number=number))
+            for quantity in xrange(lines):
+                ex(db.OrderLine.t.create(
+                    order=order, product=product, quantity=quantity))
+        order = ex(db.Order.t.create(customer=other, number=orders))
+        ex(db.OrderLine.t.create(order=order, product=product, quantity=1))
+        return customer, product
+
+    def test_plan_cascade(self):
+        customer, product = self._populate(orders=2, lines=3)
+        order = db.Order.findone(number=0)
+        note = ex(db.Note.t.create(order=order, text=u'rush'))
+        restricters, cascaders, unassigners, removers = plan_cascade(
+            db, [('Customer', customer.s.oid)])
+        assert restricters == {}
+        assert removers == {}
+        assert unassigners == {
+            ('Note', note.s.oid): set([('order', ('Order', order.s.oid))]),
+            }
+        assert len(cascaders) == 2 + 2 * 3
+        assert cascaders[('Order', order.s.oid)] == set(['customer'])
+        for line in db.OrderLine.find(order=order):
+            assert cascaders[('OrderLine', line.s.oid)] == set(['order'])
+
+    def test_cascade_many(self):
+        customer, product = self._populate()
+        order = db.Order.findone(number=3)
+        note = ex(db.Note.t.create(order=order, text=u'rush'))
+        assert product.s.count() == 201
+        ex(customer.t.delete())
+        assert len(db.Customer) == 1
+        assert len(db.Order) == 1
+        assert len(db.OrderLine) == 1
+        assert product.s.count() == 1
+        assert len(db.OrderLine.find(product=product)) == 1
+        assert note.order is UNASSIGNED
+        # Restriction still applies to referrers outside the cascade.
+        assert raises(error.DeleteRestricted, ex, product.t.delete())
+
+    def test_cascade_inverted(self):
+        customer, product = self._populate(orders=3, lines=5)
+        order = db.Order.findone(number=1)
+        note = ex(db.Note.t.create(order=order, text=u'rush'))
+        def delete_then_fail(db):
+            db.execute(customer.t.delete())
+            raise RuntimeError()
+        def outer(db):
+            assert raises(RuntimeError, db.execute,
+                          CallableWrapper(delete_then_fail))
+        ex(CallableWrapper(outer))
+        assert len(db.Customer) == 2
+        assert len(db.Order) == 4
+        assert len(db.OrderLine) == 16
+        assert product.s.count() == 16
+        assert customer.s.count() == 3
+        assert order.customer == customer
+        assert note.order == order
+        assert len(db.OrderLine.find(order=order)) == 5
+        # The database is consistent enough to perform the deletion.
+        ex(customer.t.delete())
+        assert len(db.OrderLine) == 1
+
+    def test_unassign_batched(self):
+        customer, product = self._populate(orders=1, lines=1)
+        order = db.Order.findone(number=0)
+        notes = [ex(db.Note.t.create(order=order, text=u'note %i' % i))
+                 for i in xrange(20)]
+        inversions = []
+        def delete(db):
+            db.execute(order.t.delete())
+            inversions.append(len(db._executing[-1]._inversions))
+        ex(CallableWrapper(delete))
+        # One inversion restores all notes, and one all deleted entities.
+        assert inversions == [2]
+        for note in notes:
+            assert note.order is UNASSIGNED
+            assert note.s.rev == 1
+        assert len(db.Note.find(order=UNASSIGNED)) == 20
+
+    def test_cascade_uses_customized_delete(self):
+        customer, product = self._populate(orders=2, lines=1)
+        for order in db.Order.find(customer=customer):
+            ex(db.Shipment.t.create(order=order))
+        ex(customer.t.delete())
+        assert len(db.Shipment) == 0
+        assert len(db.Note) == 2
+
+    def test_cascade_uses_overridden_t_delete(self):
+        customer, product = self._populate(orders=2, lines=1)
+        for order in db.Order.find(customer=customer):
+            ex(db.Invoice.t.create(order=order))
+        ex(customer.t.delete())
+        assert len(db.Invoice) == 0
+        # Each invoice is deleted by its own nested transaction.
+        texts = sorted(note.text for note in db.Note)
+        assert texts == [u'1 invoices before delete',
+                         u'2 invoices before delete']
+
+    def test_cascade_restricted(self):
+        customer, product = self._populate(orders=2, lines=1)
+        other_product = ex(db.Product.t.create(name='Gadget'))
+        line = db.OrderLine.find(quantity=0)[0]
+        ex(line.t.update(product=other_product))
+        # Deleting the product is restricted by order lines, and order
+        # lines are not cascaders of products.
+        try:
+            ex(other_product.t.delete())
+        except error.DeleteRestricted, e:
+            assert e.restrictions == set([(other_product, line, 'product')])
+        else:
+            raise AssertionError('DeleteRestricted not raised.')
+        assert len(db.OrderLine) == 3
+
+
+class TestOnDeleteCascadePlan2(BaseOnDeleteCascadePlan):
+
+    include = True
+
+    format = 2
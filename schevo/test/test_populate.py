@@ -3,9 +3,11 @@
 # Copyright (c) 2001-2009 ElevenCraft Inc.
 # See LICENSE for details.
 
-from schevo.test import CreatesSchema
+from schevo.test import CreatesSchema, raises
 
 from schevo.constant import UNASSIGNED
+from schevo import error
+from schevo.transaction import CallableWrapper, Populate
 
 
 class BasePopulateSimple(CreatesSchema):
@@ -248,6 +250,136 @@ class BasePopulateHidden(CreatesSchema):
         assert db.Foo[2].bof == 5.6
 
 
+class BasePopulateReferences(CreatesSchema):
+
+    body = '''
+
+    class Node(E.Entity):
+
+        name = f.string()
+        parent = f.entity('Node', required=False)
+
+        _key(name)
+
+        _initial = [
+            ('root', UNASSIGNED),
+            ('a', ('root', )),
+            ('b', ('root', )),
+            ('a1', ('a', )),
+            ('a2', ('a', )),
+            ]
+
+
+    class Edge(E.Entity):
+
+        source = f.entity('Node')
+        target = f.entity('Node')
+        weight = f.integer(min_value=0)
+
+        _key(source, target)
+
+        _sample_unittest = [
+            (('a', ), ('b', ), 1),
+            (('a1', ), ('a2', ), 2),
+            (('root', ), ('a1', ), 3),
+            ]
+
+
+    class Label(E.Entity):
+
+        node = f.entity('Node')
+        text = f.string()
+
+        _sample_unittest = [
+            (('a', ), 'first'),
+            (('b', ), 'second'),
+            ]
+
+        class _Create(T.Create):
+
+            def _before_execute(self, db):
+                self.text = self.text.upper()
+    '''
+
+    def test_references_within_extent(self):
+        assert len(db.Node) == 5
+        root = db.Node.findone(name='root')
+        a = db.Node.findone(name='a')
+        assert root.parent is UNASSIGNED
+        assert a.parent == root
+        assert db.Node.findone(name='a2').parent == a
+        assert sorted(node.name for node in a.m.nodes()) == ['a1', 'a2']
+
+    def test_references_across_extents(self):
+        assert len(db.Edge) == 3
+        assert db.Edge.as_datalist() == sorted(
+            db.Edge.EntityClass._sample_unittest)
+
+    def test_batch_created(self):
+        # Edges are created in one batch, with their index entries and
+        # links to nodes.
+        a = db.Node.findone(name='a')
+        b = db.Node.findone(name='b')
+        edge = db.Edge.findone(source=a, target=b)
+        assert edge.weight == 1
+        assert db.Edge.find(source=a) == [edge]
+        assert a.s.count('Edge') == 1
+        assert b.s.count('Edge', 'target') == 1
+        assert raises(error.DeleteRestricted, ex, b.t.delete())
+        assert raises(error.KeyCollision, ex,
+                      db.Edge.t.create(source=a, target=b, weight=5))
+
+    def test_customized_create(self):
+        # Labels are created by their own Create transactions.
+        texts = sorted(label.text for label in db.Label)
+        assert texts == ['FIRST', 'SECOND']
+
+    def test_batch_inverted(self):
+        data = [(('b', ), ('a', ), 4), (('a2', ), ('a1', ), 5)]
+        db.Edge.EntityClass._sample_more = data
+        def populate_then_fail(db):
+            db.execute(Populate('more'))
+            assert len(db.Edge) == 5
+            raise RuntimeError()
+        def outer(db):
+            assert raises(RuntimeError, db.execute,
+                          CallableWrapper(populate_then_fail))
+        db.enable_stats()
+        try:
+            ex(CallableWrapper(outer))
+            stats = db.stats()['extents']['Edge']
+        finally:
+            db.disable_stats()
+            del db.Edge.EntityClass._sample_more
+        assert stats['create_batch']['count'] == 1
+        assert 'create' not in stats
+        assert len(db.Edge) == 3
+        b = db.Node.findone(name='b')
+        assert b.s.count('Edge', 'source') == 0
+        assert db.Edge.find(weight=4) == []
+
+    def test_batch_key_collision(self):
+        data = [(('b', ), ('a', ), 4), (('b', ), ('a', ), 5)]
+        db.Edge.EntityClass._sample_twice = data
+        try:
+            assert raises(error.KeyCollision, ex, Populate('twice'))
+        finally:
+            del db.Edge.EntityClass._sample_twice
+        assert len(db.Edge) == 3
+        b = db.Node.findone(name='b')
+        assert db.Edge.find(source=b) == []
+
+    def test_invalid_data_rejected(self):
+        # Validation of each row is deferred, but still done.
+        data = [(('b', ), ('a', ), -1)]
+        db.Edge.EntityClass._sample_invalid = data
+        try:
+            assert raises(ValueError, ex, Populate('invalid'))
+        finally:
+            del db.Edge.EntityClass._sample_invalid
+        assert len(db.Edge) == 3
+
+
 # class TestPopulateSimple1(BasePopulateSimple):
 
 #     include = True
@@ -288,3 +420,10 @@ class TestPopulateHidden2(BasePopulateHidden):
     include = True
 
     format = 2
+
+
+class TestPopulateReferences2(BasePopulateReferences):
+
+    include = True
+
+    format = 2
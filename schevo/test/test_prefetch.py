@@ -0,0 +1,178 @@
+"""Related entity prefetch unit tests."""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+from schevo.constant import UNASSIGNED
+from schevo import error
+from schevo.placeholder import Placeholder
+from schevo.test import CreatesSchema, raises
+
+
+class BasePrefetch(CreatesSchema):
+
+    body = """
+
+    class Region(E.Entity):
+
+        name = f.string()
+
+        _key(name)
+
+        _sample_unittest = [
+            (u'North', ),
+            (u'South', ),
+            ]
+
+
+    class Customer(E.Entity):
+
+        name = f.string()
+        region = f.entity('Region', required=False)
+        referrers = f.entity_list('Customer', required=False)
+
+        _key(name)
+
+        _sample_unittest = [
+            (u'Acme', (u'North', ), []),
+            (u'Bolt', (u'South', ), []),
+            (u'Cog', UNASSIGNED, []),
+            ]
+
+
+    class Invoice(E.Entity):
+
+        number = f.integer()
+        customer = f.entity('Customer', required=False)
+
+        _key(number)
+
+        _sample_unittest = [
+            (1, (u'Acme', )),
+            (2, (u'Bolt', )),
+            (3, (u'Acme', )),
+            (4, (u'Cog', )),
+            (5, UNASSIGNED),
+            ]
+
+
+    class Setting(E.Entity):
+
+        name = f.string()
+        prefetch = f.boolean()
+
+        _key(name)
+
+        _sample_unittest = [
+            (u'eager', True),
+            (u'lazy', False),
+            ]
+    """
+
+    def detach(self):
+        """Detach restored entities from all stored placeholders."""
+        for extent_name in db.extent_names():
+            extent_map = db._extent_map(extent_name)
+            for oid, entity_map in extent_map['entities'].iteritems():
+                for value in entity_map['fields'].itervalues():
+                    if isinstance(value, Placeholder):
+                        value.entity = None
+                    elif isinstance(value, (list, tuple)):
+                        for item in value:
+                            item.entity = None
+
+    def count_restores(self, function):
+        """Return the number of times `function` checks that an entity
+        exists, as done to restore placeholders without an attached
+        entity."""
+        calls = []
+        contains = db._extent_contains_oid
+        def counting_contains(extent_name, oid):
+            calls.append((extent_name, oid))
+            return contains(extent_name, oid)
+        db._extent_contains_oid = counting_contains
+        try:
+            function()
+        finally:
+            del db._extent_contains_oid
+        return len(calls)
+
+    def region_names(self, invoices):
+        names = []
+        for invoice in invoices:
+            customer = invoice.customer
+            if customer is UNASSIGNED or customer.region is UNASSIGNED:
+                names.append(UNASSIGNED)
+            else:
+                names.append(customer.region.name)
+        return names
+
+    def test_without_prefetch(self):
+        self.detach()
+        invoices = db.Invoice.find()
+        assert self.count_restores(
+            lambda: self.region_names(invoices)) > 0
+
+    def test_find_prefetch(self):
+        self.detach()
+        invoices = db.Invoice.find(prefetch=('customer', 'customer.region'))
+        assert sorted(invoice.number for invoice in invoices) == [
+            1, 2, 3, 4, 5]
+        names = []
+        assert self.count_restores(
+            lambda: names.extend(self.region_names(invoices))) == 0
+        assert sorted(names) == [
+            UNASSIGNED, UNASSIGNED, u'North', u'North', u'South']
+
+    def test_find_prefetch_with_criteria(self):
+        self.detach()
+        invoices = db.Invoice.find(number=2, prefetch='customer')
+        assert len(invoices) == 1
+        assert self.count_restores(
+            lambda: invoices[0].customer.name) == 0
+        # The region was not prefetched.
+        assert self.count_restores(
+            lambda: invoices[0].customer.region.name) > 0
+
+    def test_results_list_prefetch(self):
+        self.detach()
+        customers = db.Customer.find()
+        assert customers.prefetch('region') is customers
+        assert self.count_restores(
+            lambda: [customer.region for customer in customers]) == 0
+
+    def test_entity_list_prefetch(self):
+        acme = db.Customer.findone(name=u'Acme')
+        bolt = db.Customer.findone(name=u'Bolt')
+        ex(acme.t.update(referrers=[bolt, acme]))
+        self.detach()
+        customers = db.Customer.find(name=u'Acme', prefetch='referrers')
+        assert self.count_restores(
+            lambda: customers[0].referrers) == 0
+        assert list(customers[0].referrers) == [bolt, acme]
+
+    def test_deleted_entity(self):
+        cog = db.Customer.findone(name=u'Cog')
+        invoice = db.Invoice.findone(number=4)
+        ex(invoice.t.update(customer=UNASSIGNED))
+        ex(cog.t.delete())
+        assert db.Invoice.find(prefetch='customer.region')
+
+    def test_bad_paths(self):
+        invoices = db.Invoice.find()
+        assert raises(error.FieldDoesNotExist, invoices.prefetch, 'missing')
+        assert raises(ValueError, invoices.prefetch, 'number')
+        assert raises(error.FieldDoesNotExist,
+                      invoices.prefetch, 'customer.missing')
+
+    def test_prefetch_field(self):
+        settings = db.Setting.find(prefetch=True)
+        assert [setting.name for setting in settings] == [u'eager']
+        assert db.Setting.find(name=u'lazy', prefetch=True) == []
+
+
+class TestPrefetch2(BasePrefetch):
+
+    include = True
+
+    format = 2
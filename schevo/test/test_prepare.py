@@ -0,0 +1,112 @@
+"""Prepared query unit tests."""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+from schevo.constant import UNASSIGNED
+from schevo import error
+from schevo.expression import Parameter
+from schevo.test import CreatesSchema, raises
+
+
+class BasePrepare(CreatesSchema):
+
+    body = """
+
+    class Foo(E.Entity):
+
+        name = f.string()
+        size = f.integer()
+        color = f.string(required=False)
+
+        _key(name)
+        _index(size, color)
+
+        _sample_unittest = [
+            (u'one', 1, u'red'),
+            (u'two', 2, u'red'),
+            (u'three', 2, u'blue'),
+            (u'four', 4, UNASSIGNED),
+            ]
+
+
+    class Bar(E.Entity):
+
+        foo = f.entity('Foo')
+        count = f.integer()
+
+        _sample_unittest = [
+            ((u'one', ), 0),
+            ((u'one', ), 1),
+            ((u'two', ), 1),
+            ]
+    """
+
+    def test_equality(self):
+        q = db.Foo.prepare(name=Parameter('name'))
+        assert q.parameter_names == frozenset(['name'])
+        assert q(name=u'one') == [db.Foo.findone(name=u'one')]
+        assert q(name=u'five') == []
+        assert q.findone(name=u'two').size == 2
+        assert q.findone(name=u'five') is None
+        assert q.count(name=u'three') == 1
+
+    def test_values_are_converted(self):
+        q = db.Foo.prepare(db.Foo.f.size == Parameter('size'))
+        assert sorted(foo.name for foo in q(size='2')) == [u'three', u'two']
+
+    def test_mixed_literals_and_parameters(self):
+        q = db.Foo.prepare(size=2, color=Parameter('color'))
+        assert q(color=u'red') == db.Foo.find(size=2, color=u'red')
+        assert q(color=u'blue') == db.Foo.find(size=2, color=u'blue')
+        assert q(color=UNASSIGNED) == []
+        assert raises(error.FindoneFoundMoreThanOne,
+                      db.Foo.prepare(size=Parameter('size')).findone, size=2)
+
+    def test_unindexed_and_entity_fields(self):
+        q = db.Bar.prepare(foo=Parameter('foo'), count=Parameter('count'))
+        one = db.Foo.findone(name=u'one')
+        two = db.Foo.findone(name=u'two')
+        assert len(q(foo=one, count=1)) == 1
+        assert q(foo=one, count=0) == db.Bar.find(foo=one, count=0)
+        assert q(foo=two, count=0) == []
+        # Falsy values are bound too.
+        q = db.Bar.prepare(count=Parameter('count'))
+        assert len(q(count=0)) == 1
+
+    def test_general_criteria(self):
+        f = db.Foo.f
+        q = db.Foo.prepare((f.size > Parameter('size')) | (f.name == u'one'))
+        assert sorted(foo.name for foo in q(size=1)) == [
+            u'four', u'one', u'three', u'two']
+        assert sorted(foo.name for foo in q(size=2)) == [u'four', u'one']
+        q = db.Foo.prepare()
+        assert len(q()) == 4
+
+    def test_parameters_required(self):
+        q = db.Foo.prepare(name=Parameter('name'))
+        assert raises(TypeError, q)
+        assert raises(TypeError, q, name=u'one', size=1)
+
+    def test_reused_after_changes(self):
+        q = db.Foo.prepare(size=Parameter('size'))
+        assert len(q(size=5)) == 0
+        ex(db.Foo.t.create(name=u'five', size=5))
+        assert len(q(size=5)) == 1
+        # Synchronizing with the schema renews the plan.
+        old_extent = db.Foo
+        db._sync()
+        assert db.Foo is not old_extent
+        assert q(size=5) == db.Foo.find(size=5)
+        assert q(size=5)[0]._extent is db.Foo
+
+    def test_field_does_not_exist(self):
+        assert raises(error.FieldDoesNotExist, db.Foo.prepare,
+                      db.Bar.f.count == Parameter('count'))
+
+
+class TestPrepare2(BasePrepare):
+
+    include = True
+
+    format = 2
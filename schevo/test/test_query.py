@@ -7,6 +7,9 @@ from schevo.constant import UNASSIGNED
 from schevo import error
 from schevo import field
 from schevo.label import label
+from schevo.query import (
+    Avg, Count, Group, Intersection, Match, Max, Min, ResultsOids, Simple,
+    Sum, Union)
 from schevo.test import CreatesSchema, raises
 
 
@@ -207,6 +210,59 @@ class BaseQuery(CreatesSchema):
         assert q.f.float.name == 'float'
         assert q.f.entity.name == 'entity'
 
+    def test_oid_results(self):
+        new_da = lambda **kw: db.execute(db.DeltaAlpha.t.create(**kw))
+        da1 = new_da(string='foo', integer=1)
+        da2 = new_da(string='foo', integer=2)
+        da3 = new_da(string='bar', integer=1)
+        match_foo = Match(db.DeltaAlpha, 'string', '==', 'foo')
+        match_1 = Match(db.DeltaAlpha, 'integer', '==', 1)
+        results = match_foo()
+        assert isinstance(results, ResultsOids)
+        assert results.oids_by_extent == {
+            db.DeltaAlpha: frozenset([da1.s.oid, da2.s.oid])}
+        assert da1 in results
+        assert da3 not in results
+        # Intersections and unions of OID results are OID results,
+        # whose entities are created in OID order.
+        results = Intersection(match_foo, match_1)()
+        assert isinstance(results, ResultsOids)
+        assert list(results) == [da1]
+        results = Union(match_foo, match_1)()
+        assert isinstance(results, ResultsOids)
+        assert len(results) == 3
+        assert list(results) == [da1, da2, da3]
+        match_3 = Match(db.DeltaAlpha, 'integer', '==', 3)
+        results = Intersection(match_foo, match_3)()
+        assert not results
+        assert list(results) == []
+        # Results that are not OID results are combined with them.
+        dc = db.execute(db.DeltaCharlie.t.create(hashed_value='foo'))
+        hashes = db.DeltaCharlie.q.hashes(compare_with='foo')
+        results = Union(match_1, hashes)()
+        assert isinstance(results, ResultsOids)
+        assert list(results) == [da1, da3, dc]
+        match_1_foo = Match(match_1, 'string', '==', 'foo',
+                            FieldClass=db.DeltaAlpha.f.string)
+        results = Intersection(match_foo, match_1_foo)()
+        assert list(results) == [da1]
+        # OID results support the sequence API of list results.
+        results = Union(match_foo, match_1)()
+        assert results[0] == da1
+        assert results[-1] == da3
+        assert results[1:] == [da2, da3]
+        assert results.index(da2) == 1
+        assert results.count(da3) == 1
+        assert results == [da1, da2, da3]
+        assert results != [da3, da2, da1]
+        assert results == frozenset([da3, da2, da1])
+        assert match_foo() == match_foo()
+        assert raises(IndexError, lambda: results[3])
+        # Other objects fall back to sets.
+        numbers = Simple(lambda: [1, 2], u'numbers')
+        assert Union(numbers, Simple(lambda: [2, 3], u'more'))() == frozenset(
+            [1, 2, 3])
+
     def test_remove_match_from_intersection(self):
         q = db.DeltaAlpha.q.by_example()
         assert q.match_names == ['string', 'integer', 'float', 'entity']
@@ -233,3 +289,108 @@ class TestQuery2(BaseQuery):
     include = True
 
     format = 2
+
+
+class BaseGroupQuery(CreatesSchema):
+
+    body = """
+
+    class Customer(E.Entity):
+
+        name = f.string()
+
+        _key(name)
+
+        _sample_unittest = [
+            (u'Ann', ),
+            (u'Ben', ),
+            (u'Cal', ),
+            ]
+
+
+    class Order(E.Entity):
+
+        customer = f.entity('Customer')
+        number = f.integer()
+        amount = f.float(required=False)
+
+        _key(number)
+        _index(customer, number)
+
+        _sample_unittest = [
+            ((u'Ann', ), 3, 10.0),
+            ((u'Ann', ), 1, 30.0),
+            ((u'Ben', ), 2, 5.0),
+            ((u'Ann', ), 7, UNASSIGNED),
+            ((u'Ben', ), 4, 5.0),
+            ]
+    """
+
+    def all_orders(self):
+        return Match(db.Order, 'number', 'any')
+
+    def numbers(self, results):
+        return sorted(order.number for order in results)
+
+    def test_group(self):
+        group = Group(self.all_orders(), 'customer', db.Order.f.customer)
+        groups = sorted(self.numbers(g) for g in group())
+        assert groups == [[1, 3, 7], [2, 4]]
+        ann = db.Customer.findone(name=u'Ann')
+        keys = dict(group._groups())
+        assert self.numbers(keys[ann]) == [1, 3, 7]
+
+    def test_min_max_indexed(self):
+        group = Group(self.all_orders(), 'customer', db.Order.f.customer)
+        assert db._find_extreme_oids(
+            'Order', 'customer', 'number') is not None
+        assert self.numbers(Min(group, 'number')()) == [1, 2]
+        assert self.numbers(Max(group, 'number')()) == [4, 7]
+        # Only some of the entities.
+        some = Match(db.Order, 'number', '<', 7)
+        group = Group(some, 'customer', db.Order.f.customer)
+        assert self.numbers(Max(group, 'number')()) == [3, 4]
+        some = Match(db.Order, 'number', '==', 3)
+        group = Group(some, 'customer', db.Order.f.customer)
+        assert self.numbers(Min(group, 'number')()) == [3]
+
+    def test_min_max_unindexed(self):
+        group = Group(self.all_orders(), 'customer', db.Order.f.customer)
+        assert db._find_extreme_oids(
+            'Order', 'customer', 'amount') is None
+        # Ties go to the first entity created.
+        assert self.numbers(Min(group, 'amount')()) == [2, 7]
+        assert self.numbers(Max(group, 'amount')()) == [1, 2]
+        # Results that are not OID results.
+        orders = Simple(db.Order.find, u'all orders')
+        group = Group(orders, 'customer', db.Order.f.customer)
+        assert self.numbers(Min(group, 'amount')()) == [2, 7]
+
+    def test_count_sum_avg(self):
+        orders = self.all_orders()
+        assert list(Count(orders)()) == [5]
+        assert list(Count(orders, 'amount', db.Order.f.amount)()) == [4]
+        assert list(Sum(orders, 'amount', db.Order.f.amount)()) == [50.0]
+        assert list(Avg(orders, 'amount', db.Order.f.amount)()) == [12.5]
+        none = Match(db.Order, 'number', '==', 99)
+        assert list(Count(none)()) == [0]
+        assert list(Sum(none, 'amount', db.Order.f.amount)()) == [0]
+        assert list(Avg(none, 'amount', db.Order.f.amount)()) == [UNASSIGNED]
+        # Grouped.
+        group = Group(orders, 'customer', db.Order.f.customer)
+        ann = db.Customer.findone(name=u'Ann')
+        ben = db.Customer.findone(name=u'Ben')
+        assert sorted(Count(group)()) == [(ann, 3), (ben, 2)]
+        assert sorted(Sum(group, 'amount', db.Order.f.amount)()) == [
+            (ann, 40.0), (ben, 10.0)]
+        assert sorted(Avg(group, 'amount', db.Order.f.amount)()) == [
+            (ann, 20.0), (ben, 5.0)]
+        assert (unicode(Sum(orders, 'amount', db.Order.f.amount))
+                == u'the sum Amount of (%s)' % orders)
+
+
+class TestGroupQuery2(BaseGroupQuery):
+
+    include = True
+
+    format = 2
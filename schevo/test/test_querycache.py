@@ -0,0 +1,158 @@
+"""Query result cache unit tests."""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+from schevo.query import (
+    ByExample, Count, Exact, Group, Intersection, Match, Simple)
+from schevo import querycache
+from schevo.querycache import QueryCache
+from schevo.test import CreatesSchema
+from schevo.transaction import CallableWrapper
+
+
+class TestQueryCache(object):
+
+    def test_get_put(self):
+        cache = QueryCache()
+        assert cache.get('a', (1, )) is None
+        cache.put('a', (1, ), 'results', 3)
+        assert cache.get('a', (1, )) == 'results'
+        # A different stamp misses.
+        assert cache.get('a', (2, )) is None
+        assert cache.stats() == dict(
+            entries=1, evictions=0, hits=1, max_size=querycache.MAX_SIZE,
+            misses=2, size=querycache.ENTRY_SIZE + 3 * querycache.RESULT_SIZE)
+        cache.remove('a')
+        assert len(cache) == 0
+        assert cache.size == 0
+
+    def test_lru_eviction(self):
+        entry_size = querycache.ENTRY_SIZE
+        cache = QueryCache(max_size=entry_size * 4)
+        for key in 'abcd':
+            cache.put(key, (), key, 0)
+        assert len(cache) == 4
+        # Use 'a' and 'b', so that 'c' and 'd' are least recently used.
+        cache.get('a', ())
+        cache.get('b', ())
+        cache.put('e', (), 'e', 0)
+        assert cache.evictions == 2
+        assert sorted(cache._entries) == ['a', 'b', 'e']
+        assert cache.size == entry_size * 3
+        # Results larger than the cache are not stored.
+        cache.put('f', (), 'f', cache.max_size)
+        assert cache.get('f', ()) is None
+
+
+class BaseQueryCaching(CreatesSchema):
+
+    body = """
+
+    class Foo(E.Entity):
+
+        name = f.string()
+        size = f.integer()
+
+        @f.integer()
+        def bar_count(self):
+            return self.s.count('Bar', 'foo')
+
+        _key(name)
+
+        _sample_unittest = [
+            (u'one', 1),
+            (u'two', 2),
+            (u'three', 2),
+            ]
+
+
+    class Bar(E.Entity):
+
+        foo = f.entity('Foo')
+
+        _sample_unittest = [
+            ((u'one', ), ),
+            ]
+    """
+
+    def setUp(self):
+        CreatesSchema.setUp(self)
+        self.cache = db.query_cache = QueryCache()
+
+    def tearDown(self):
+        del db.query_cache
+        CreatesSchema.tearDown(self)
+
+    def test_hits_and_invalidation(self):
+        cache = self.cache
+        q = Match(db.Foo, 'size', '==', 2)
+        first = q()
+        assert cache.misses == 1
+        # A structurally equal query hits.
+        assert Match(db.Foo, 'size', '==', 2)() is first
+        assert cache.hits == 1
+        # Changes to other extents keep the results.
+        ex(db.Bar.t.create(foo=db.Foo.findone(name=u'two')))
+        assert q() is first
+        # Changes to the extent invalidate them.
+        ex(db.Foo.t.create(name=u'four', size=2))
+        results = q()
+        assert results is not first
+        assert sorted(foo.name for foo in results) == [
+            u'four', u'three', u'two']
+
+    def test_combined_queries(self):
+        cache = self.cache
+        queries = [
+            lambda: Exact(db.Foo, size=2),
+            lambda: ByExample(db.Foo, size=2),
+            lambda: Intersection(Match(db.Foo, 'size', '==', 2),
+                                 Match(db.Bar, 'foo', 'any')),
+            lambda: Count(Group(Match(db.Foo, 'name', 'any'), 'size',
+                                db.Foo.f.size)),
+            ]
+        for make_query in queries:
+            first = make_query()()
+            hits = cache.hits
+            assert make_query()() == first
+            assert cache.hits > hits
+        # Intersections depend on both extents.
+        q = Intersection(Match(db.Foo, 'size', '==', 2),
+                         Match(db.Bar, 'foo', 'any'))
+        first = q()
+        ex(db.Bar.t.create(foo=db.Foo.findone(name=u'two')))
+        assert q() is not first
+
+    def test_mutable_results_copied(self):
+        q = Match(db.Foo, 'size', '>', 1)
+        first = q()
+        assert isinstance(first, list)
+        first.append(None)
+        second = q()
+        assert len(second) == 2
+        assert second is not first
+
+    def test_not_cached(self):
+        cache = self.cache
+        # Calculated fields, and queries of arbitrary callables.
+        Match(db.Foo, 'bar_count', '==', 1)()
+        Simple(db.Foo.find, u'all')()
+        assert len(cache) == 0
+        # Nor while executing transactions.
+        def query(db):
+            return Match(db.Foo, 'size', '==', 2)()
+        ex(CallableWrapper(query))
+        assert len(cache) == 0
+        # Synchronizing with a schema clears the cache.
+        Match(db.Foo, 'size', '==', 2)()
+        assert len(cache) > 0
+        db._sync()
+        assert len(cache) == 0
+
+
+class TestQueryCaching2(BaseQueryCaching):
+
+    include = True
+
+    format = 2
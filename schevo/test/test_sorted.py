@@ -0,0 +1,118 @@
+"""Extent sorting unit tests."""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+from schevo.constant import UNASSIGNED
+from schevo import error
+from schevo.test import CreatesSchema, raises
+
+
+class BaseSorted(CreatesSchema):
+
+    body = """
+
+    class Region(E.Entity):
+
+        name = f.string()
+
+        _key(name)
+
+        _sample_unittest = [
+            (u'South', ),
+            (u'North', ),
+            (u'East', ),
+            ]
+
+
+    class Customer(E.Entity):
+
+        region = f.entity('Region', required=False)
+        name = f.string()
+        rating = f.integer(required=False)
+
+        @f.string()
+        def upper_name(self):
+            return self.name.upper()
+
+        _key(region, name)
+
+        _sample_unittest = [
+            ((u'South', ), u'Acme', 3),
+            ((u'North', ), u'Bolt', 1),
+            ((u'North', ), u'Acme', UNASSIGNED),
+            (UNASSIGNED, u'Cog', 2),
+            ((u'East', ), u'Dyne', 1),
+            ]
+
+
+    class Note(E.Entity):
+
+        text = f.string()
+
+        _sample_unittest = [
+            (u'b', ),
+            (u'a', ),
+            ]
+    """
+
+    def names(self, entities):
+        return [(entity.region and entity.region.name, entity.name)
+                for entity in entities]
+
+    def test_default_key_from_index(self):
+        assert [region.name for region in db.Region.sorted()] == [
+            u'East', u'North', u'South']
+        assert db.Region.sorted() == sorted(db.Region)
+
+    def test_default_key_with_entity_field(self):
+        assert self.names(db.Customer.sorted()) == [
+            (UNASSIGNED, u'Cog'),
+            (u'East', u'Dyne'),
+            (u'North', u'Acme'),
+            (u'North', u'Bolt'),
+            (u'South', u'Acme'),
+            ]
+        assert db.Customer.sorted() == sorted(db.Customer)
+
+    def test_no_default_key(self):
+        assert [note.text for note in db.Note.sorted()] == [u'b', u'a']
+        assert [note.text for note in db.Note.sorted('text')] == [u'a', u'b']
+
+    def test_by(self):
+        assert self.names(db.Customer.sorted('name')) == [
+            (u'South', u'Acme'),
+            (u'North', u'Acme'),
+            (u'North', u'Bolt'),
+            (UNASSIGNED, u'Cog'),
+            (u'East', u'Dyne'),
+            ]
+        assert self.names(db.Customer.sorted(('-rating', 'name'))) == [
+            (u'South', u'Acme'),
+            (UNASSIGNED, u'Cog'),
+            (u'North', u'Bolt'),
+            (u'East', u'Dyne'),
+            (u'North', u'Acme'),
+            ]
+        assert self.names(db.Customer.sorted(('region', '-name'))) == [
+            (UNASSIGNED, u'Cog'),
+            (u'East', u'Dyne'),
+            (u'North', u'Bolt'),
+            (u'North', u'Acme'),
+            (u'South', u'Acme'),
+            ]
+        assert self.names(db.Customer.sorted('-upper_name'))[0] == (
+            u'East', u'Dyne')
+        assert raises(error.FieldDoesNotExist, db.Customer.sorted, 'missing')
+
+    def test_follows_changes(self):
+        east = db.Region.findone(name=u'East')
+        ex(east.t.update(name=u'West'))
+        assert self.names(db.Customer.sorted())[-1] == (u'West', u'Dyne')
+
+
+class TestSorted2(BaseSorted):
+
+    include = True
+
+    format = 2
@@ -0,0 +1,170 @@
+"""Database statistics unit tests."""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+import os
+from tempfile import mkdtemp, mkstemp
+
+from schevo.stats import Histogram, Stats, difference, read_dumps
+from schevo.test import CreatesSchema
+
+
+class BaseStats(CreatesSchema):
+
+    body = """
+
+    class Author(E.Entity):
+
+        name = f.string()
+        age = f.integer(required=False)
+
+        _key(name)
+
+
+    class Book(E.Entity):
+
+        author = f.entity('Author')
+        title = f.string()
+
+        _key(title)
+    """
+
+    def setUp(self):
+        CreatesSchema.setUp(self)
+        db.enable_stats()
+
+    def tearDown(self):
+        db.disable_stats()
+        CreatesSchema.tearDown(self)
+
+    def test_disabled(self):
+        db.disable_stats()
+        assert db.stats() is None
+        ex(db.Author.t.create(name=u'Austen'))
+        db.enable_stats()
+        assert db.stats()['extents'] == {}
+
+    def test_entity_operations(self):
+        austen = ex(db.Author.t.create(name=u'Austen'))
+        emma = ex(db.Book.t.create(author=austen, title=u'Emma'))
+        ex(emma.t.update(title=u'Emma!'))
+        ex(emma.t.delete())
+        stats = db.stats()
+        author = stats['extents']['Author']
+        book = stats['extents']['Book']
+        assert author['create']['count'] == 1
+        assert author['index_add'] == 1
+        assert book['create']['count'] == 1
+        assert book['link_add'] == 1
+        assert book['update']['count'] == 1
+        assert book['index_remove'] == 2
+        assert book['delete']['count'] == 1
+        assert book['link_remove'] == 1
+        assert book['validate']['count'] == 2
+        assert stats['storage']['commit']['count'] == 4
+        assert stats['storage']['commit_bytes'] > 0
+
+    def test_cache(self):
+        db.backend.get_root()
+        assert db.stats()['storage']['cache_hit'] == 1
+
+    def test_find_paths(self):
+        austen = ex(db.Author.t.create(name=u'Austen', age=41))
+        ex(db.Book.t.create(author=austen, title=u'Emma'))
+        db.enable_stats()
+        db.Author.find(name=u'Austen')
+        db.Author.find(age=41)
+        db.Author.find(db.Author.f.age > 40)
+        db.Book.find(author=austen)
+        stats = db.stats()
+        author = stats['extents']['Author']
+        book = stats['extents']['Book']
+        assert author['find_index']['count'] == 1
+        assert author['find_scan']['count'] == 2
+        assert book['find_link']['count'] == 1
+
+    def test_dump(self):
+        fd, filename = mkstemp()
+        os.close(fd)
+        try:
+            db.enable_stats(filename, dump_interval=0)
+            ex(db.Author.t.create(name=u'Austen'))
+            ex(db.Author.t.create(name=u'Bronte'))
+            lines = open(filename).readlines()
+            assert len(lines) == 2
+            assert '"create"' in lines[-1]
+        finally:
+            os.remove(filename)
+
+    def test_dump_failure(self):
+        dirname = mkdtemp()
+        filename = os.path.join(dirname, 'missing', 'stats.json')
+        try:
+            db.enable_stats(filename, dump_interval=0)
+            # Failing to dump statistics does not fail transactions.
+            austen = ex(db.Author.t.create(name=u'Austen'))
+            assert db.Author.findone(name=u'Austen') == austen
+            assert not os.path.exists(filename)
+        finally:
+            os.rmdir(dirname)
+
+
+class TestStats2(BaseStats):
+
+    include = True
+
+    format = 2
+
+
+def test_histogram():
+    histogram = Histogram()
+    for seconds in [0.000001, 0.002, 0.002, 20.0]:
+        histogram.add(seconds)
+    values = histogram.as_dict()
+    assert values['count'] == 4
+    assert values['maximum'] == 20.0
+    assert values['buckets'][0] == [0.00001, 1]
+    assert values['buckets'][3] == [0.01, 2]
+    assert values['buckets'][-1] == [None, 1]
+
+
+def test_scopes():
+    stats = Stats()
+    stats.count('Foo', 'index_add', 2)
+    stats.count(None, 'cache_hit')
+    stats.add('Foo', 'create', 0.5)
+    values = stats.as_dict()
+    assert values['extents']['Foo']['index_add'] == 2
+    assert values['extents']['Foo']['create']['total'] == 0.5
+    assert values['storage'] == {'cache_hit': 1}
+    stats.clear()
+    assert stats.as_dict()['extents'] == {}
+
+
+def test_read_dumps_difference():
+    fd, filename = mkstemp()
+    os.close(fd)
+    try:
+        stats = Stats(filename)
+        stats.count('Foo', 'index_add')
+        stats.add('Foo', 'create', 0.5)
+        stats.dump()
+        stats.count('Foo', 'index_add', 2)
+        stats.add('Foo', 'create', 0.002)
+        stats.count(None, 'cache_hit')
+        stats.dump()
+        first, last = read_dumps(filename)
+    finally:
+        os.remove(filename)
+    assert last['extents']['Foo']['index_add'] == 3
+    changes = difference(first, last)
+    assert changes['started'] == first['time']
+    assert changes['elapsed'] == last['time'] - first['time']
+    foo = changes['extents']['Foo']
+    assert foo['index_add'] == 2
+    assert foo['create']['count'] == 1
+    assert foo['create']['maximum'] == 0.5
+    assert foo['create']['buckets'][3] == [0.01, 1]
+    assert foo['create']['buckets'][5] == [1.0, 0]
+    assert changes['storage'] == {'cache_hit': 1}
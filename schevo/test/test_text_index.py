@@ -0,0 +1,141 @@
+"""Prefix and text index unit tests."""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+from schevo.constant import UNASSIGNED
+from schevo.query import Match, ResultsOids
+from schevo.test import CreatesSchema
+from schevo.text import trigrams
+from schevo.transaction import CallableWrapper
+
+
+class BaseTextIndex(CreatesSchema):
+
+    body = """
+
+    class Contact(E.Entity):
+
+        name = f.string()
+        city = f.string(required=False)
+        notes = f.string(required=False)
+
+        @f.string()
+        def upper_name(self):
+            return self.name.upper()
+
+        _key(name)
+        _index(city, name)
+        _index_text(name, notes)
+
+        _sample_unittest = [
+            (u'Alice Smith', u'Boston', u'Likes gardening'),
+            (u'Alan Smithee', u'Bristol', UNASSIGNED),
+            (u'Bob Jones', u'Boston', u'Smithing hobbyist'),
+            (u'Carol Smith', UNASSIGNED, u'GARDEN party'),
+            ]
+    """
+
+    def names(self, oids):
+        return sorted(db.Contact[oid].name for oid in oids)
+
+    def match(self, field_name, operator, value):
+        results = Match(db.Contact, field_name, operator, value)()
+        assert isinstance(results, ResultsOids)
+        return sorted(contact.name for contact in results)
+
+    def test_trigrams(self):
+        assert trigrams(u'Abcd') == frozenset([u'abc', u'bcd'])
+        assert trigrams(u'ab') == frozenset()
+        assert trigrams(UNASSIGNED) == frozenset()
+
+    def test_text_index_structure(self):
+        extent_map = db._extent_map('Contact')
+        field_name_id = extent_map['field_name_id']
+        text_indices = extent_map['text_indices']
+        assert sorted(text_indices.keys()) == sorted(
+            [field_name_id['name'], field_name_id['notes']])
+        name_index = text_indices[field_name_id['name']]
+        assert self.names(name_index[u'smi'].keys()) == [
+            u'Alan Smithee', u'Alice Smith', u'Carol Smith']
+        assert db.Contact.EntityClass._text_index_spec == ('name', 'notes')
+
+    def test_startswith_uses_index(self):
+        find = db._find_entity_oids_prefix
+        # Leading index on city.
+        assert self.names(find('Contact', 'city', u'B')) == [
+            u'Alan Smithee', u'Alice Smith', u'Bob Jones']
+        assert self.names(find('Contact', 'city', u'Bo')) == [
+            u'Alice Smith', u'Bob Jones']
+        assert find('Contact', 'city', u'X') == []
+        # Key on name.
+        assert self.names(find('Contact', 'name', u'Al')) == [
+            u'Alan Smithee', u'Alice Smith']
+        # Brute force on notes.
+        assert self.names(find('Contact', 'notes', u'GARDEN')) == [
+            u'Carol Smith']
+        assert self.match('name', 'startswith', u'Ali') == [u'Alice Smith']
+
+    def test_contains(self):
+        assert self.match('name', 'contains', u'Smith') == [
+            u'Alan Smithee', u'Alice Smith', u'Carol Smith']
+        assert self.match('name', 'contains', u'smith') == []
+        assert self.match('name', 'icontains', u'smith') == [
+            u'Alan Smithee', u'Alice Smith', u'Carol Smith']
+        assert self.match('notes', 'icontains', u'garden') == [
+            u'Alice Smith', u'Carol Smith']
+        # Short values, and fields without a text index.
+        assert self.match('name', 'contains', u'o') == [
+            u'Bob Jones', u'Carol Smith']
+        assert self.match('city', 'icontains', u'BOS') == [
+            u'Alice Smith', u'Bob Jones']
+        assert self.match('name', 'contains', u'xyz') == []
+
+    def test_calculated_fields_not_indexed(self):
+        results = Match(db.Contact, 'upper_name', 'startswith', u'AL')()
+        assert not isinstance(results, ResultsOids)
+        assert sorted(contact.name for contact in results) == [
+            u'Alan Smithee', u'Alice Smith']
+
+    def test_maintained_by_transactions(self):
+        alice = db.Contact.findone(name=u'Alice Smith')
+        ex(alice.t.update(name=u'Alice Jones', notes=UNASSIGNED))
+        assert self.match('name', 'icontains', u'smith') == [
+            u'Alan Smithee', u'Carol Smith']
+        assert self.match('name', 'icontains', u'jones') == [
+            u'Alice Jones', u'Bob Jones']
+        assert self.match('notes', 'icontains', u'garden') == [
+            u'Carol Smith']
+        ex(db.Contact.t.create(name=u'Dan Smith'))
+        assert self.match('name', 'contains', u'Smith') == [
+            u'Alan Smithee', u'Carol Smith', u'Dan Smith']
+        carol = db.Contact.findone(name=u'Carol Smith')
+        ex(carol.t.delete())
+        assert self.match('notes', 'icontains', u'garden') == []
+        text_indices = db._extent_map('Contact')['text_indices']
+        for text_index in text_indices.itervalues():
+            for term, oids in text_index.iteritems():
+                assert carol.s.oid not in oids
+
+    def test_inverted(self):
+        bob = db.Contact.findone(name=u'Bob Jones')
+        def change_then_fail(db):
+            db.execute(bob.t.update(name=u'Robert Jones'))
+            db.execute(db.Contact.t.create(name=u'Eve Smith'))
+            raise RuntimeError()
+        def outer(db):
+            try:
+                db.execute(CallableWrapper(change_then_fail))
+            except RuntimeError:
+                pass
+        ex(CallableWrapper(outer))
+        assert self.match('name', 'icontains', u'bob') == [u'Bob Jones']
+        assert self.match('name', 'icontains', u'robert') == []
+        assert self.match('name', 'contains', u'Eve') == []
+
+
+class TestTextIndex2(BaseTextIndex):
+
+    include = True
+
+    format = 2
@@ -0,0 +1,80 @@
+"""Tracing unit tests."""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+from collections import deque
+from StringIO import StringIO
+
+import schevo.trace
+from schevo.trace import log
+
+
+class TestTrace(object):
+
+    def setUp(self):
+        self.saved = (
+            schevo.trace._history,
+            schevo.trace.TRACE_TO,
+            schevo.trace.monitor_level,
+            schevo.trace.history_level,
+            )
+        schevo.trace._history = deque(maxlen=5)
+        schevo.trace.TRACE_TO = StringIO()
+
+    def tearDown(self):
+        (schevo.trace._history,
+         schevo.trace.TRACE_TO,
+         schevo.trace.monitor_level,
+         schevo.trace.history_level,
+         ) = self.saved
+
+    def test_off(self):
+        schevo.trace.monitor_level = 0
+        schevo.trace.history_level = 0
+        assert log(1, 'not kept')
+        assert not schevo.trace.enabled(1)
+        assert list(schevo.trace._history) == []
+        assert schevo.trace.TRACE_TO.getvalue() == ''
+
+    def test_history(self):
+        schevo.trace.history_level = 2
+        assert log(1, 'one')
+        assert log(2, 'two', 2)
+        assert log(3, 'three')
+        assert schevo.trace.enabled(2)
+        assert not schevo.trace.enabled(3)
+        assert list(schevo.trace.history(3)) == [
+            (1, 'test_trace.test_history:', ('one', )),
+            (2, 'test_trace.test_history:', ('two', 2)),
+            ]
+        assert list(schevo.trace.history(1)) == [
+            (1, 'test_trace.test_history:', ('one', )),
+            ]
+        assert schevo.trace.TRACE_TO.getvalue() == ''
+        schevo.trace.clear_history()
+        assert list(schevo.trace.history(3)) == []
+
+    def test_history_bounded(self):
+        schevo.trace.history_level = 1
+        for x in xrange(10):
+            assert log(1, x)
+        messages = [m for level, where, m in schevo.trace.history(1)]
+        assert messages == [(5, ), (6, ), (7, ), (8, ), (9, )]
+
+    def test_monitor(self):
+        schevo.trace.monitor_level = 2
+        assert log(1, 'one')
+        assert log(2, 'two')
+        assert log(3, 'three')
+        assert schevo.trace.TRACE_TO.getvalue() == (
+            '# test_trace.test_monitor: one\n'
+            '# test_trace.test_monitor: -- two\n'
+            )
+        assert len(list(schevo.trace.history(3))) == 2
+
+    def test_no_history(self):
+        schevo.trace._history = None
+        schevo.trace.history_level = 3
+        assert log(1, 'one')
+        assert list(schevo.trace.history(3)) == []
@@ -0,0 +1,160 @@
+"""Incremental entity update unit tests."""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+from schevo import error
+from schevo.test import CreatesSchema, raises
+from schevo.transaction import Transaction
+
+
+class Abort(Exception):
+    pass
+
+
+class UpdateThenAbort(Transaction):
+    """Update an entity in an inner transaction, then fail."""
+
+    def __init__(self, entity, **kw):
+        Transaction.__init__(self)
+        self._entity = entity
+        self._kw = kw
+
+    def _execute(self, db):
+        db.execute(self._entity.t.update(**self._kw))
+        self._captured = list(db._executing[-1]._inversions)
+        raise Abort()
+
+
+class Outer(Transaction):
+    """Execute an inner transaction, swallowing its failure."""
+
+    def __init__(self, inner):
+        Transaction.__init__(self)
+        self._inner = inner
+
+    def _execute(self, db):
+        try:
+            db.execute(self._inner)
+        except Abort:
+            pass
+
+
+class BaseUpdateEntity(CreatesSchema):
+
+    body = """
+
+    class Foo(E.Entity):
+
+        name = f.string()
+
+        _key(name)
+
+    class Bar(E.Entity):
+
+        name = f.string()
+        status = f.string()
+        foo = f.entity('Foo', required=False)
+        other = f.entity('Foo', required=False)
+
+        _key(name)
+        _index(foo)
+        _index(foo, name)
+    """
+
+    def _leaf(self, extent_name, *values):
+        extent_map = db._extent_map(extent_name)
+        index_spec = (extent_map['field_name_id']['name'], )
+        unique, branch = extent_map['indices'][index_spec]
+        for value in values:
+            branch = branch[value]
+        return branch
+
+    def test_unindexed_field_leaves_indices_alone(self):
+        foo = ex(db.Foo.t.create(name='foo'))
+        bar = ex(db.Bar.t.create(name='bar', status='new', foo=foo))
+        leaf = self._leaf('Bar', 'bar')
+        bar = ex(bar.t.update(status='done'))
+        assert bar.status == 'done'
+        # The index leaf was not removed and recreated.
+        assert self._leaf('Bar', 'bar') is leaf
+        assert db.Bar.findone(name='bar') == bar
+        assert db.Bar.find(foo=foo) == [bar]
+        assert foo.s.count() == 1
+
+    def test_indexed_field_updates_indices(self):
+        foo = ex(db.Foo.t.create(name='foo'))
+        bar = ex(db.Bar.t.create(name='bar', status='new', foo=foo))
+        bar = ex(bar.t.update(name='baz'))
+        assert db.Bar.findone(name='bar') is None
+        assert db.Bar.findone(name='baz') == bar
+        assert db.Bar.find(foo=foo, name='baz') == [bar]
+        assert raises(
+            error.KeyCollision, ex,
+            db.Bar.t.create(name='baz', status='new'))
+
+    def test_entity_field_updates_links(self):
+        foo1 = ex(db.Foo.t.create(name='foo1'))
+        foo2 = ex(db.Foo.t.create(name='foo2'))
+        bar = ex(db.Bar.t.create(name='bar', status='new', foo=foo1))
+        assert foo1.s.count() == 1
+        bar = ex(bar.t.update(foo=foo2))
+        assert foo1.s.count() == 0
+        assert foo2.s.count() == 1
+        assert db.Bar.find(foo=foo1) == []
+        assert db.Bar.find(foo=foo2) == [bar]
+        # foo1 may now be deleted since nothing refers to it.
+        ex(foo1.t.delete())
+        assert raises(error.DeleteRestricted, ex, foo2.t.delete())
+
+    def test_inversion_stores_only_changed_fields(self):
+        foo = ex(db.Foo.t.create(name='foo'))
+        bar = ex(db.Bar.t.create(name='bar', status='new', foo=foo))
+        inner = UpdateThenAbort(bar, status='done')
+        ex(Outer(inner))
+        [(method, args, kw)] = inner._captured
+        extent_name, oid, old_fields, old_related_entities, old_rev = args
+        assert old_fields == dict(status='new')
+        assert old_related_entities == {}
+        assert bar.status == 'new'
+        assert bar.s.rev == 0
+
+    def test_inversion_restores_indices_and_links(self):
+        foo1 = ex(db.Foo.t.create(name='foo1'))
+        foo2 = ex(db.Foo.t.create(name='foo2'))
+        bar = ex(db.Bar.t.create(name='bar', status='new', foo=foo1))
+        inner = UpdateThenAbort(bar, name='baz', foo=foo2)
+        ex(Outer(inner))
+        [(method, args, kw)] = inner._captured
+        extent_name, oid, old_fields, old_related_entities, old_rev = args
+        assert sorted(old_fields) == ['foo', 'name']
+        assert old_related_entities.keys() == ['foo']
+        assert bar.name == 'bar'
+        assert bar.foo == foo1
+        assert db.Bar.findone(name='bar') == bar
+        assert db.Bar.findone(name='baz') is None
+        assert db.Bar.find(foo=foo1) == [bar]
+        assert db.Bar.find(foo=foo2) == []
+        assert foo1.s.count() == 1
+        assert foo2.s.count() == 0
+
+    def test_inversion_keeps_links_of_unchanged_fields(self):
+        foo1 = ex(db.Foo.t.create(name='foo1'))
+        foo2 = ex(db.Foo.t.create(name='foo2'))
+        foo3 = ex(db.Foo.t.create(name='foo3'))
+        bar = ex(db.Bar.t.create(
+            name='bar', status='new', foo=foo1, other=foo3))
+        inner = UpdateThenAbort(bar, foo=foo2)
+        ex(Outer(inner))
+        assert bar.foo == foo1
+        assert bar.other == foo3
+        assert db.Bar.find(other=foo3) == [bar]
+        assert foo3.s.count() == 1
+        assert raises(error.DeleteRestricted, ex, foo3.t.delete())
+
+
+class TestUpdateEntity2(BaseUpdateEntity):
+
+    include = True
+
+    format = 2
@@ -0,0 +1,98 @@
+"""End-of-transaction validation unit tests."""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+from schevo.change import CREATE, DELETE, UPDATE
+from schevo.constant import UNASSIGNED
+from schevo.database2 import _changed_fields, _validation_is_noop
+from schevo import error
+from schevo.test import CreatesSchema, raises
+from schevo.transaction import CallableWrapper
+
+
+class BaseValidateChanges(CreatesSchema):
+
+    body = """
+
+    class Foo(E.Entity):
+
+        name = f.string()
+        count = f.integer(min_value=0)
+        flag = f.boolean(required=False)
+        total = f.integer(fget='get_total')
+
+        _key(name)
+
+        def get_total(self):
+            return self.count
+    """
+
+    def _update(self, foo, **fields):
+        """Update fields of `foo` directly, in a transaction executed
+        with strict validation."""
+        def update(db):
+            db._update_entity('Foo', foo.s.oid, fields, {})
+        return ex(CallableWrapper(update))
+
+    def test_changed_fields_validated(self):
+        foo = ex(db.Foo.t.create(name=u'foo', count=1))
+        assert raises(ValueError, self._update, foo, count=-1)
+        assert raises(error.FieldRequired, self._update, foo, name=UNASSIGNED)
+        assert foo.count == 1
+        assert foo.name == u'foo'
+
+    def test_unchanged_fields_not_validated(self):
+        foo = ex(db.Foo.t.create(name=u'foo', count=1))
+        # Sneak an invalid value in outside of a transaction.
+        db._update_entity('Foo', foo.s.oid, dict(count=-1), {})
+        db._commit()
+        assert foo.count == -1
+        # Updating another field does not validate `count`.
+        self._update(foo, name=u'bar')
+        assert foo.name == u'bar'
+        # Updating `count` itself does.
+        assert raises(ValueError, self._update, foo, count=-2)
+        self._update(foo, count=2)
+        assert foo.count == 2
+
+    def test_created_entities_validated(self):
+        def create(db):
+            db._create_entity('Foo', dict(name=u'foo', count=-1), {})
+        assert raises(ValueError, ex, CallableWrapper(create))
+        assert len(db.Foo) == 0
+
+    def test_changed_fields(self):
+        changes = [
+            (UPDATE, 'Foo', 1, frozenset(['name'])),
+            (UPDATE, 'Foo', 1, frozenset(['count'])),
+            (UPDATE, 'Foo', 2, frozenset(['name'])),
+            (UPDATE, 'Foo', 2, None),
+            (CREATE, 'Foo', 3, None),
+            (UPDATE, 'Foo', 3, frozenset(['name'])),
+            (UPDATE, 'Foo', 4, frozenset(['name'])),
+            (DELETE, 'Foo', 4, None),
+            (CREATE, 'Bar', 1, None),
+            ]
+        assert _changed_fields(changes) == [
+            ('Bar', [(1, None)]),
+            ('Foo', [
+                (1, frozenset(['name', 'count'])),
+                (2, None),
+                (3, None),
+                ]),
+            ]
+
+    def test_validation_is_noop(self):
+        field_spec = db.Foo.EntityClass._field_spec
+        assert not _validation_is_noop(field_spec['name'])
+        assert not _validation_is_noop(field_spec['count'])
+        assert _validation_is_noop(field_spec['flag'])
+        assert _validation_is_noop(field_spec['total'])
+
+
+class TestValidateChanges2(BaseValidateChanges):
+
+    include = True
+
+    format = 2
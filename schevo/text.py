@@ -0,0 +1,68 @@
+"""Text and full-text indexing support."""
+
+# Copyright (c) 2001-2009 ElevenCraft Inc.
+# See LICENSE for details.
+
+import sys
+from schevo.lib import optimize
+
+import re
+
+
+_word = re.compile(r'\w+', re.UNICODE)
+
+
+def parse_query(query):
+    """Return a list of the alternatives of full-text search `query`.
+
+    Words of a query must all match unless separated by ``OR``; an
+    ``AND`` between words is allowed but not required.  A word ending
+    with ``*`` matches any term that starts with it.
+
+    Each alternative is a list of (term, is_prefix) tuples.
+    """
+    alternatives = []
+    words = []
+    for word in query.split():
+        if word == 'OR':
+            if words:
+                alternatives.append(words)
+                words = []
+        elif word != 'AND':
+            terms = tokenize(word)
+            if terms:
+                words.extend((term, False) for term in terms[:-1])
+                words.append((terms[-1], word.endswith('*')))
+    if words:
+        alternatives.append(words)
+    return alternatives
+
+
+def term_counts(values):
+    """Return a dictionary of the number of times each term occurs in
+    the string items of `values`."""
+    counts = {}
+    for value in values:
+        for term in tokenize(value):
+            counts[term] = counts.get(term, 0) + 1
+    return counts
+
+
+def tokenize(value):
+    """Return a list of the lowercase words in `value`, or an empty list
+    if `value` is not a string."""
+    if not isinstance(value, basestring):
+        return []
+    return _word.findall(value.lower())
+
+
+def trigrams(value):
+    """Return a frozenset of the lowercase three-character substrings
+    of `value`, or an empty frozenset if `value` is not a string."""
+    if not isinstance(value, basestring):
+        return frozenset()
+    value = value.lower()
+    return frozenset(value[i:i+3] for i in xrange(len(value) - 2))
+
+
+optimize.bind_all(sys.modules[__name__])  # Last line of module.
@@ -16,6 +16,13 @@ Programmatic usage for viewing messages as they occur::
     schevo.trace.monitor_level = 2      # Turn on level 1 and level 2 messages.
     schevo.trace.monitor_level = 3      # Turn on all messages.
 
+Messages up to `monitor_level` or `history_level`, whichever is
+higher, are kept in a history holding the most recent `HISTORY_SIZE`
+messages.  When both levels are 0, `log` returns immediately without
+inspecting its caller::
+
+    schevo.trace.history_level = 3      # Record all messages.
+
 Usage examples for viewing messages as they occur when using the
 `schevo` command line::
 
@@ -25,8 +32,9 @@ Usage examples for viewing messages as they occur when using the
 # Copyright (c) 2001-2009 ElevenCraft Inc.
 # See LICENSE for details.
 
-import inspect
+import os
 import sys
+from collections import deque
 
 from schevo.lib.optimize import do_not_optimize
 
@@ -39,58 +47,91 @@ TRACE_TO = sys.stderr
 ## Schevo tracing is ON."""
 
 
-# History of trace messages.  Set to None to prevent appending.
-_history = [
-    # (level, modulename, message),
-    ]
+# Maximum number of messages kept in `_history`.
+HISTORY_SIZE = 1000
+
+
+# History of trace messages, oldest first.  Set to None to prevent
+# appending.
+_history = deque(
+    # (level, where, messages),
+    maxlen=HISTORY_SIZE)
+
 
+# Call site identifiers, keyed by code object.
+_where = {}
 
-# By default, don't copy anything to stderr.
+
+# By default, don't copy anything to stderr or keep any history.
 monitor_level = 0
 monitor_prefix = '#'
+history_level = 0
+
+
+def clear_history():
+    """Remove all messages from `_history`."""
+    if _history is not None:
+        _history.clear()
+
+
+def enabled(level):
+    """Return True if messages at `level` are monitored or recorded.
+
+    Use to avoid computing costly messages::
+
+        assert not enabled(2) or log(2, 'Result was', repr(result))
+    """
+    return level <= monitor_level or level <= history_level
 
 
 def history(max_level):
     """Return a generator for items from `_history` up to and including
     those at `max_level`."""
     assert isinstance(max_level, int)
+    if _history is None:
+        return iter([])
     return ((level, where, messages)
-            for level, where, messages in _history
+            for level, where, messages in list(_history)
             if level <= max_level)
 
 
 def print_history(max_level):
     """Print a pretty version of the results of `history(max_level)`."""
     for level, where, messages in history(max_level):
-        print >>TRACE_TO, monitor_prefix, where,
-        if level > 1:
-            print >>TRACE_TO, ('--' * (level - 1)),
-        for m in messages:
-            print >>TRACE_TO, m,
-        print >>TRACE_TO
+        _print(level, where, messages)
+
+
+def where(code):
+    """Return the call site identifier for the function with `code`, as
+    'modulename.funcname:'."""
+    identifier = _where.get(code)
+    if identifier is None:
+        modulename = os.path.splitext(os.path.basename(code.co_filename))[0]
+        identifier = _where[code] = '%s.%s:' % (modulename, code.co_name)
+    return identifier
 
 
 @do_not_optimize
 def log(level, *messages):
     """Append `message` at `level` to `_history`, outputting to stderr
     if desired."""
-    if not monitor_level:
-        # Short-circuit for speed, if not monitoring.
-        pass
+    if level > monitor_level and level > history_level:
+        # Short-circuit for speed, if neither monitoring nor recording
+        # this level.
+        return True
     assert isinstance(level, int)
-    frame = sys._getframe(1)
-    finfo = inspect.getframeinfo(frame)
-    filename = finfo[0]
-    funcname = finfo[2]
-    modulename = inspect.getmodulename(filename)
-    where = '%s.%s:' % (modulename, funcname)
+    site = where(sys._getframe(1).f_code)
     if _history is not None:
-        _history.append((level, where, messages))
+        _history.append((level, site, messages))
     if level <= monitor_level:
-        print >>TRACE_TO, monitor_prefix, where,
-        if level > 1:
-            print >>TRACE_TO, ('--' * (level - 1)),
-        for m in messages:
-            print >>TRACE_TO, m,
-        print >>TRACE_TO
+        _print(level, site, messages)
     return True
+
+
+def _print(level, site, messages):
+    print >>TRACE_TO, monitor_prefix, site,
+    if level > 1:
+        print >>TRACE_TO, ('--' * (level - 1)),
+    for m in messages:
+        print >>TRACE_TO, m,
+    print >>TRACE_TO
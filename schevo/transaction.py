@@ -142,14 +142,17 @@ class Transaction(base.Transaction):
     def _initialize(self, field_map):
         """Initialize field values."""
         tx_field_map = self._field_map
-        for name, field in field_map.iteritems():
+        for name in field_map:
             if name in tx_field_map:
-                tx_field_map[name]._initialize(field._value)
+                tx_field_map[name]._initialize(field_map[name]._value)
 
     def _undo(self):
         """Return a transaction that can undo this one."""
         if not self._executed:
             raise TransactionNotExecuted(self)
+        if getattr(self._inversions, 'closed', False):
+            # Inversions spilled to disk are discarded on commit.
+            return None
         # The default implementation is to return the inverse of this
         # transaction.
         return Inverse(self)
@@ -225,10 +228,11 @@ class Create(Transaction):
         """Override this in subclasses to customize a transaction."""
         pass
 
-    def _execute(self, db):
+    def _dump_maps(self):
+        """Validate individual fields, and return a tuple of
+        ``(field_dump_map, field_related_entity_map)`` for the entity to
+        create, as given to `Database._create_entity`."""
         field_map = self._field_map
-        # Before execute callback.
-        self._before_execute(db)
         # Validate individual fields.
         for field in field_map.itervalues():
             if field.fget is None:
@@ -243,6 +247,13 @@ class Create(Transaction):
                 del field_dump_map[name]
                 if name in field_related_entity_map:
                     del field_related_entity_map[name]
+        return field_dump_map, field_related_entity_map
+
+    def _execute(self, db):
+        field_map = self._field_map
+        # Before execute callback.
+        self._before_execute(db)
+        field_dump_map, field_related_entity_map = self._dump_maps()
         # During execute callback.
         self._during_execute(db)
         # Proceed with execution based on the create style requested.
@@ -327,107 +338,21 @@ class Delete(Transaction):
         entity = self._entity
         if entity._rev != self._rev:
             raise TransactionExpired(self, self._rev, entity._rev)
-        deletes = self._deletes
         # Before execute callback.
         self._before_execute(db, entity)
-        # Build list of direct and indirect references.
-        traversed = set()
-        restricters = dict()
-        cascaders = dict()
-        unassigners = dict()
-        removers = dict()
-        find_references(db, entity, traversed,
-                        restricters, cascaders, unassigners, removers)
-        # Referrers should be removed from restricters if they are
-        # also requesting cascade deletion.
-        restricter_keys = set(restricters) - set(cascaders)
-        # The entity whose deletion was requested should never be
-        # considered a restricter.
-        restricter_keys.discard(entity)
-        if len(restricter_keys) != 0:
-            # Raise DeleteRestricted if there are any restricters left
-            # over.
-            error = DeleteRestricted()
-            for referrer in restricter_keys:
-                restricter_set = restricters[referrer]
-                for f_name, referred in restricter_set:
-                    error.add(referred, referrer, f_name)
-            if error.restrictions:
-                raise error
-        else:
-            # Convert all restricters to cascaders so that fields are
-            # unassigned properly before deletion.
-            for referrer, field_referred_set in restricters.iteritems():
-                field_names = cascaders.setdefault(referrer, set())
-                for field_name, referred in field_referred_set:
-                    field_names.add(field_name)
-        # Unassign fields requested by unassigners.
-        for referrer, field_referred_set in unassigners.iteritems():
-            tx = referrer.t.update()
-            for f_name, referred in field_referred_set:
-                tx.f[f_name]._unassign(referred)
-            db.execute(tx)
-        # Remove values from fields marked as removers.
-        for referrer, field_referred_set in removers.iteritems():
-            tx = referrer.t.update()
-            for f_name, referred in field_referred_set:
-                tx.f[f_name]._remove(referred)
-            db.execute(tx)
-        # Forceably update fields to UNASSIGNED first to prevent
-        # DeleteRestrict from being raised by the database itself.
-        referrers = set()
-        for referrer, field_names in cascaders.iteritems():
-            field_map = referrer.s.field_map(not_fget)
-            field_dump_map = dict(field_map.dump_map())
-            field_related_entity_map = dict(field_map.related_entity_map())
-            new_dump_map = dict((name, UNASSIGNED) for name in field_names)
-            new_related_entity_map = dict(
-                (name, frozenset()) for name in field_names)
-            field_dump_map.update(new_dump_map)
-            field_related_entity_map.update(new_related_entity_map)
-            extent = referrer._extent
-            extent_name = extent.name
-            oid = referrer._oid
-            try:
-                db._update_entity(
-                    extent_name, oid, field_dump_map, field_related_entity_map)
-            except KeyCollision:
-                # Since it takes more time to relax an index, only do
-                # it when we find a key collision.
-                extent.relax_all_indices()
-                # Try the update again.
-                db._update_entity(
-                    extent_name, oid, field_dump_map, field_related_entity_map)
-            referrers.add((extent_name, oid, referrer))
-        # Everything checks out okay for this entity, so add it to the
-        # set of deleted entities.
-        deletes.add((entity.__class__, entity._oid))
-        # Delete entities in a deterministic (sorted) fashion.
-        for extent_name, oid, referrer in sorted(referrers):
-            referrer_e_o = referrer.__class__, referrer._oid
-            if referrer_e_o in deletes:
-                # Skip the original entity whose deletion was
-                # requested, since we must delete it using a call to
-                # the database's `_delete_entity` method.  Also skip
-                # any entity that has already been deleted.
-                continue
-            if not db._extent_contains_oid(extent_name, oid):
-                # A nested transaction or cascade deleted this entity
-                # before we could.
-                continue
-            tx = referrer.t.delete()
-            tx._deletes.update(deletes)
-            db.execute(tx, strict=False)
-        # Attempt to delete the entity itself.
-        extent_name = self._extent_name
-        oid = entity._oid
-        db._delete_entity(extent_name, oid)
+        delete_cascade(db, self, [(self._extent_name, entity._oid)])
         self._after_execute(db)
         return None
 
 
 class DeleteSelected(Transaction):
-    """Delete a selection of entity instances."""
+    """Delete a selection of entity instances.
+
+    The whole selection is deleted in one batch, along with all entities
+    that cascade from it.  References between entities being deleted
+    are neither checked nor unassigned.  Upon execution, returns a
+    dictionary of ``extent_name: count`` items for all entities deleted.
+    """
 
     _label = u'Delete Selected'
 
@@ -444,10 +369,17 @@ class DeleteSelected(Transaction):
         pass
 
     def _execute(self, db):
+        selected = []
+        known_deletes = self._known_deletes
         for entity in self._selection:
             if entity in entity._extent:
-                db.execute(entity.t.delete())
-        return None
+                selected.append((entity._extent.name, entity._oid))
+                known_deletes.append((entity.__class__, entity._oid))
+        # Remove duplicates while retaining order.
+        seen = set()
+        selected = [pair for pair in selected
+                    if pair not in seen and not seen.add(pair)]
+        return delete_cascade(db, self, selected, run_hooks=True)
 
 
 class Update(Transaction):
@@ -678,13 +610,23 @@ class _Populate(Transaction):
                 del dict_field_spec[name]
             if delete or field.readonly or field.hidden:
                 del tuple_field_spec[name]
+        # Entities may be created in one batch unless their Create
+        # transactions are customized or they may refer to each other.
+        if _has_plain_create(extent.EntityClass):
+            batch = []
+        else:
+            batch = None
         for FieldClass in dict_field_spec.itervalues():
             if issubclass(FieldClass, Entity):
                 allow = FieldClass.allow
+                if not allow or extent.name in allow:
+                    batch = None
                 for extent_name in allow:
                     parent_extent = db.extent(extent_name)
                     self._process_data(db, parent_extent, processing)
-        # Process the data.
+        # Process the data.  Each row is either added to the batch, or
+        # created by a non-strict transaction; either way, validation
+        # is deferred to this transaction.
         execute = db.execute
         dict_field_names = dict_field_spec.keys()
         for values in data:
@@ -719,14 +661,15 @@ class _Populate(Transaction):
                 if field_name in value_map:
                     value = value_map[field_name]
                     field = new.f[field_name]
-                    if (field.readonly
-                        or getattr(new, field_name) == value
-                        ):
+                    if field.readonly or field.get() == value:
                         # Skip readonly and unchanged fields.
                         continue
                     setattr(new, field_name, value)
             try:
-                execute(new)
+                if batch is None:
+                    execute(new, strict=False)
+                else:
+                    batch.append(new._dump_maps())
             except:
                 print '-' * 40
                 print '  extent:', extent
@@ -736,6 +679,14 @@ class _Populate(Transaction):
                 print '  tuple_field_spec:', tuple_field_spec
                 print '  value_map:', value_map
                 raise
+        if batch:
+            try:
+                db._create_entities(extent.name, batch)
+            except:
+                print '-' * 40
+                print '  extent:', extent
+                print '  data:', data
+                raise
 
 
 class Initialize(_Populate):
@@ -785,23 +736,13 @@ class CallableWrapper(Transaction):
 # ---------------------------------------------------------------------
 
 
-def find_references(db, entity, traversed,
-                    restricters, cascaders, unassigners, removers):
-    """Support function for Delete transactions.  Acts recursively to
-    get a list of all entities directly or indirectly related to
-    `entity`.
-
-    NOTE: This function returns nothing.  Instead, the `references`
-    and `traversed` arguments are mutated.
-
-    - `db`: The database the Delete is occuring in.
-
-    - `entity`: The entity to inspect when adding to the references
-      list.
+def plan_cascade(db, deleted, known_deletes=()):
+    """Support function for Delete transactions.  Return a tuple of
+    ``(restricters, cascaders, unassigners, removers)`` describing all
+    entities directly or indirectly affected by deleting the entities
+    given as ``(extent_name, oid)`` pairs in `deleted`.
 
-    The following arguments are directly mutated during execution:
-
-    - `traversed`: The set of already-traversed entities.
+    Each entity is represented by an ``(extent_name, oid)`` pair.
 
     - `restricters`: Dictionary of ``referrer: set([(f_name,
       referred), ...])`` pairs storing information about references
@@ -818,43 +759,258 @@ def find_references(db, entity, traversed,
     - `removers`: Dictionary of ``referrer: set([(f_name, referred),
       ...])`` pairs storing information about references that desire
       to REMOVE values on deletion.
+
+    The closure is computed from the database's link structures
+    without instantiating entities, looking up each field's
+    `on_delete` rule once per referring field.
+
+    References from entities in `deleted` or `known_deletes` are
+    ignored, since those entities are deleted anyway.
     """
-    if entity in traversed:
-        return
-    traversed.add(entity)
-    entity_extent_name = entity._extent.name
-    for (e_name, f_name), others in entity.s.links().iteritems():
-        extent = db.extent(e_name)
-        field_class = extent.field_spec[f_name]
-        on_delete_get = field_class.on_delete.get
-        on_delete_default = field_class.on_delete_default
-        for referrer in others:
-            on_delete = on_delete_get(entity_extent_name, on_delete_default)
+    restricters = {}
+    cascaders = {}
+    unassigners = {}
+    removers = {}
+    on_delete_rules = {}
+    ignored = set(deleted)
+    ignored.update(known_deletes)
+    traversed = set()
+    pending = list(deleted)
+    while pending:
+        referred = pending.pop()
+        if referred in traversed:
+            continue
+        traversed.add(referred)
+        referred_extent_name = referred[0]
+        links = db._entity_link_oids(*referred)
+        for (e_name, f_name), other_oids in links.iteritems():
+            rule_key = (e_name, f_name, referred_extent_name)
+            on_delete = on_delete_rules.get(rule_key)
+            if on_delete is None:
+                field_class = db.extent(e_name).field_spec[f_name]
+                on_delete = on_delete_rules[rule_key] = (
+                    field_class.on_delete.get(
+                        referred_extent_name, field_class.on_delete_default))
+            referrers = [(e_name, other_oid) for other_oid in other_oids]
+            referrers = [referrer for referrer in referrers
+                         if referrer not in ignored]
             if on_delete is RESTRICT:
-                if referrer == entity:
-                    # Don't restrict when an entity refers to
-                    # itself. Instead, treat it as a CASCADE delete.
-                    field_names = cascaders.setdefault(referrer, set())
-                    field_names.add(f_name)
-                else:
-                    field_referred_set = restricters.setdefault(
-                        referrer, set())
-                    field_referred_set.add((f_name, entity))
+                for referrer in referrers:
+                    if referrer == referred:
+                        # Don't restrict when an entity refers to
+                        # itself. Instead, treat it as a CASCADE delete.
+                        cascaders.setdefault(referrer, set()).add(f_name)
+                    else:
+                        restricters.setdefault(referrer, set()).add(
+                            (f_name, referred))
             elif on_delete is CASCADE:
-                field_names = cascaders.setdefault(referrer, set())
-                field_names.add(f_name)
+                for referrer in referrers:
+                    cascaders.setdefault(referrer, set()).add(f_name)
+                    if referrer not in traversed:
+                        pending.append(referrer)
             elif on_delete is UNASSIGN:
-                field_referred_set = unassigners.setdefault(referrer, set())
-                field_referred_set.add((f_name, entity))
+                for referrer in referrers:
+                    unassigners.setdefault(referrer, set()).add(
+                        (f_name, referred))
             elif on_delete is REMOVE:
-                field_referred_set = removers.setdefault(referrer, set())
-                field_referred_set.add((f_name, entity))
+                for referrer in referrers:
+                    removers.setdefault(referrer, set()).add(
+                        (f_name, referred))
             else:
                 raise ValueError(
                     'Unrecognized on_delete value %r' % on_delete)
-            if on_delete is CASCADE:
-                find_references(db, referrer, traversed,
-                                restricters, cascaders, unassigners, removers)
+    return restricters, cascaders, unassigners, removers
+
+
+def delete_cascade(db, tx, deleted, run_hooks=False):
+    """Support function for Delete transactions.  Delete the entities
+    given as ``(extent_name, oid)`` pairs in `deleted`, along with all
+    entities that cascade from them, and apply the `on_delete` rules of
+    all other referring entities.
+
+    - `db`: The database the deletion is occuring in.
+
+    - `tx`: The executing transaction.
+
+    - `deleted`: The entities whose deletion was requested.
+
+    - `run_hooks`: If True, entities in `deleted` whose Delete
+      transactions are customized are deleted by executing them, as
+      cascaded entities always are.
+
+    Entities of other classes are deleted in batches, so references
+    between entities being deleted are neither checked nor unassigned.
+    Return a dictionary of ``extent_name: count`` items for all
+    entities deleted.
+    """
+    known_deletes = [(EntityClass.__name__, oid)
+                     for EntityClass, oid in tx._known_deletes]
+    restricters, cascaders, unassigners, removers = plan_cascade(
+        db, deleted, known_deletes)
+    # Referrers should be removed from restricters if they are
+    # also requesting cascade deletion.
+    restricter_keys = set(restricters) - set(cascaders)
+    if len(restricter_keys) != 0:
+        # Raise DeleteRestricted if there are any restricters left
+        # over.
+        error = DeleteRestricted()
+        for referrer in sorted(restricter_keys):
+            restricter_set = restricters[referrer]
+            for f_name, referred in sorted(restricter_set):
+                error.add(db._entity(*referred), db._entity(*referrer), f_name)
+        raise error
+    # Entities to delete, in a deterministic (sorted) fashion, deleting
+    # cascaded entities before those whose deletion was requested.
+    requested = set(deleted)
+    entities = [pair for pair in sorted(cascaders) if pair not in requested]
+    entities.extend(deleted)
+    doomed = set(entities)
+    # Unassign fields requested by unassigners, and remove values from
+    # fields marked as removers.  Entities with customized Update
+    # transactions are updated by nested Update transactions; others
+    # are updated directly, in one batch.
+    entity_classes = db._entity_classes
+    plain_update = {}
+    updates = []
+    for referrer in sorted(set(unassigners) | set(removers)):
+        if referrer in doomed:
+            continue
+        extent_name, oid = referrer
+        if extent_name not in plain_update:
+            plain_update[extent_name] = _has_plain_update(
+                entity_classes[extent_name])
+        unassigned = unassigners.get(referrer, ())
+        removed = removers.get(referrer, ())
+        if not plain_update[extent_name]:
+            for field_referred_set, method_name in [
+                (unassigned, '_unassign'), (removed, '_remove')]:
+                if field_referred_set:
+                    update = db._entity(*referrer).t.update()
+                    for f_name, referred in field_referred_set:
+                        field = update.f[f_name]
+                        getattr(field, method_name)(db._entity(*referred))
+                    db.execute(update)
+            continue
+        field_map = db._entity(*referrer).s.field_map(not_fget)
+        changed = {}
+        for f_name, referred in unassigned:
+            field = changed[f_name] = field_map[f_name]
+            field._unassign(db._entity(*referred))
+        for f_name, referred in removed:
+            field = changed[f_name] = field_map[f_name]
+            field._remove(db._entity(*referred))
+        fields = {}
+        related_entities = {}
+        for f_name, field in changed.iteritems():
+            field.validate(field._value)
+            fields[f_name] = field._dump()
+            related_entities[f_name] = field._entities_in_value()
+        updates.append((extent_name, oid, fields, related_entities, None))
+    if updates:
+        db._update_entities(updates)
+    # Everything checks out okay, so add the entities to the set of
+    # deleted entities.
+    deletes = tx._deletes
+    for extent_name, oid in entities:
+        deletes.add((entity_classes[extent_name], oid))
+    # Delete entities in order.  Entities with customized Delete
+    # transactions are deleted by nested Delete transactions so that
+    # their hooks run; runs of other entities are deleted in batches.
+    doomed_classes = [(entity_classes[extent_name], oid)
+                      for extent_name, oid in entities]
+    contains_oid = db._extent_contains_oid
+    counts = {}
+    batch = []
+    plain = {}
+    for extent_name, oid in entities:
+        if not run_hooks and (extent_name, oid) in requested:
+            batch.append((extent_name, oid))
+            continue
+        if extent_name not in plain:
+            plain[extent_name] = _has_plain_delete(
+                entity_classes[extent_name])
+        if plain[extent_name]:
+            batch.append((extent_name, oid))
+            continue
+        _delete_batch(db, batch, counts)
+        batch = []
+        # A nested transaction may delete an entity before we can.
+        if not contains_oid(extent_name, oid):
+            continue
+        delete = db._entity(extent_name, oid).t.delete()
+        delete._deletes.update(deletes)
+        delete._known_deletes.extend(doomed_classes)
+        db.execute(delete, strict=False)
+        counts[extent_name] = counts.get(extent_name, 0) + 1
+    _delete_batch(db, batch, counts)
+    return counts
+
+
+def _delete_batch(db, batch, counts):
+    """Delete the entities given as ``(extent_name, oid)`` pairs in
+    `batch` and add the number deleted per extent to `counts`."""
+    if batch:
+        for extent_name, count in db._delete_entities(batch).iteritems():
+            counts[extent_name] = counts.get(extent_name, 0) + count
+
+
+def _has_plain_create(EntityClass):
+    """Return True if `EntityClass` does not customize how its Create
+    transaction executes, so that entities may be created directly
+    when populating."""
+    # Imported here since schevo.entity depends on this module.
+    from schevo.entity import Entity
+    for cls in EntityClass.__mro__:
+        if 't_create' in cls.__dict__:
+            if cls.__dict__['t_create'] is not Entity.__dict__['t_create']:
+                return False
+            break
+    CreateClass = EntityClass._Create
+    if CreateClass._style != _Create_Standard:
+        return False
+    for name in ['_before_execute', '_during_execute', '_after_execute',
+                 '_execute']:
+        if getattr(CreateClass, name).im_func is not getattr(
+            Create, name).im_func:
+            return False
+    return True
+
+
+def _has_plain_update(EntityClass):
+    """Return True if `EntityClass` does not customize its Update
+    transaction, so that its instances may be updated directly when
+    applying `on_delete` rules."""
+    # Imported here since schevo.entity depends on this module.
+    from schevo.entity import Entity
+    if EntityClass.t_update.im_func is not Entity.t_update.im_func:
+        return False
+    UpdateClass = EntityClass._Update
+    for name in ['_setup', '_before_execute', '_during_execute',
+                 '_after_execute', '_execute']:
+        if getattr(UpdateClass, name).im_func is not getattr(
+            Update, name).im_func:
+            return False
+    # Change handlers are called when an Update transaction is made.
+    for name in dir(UpdateClass):
+        if name.startswith('h_'):
+            return False
+    return True
+
+
+def _has_plain_delete(EntityClass):
+    """Return True if `EntityClass` does not customize its Delete
+    transaction, so that its instances may be deleted directly when
+    cascading."""
+    # Imported here since schevo.entity depends on this module.
+    from schevo.entity import Entity
+    if EntityClass.t_delete.im_func is not Entity.t_delete.im_func:
+        return False
+    DeleteClass = EntityClass._Delete
+    for name in ['_setup', '_before_execute', '_after_execute']:
+        if getattr(DeleteClass, name).im_func is not getattr(
+            Delete, name).im_func:
+            return False
+    return True
 
 
 def resolve(db, field_name, value, FieldClass, field_names=None):
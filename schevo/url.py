@@ -6,7 +6,7 @@
 # This module is based on MIT-licensed work by the SqlAlchemy team, and is thus
 # Copyright (c) 2005-2009 Michael Bayer, ElevenCraft Inc., and contributors.
 
-import re, cgi, sys, urllib
+import re, sys
 
 
 class URL(object):
@@ -55,7 +55,8 @@ class URL(object):
         if self.username is not None:
             s += self.username
             if self.password is not None:
-                s += ':' + urllib.quote_plus(self.password)
+                from urllib import quote_plus
+                s += ':' + quote_plus(self.password)
             s += "@"
         if self.host is not None:
             s += self.host
@@ -145,7 +146,11 @@ def _parse_rfc1738_args(name):
         if components['database'] is not None:
             tokens = components['database'].split('?', 2)
             components['database'] = tokens[0]
-            query = (len(tokens) > 1 and dict(cgi.parse_qsl(tokens[1]))) or None
+            if len(tokens) > 1:
+                from cgi import parse_qsl
+                query = dict(parse_qsl(tokens[1])) or None
+            else:
+                query = None
             # Py2K
             if query is not None:
                 query = dict((k.encode('ascii'), query[k]) for k in query)
@@ -155,7 +160,8 @@ def _parse_rfc1738_args(name):
         components['query'] = query
 
         if components['password'] is not None:
-            components['password'] = urllib.unquote_plus(components['password'])
+            from urllib import unquote_plus
+            components['password'] = unquote_plus(components['password'])
 
         name = components.pop('name')
         return URL(name, **components)
@@ -167,7 +173,8 @@ def _parse_keyvalue_args(name):
     m = re.match( r'(\w+)://(.*)', name)
     if m is not None:
         (name, args) = m.group(1, 2)
-        opts = dict(cgi.parse_qsl(args))
+        from cgi import parse_qsl
+        opts = dict(parse_qsl(args))
         return URL(name, *opts)
     else:
         return None